@@ -0,0 +1,65 @@
+"""Measure what exporting notes, effective dates and tags adds to a dump.
+
+Dumps ``NUM_TASKS`` synthetic tasks in bulk, with every column, and then
+fetches on their own the columns that ``properties()`` leaves out, which a
+dump didn't use to have. The difference is what a dump cost before. Then
+extracts which tasks have which tags, as ``dump-all`` does.
+
+Each Apple Event takes ``LATENCY`` seconds, since waiting for OmniFocus is
+where most of the time goes against the real thing. Bigger answers take
+longer to send than that, so this says more about the number of events than
+about their size.
+
+Run with ``python benchmarks/bench_export.py [NUM_TASKS [LATENCY]]``.
+"""
+
+import io
+import sys
+import time
+
+from omnimetrics._database import EXTRA_TASK_COLUMNS, load_extra_columns, load_task_tags
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._script import _dump_omnifocus
+
+
+def measured(database, latency, function):
+    """How long ``function`` takes against a fresh app, and how many events it sends."""
+    omnifocus = database.appscript(latency)
+    start = time.perf_counter()
+    function(omnifocus)
+    return time.perf_counter() - start, omnifocus.event_count
+
+
+def dump(omnifocus):
+    _dump_omnifocus(io.StringIO(), bulk=True, omnifocus=omnifocus)
+
+
+def main(num_tasks=10_000, latency=0.05):
+    database = synthetic_database(num_tasks)
+    print(f"{num_tasks} tasks, {latency}s an event")
+    dump_seconds, dump_events = measured(database, latency, dump)
+    extra_seconds, extra_events = measured(
+        database, latency, lambda app: load_extra_columns(app.default_document.flattened_tasks)
+    )
+    tags_seconds, tags_events = measured(
+        database, latency, lambda app: list(load_task_tags(app.default_document))
+    )
+    before_seconds = dump_seconds - extra_seconds
+    before_events = dump_events - extra_events
+    rows = [
+        ("dump, as before", before_seconds, before_events),
+        ("dump, with extra columns", dump_seconds, dump_events),
+        ("task tags", tags_seconds, tags_events),
+        ("both", dump_seconds + tags_seconds, dump_events + tags_events),
+    ]
+    for name, seconds, events in rows:
+        print(
+            f"{name:<26} {seconds:>8.3f}s {events:>6} events "
+            f"{seconds / before_seconds:>5.2f}x as before"
+        )
+    per_task = num_tasks * len(EXTRA_TASK_COLUMNS)
+    print(f"Fetching the extra columns a task at a time would take {per_task} more events")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000, *map(float, sys.argv[2:]))
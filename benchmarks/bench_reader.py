@@ -0,0 +1,55 @@
+"""Time reading many dumps with different numbers of workers.
+
+Writes ``NUM_DUMPS`` dumps of ``NUM_TASKS`` tasks each, then reads all of
+them with ``read_dumps`` on 1, 2, 4, ... workers, up to the number of CPUs.
+
+Run with ``python benchmarks/bench_reader.py [NUM_DUMPS [NUM_TASKS]]``.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bench_serialize import synthetic_tasks
+
+from omnimetrics._formats import write_json
+from omnimetrics._reader import read_dumps
+
+
+def write_dumps(directory, num_dumps, num_tasks):
+    tasks = list(synthetic_tasks(num_tasks))
+    paths = []
+    for day in range(num_dumps):
+        taken_at = datetime(2020, 1, 1, 9) + timedelta(days=day)
+        path = Path(directory) / taken_at.strftime("omnifocus-%Y%m%d-%H%M%S.json")
+        with path.open("w") as f:
+            write_json(tasks, f)
+        paths.append(path)
+    return paths
+
+
+def main(num_dumps=32, num_tasks=20_000):
+    cpus = os.cpu_count() or 1
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= cpus:
+        worker_counts.append(worker_counts[-1] * 2)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_dumps(directory, num_dumps, num_tasks)
+        print(f"{num_dumps} dumps of {num_tasks} tasks, {cpus} CPUs")
+        single = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            rows = sum(len(columns) for columns in read_dumps(paths, workers=workers))
+            seconds = time.perf_counter() - start
+            single = single or seconds
+            print(
+                f"{workers:>3} workers: {seconds:.3f}s, {rows / seconds:,.0f} tasks/s, "
+                f"{single / seconds:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,122 @@
+"""Time ``omnimetrics report`` over a year of daily snapshots.
+
+Builds a history of ``DAYS`` snapshots of ``NUM_TASKS`` tasks each in memory,
+where every day some tasks are added and some completed, and times computing
+the daily and weekly series from it. Then writes ``LOAD_DAYS`` real dumps and
+times loading them with ``load_history``, end to end.
+
+By default that's a year of dumps, which takes about 19GB of disk for 50k
+tasks, and about ten minutes to write. Loading them takes well over the
+seconds that computing the series does: about 0.16s a dump, or a minute for
+the year, on one core. Nearly all of that is reading each dump's text and looking up
+each of its lines, so it doesn't get much faster without reading less.
+
+Run with ``python benchmarks/bench_report.py [NUM_TASKS [DAYS [LOAD_DAYS]]]``.
+"""
+
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from bench_serialize import synthetic_tasks
+
+from omnimetrics._backfill import Dump
+from omnimetrics._formats import write_json
+from omnimetrics._report import (
+    SnapshotHistory,
+    Versions,
+    daily_throughput,
+    load_history,
+    weekly_throughput,
+)
+from omnimetrics._table import NO_INTEGER
+
+# How many tasks are added, and completed, each day.
+CHURN = 150
+
+
+def synthetic_history(num_tasks, days):
+    """A history where each day's snapshot is a window of ``num_tasks`` tasks.
+
+    Each task has two versions: open, and then completed.
+    """
+    rng = np.random.default_rng(0)
+    total = num_tasks + days * CHURN
+    start = np.datetime64("2020-01-01", "us")
+    day = np.timedelta64(1, "D")
+    created_day = np.arange(total) // CHURN - num_tasks // CHURN
+    done_day = created_day + rng.integers(1, num_tasks // CHURN, total)
+    created = start + created_day * day
+    completed = start + done_day * day
+    versions = Versions(
+        task=np.repeat(np.arange(total), 2),
+        created=np.repeat(created, 2),
+        completed=np.stack([np.full(total, np.datetime64("NaT", "us")), completed], 1).ravel(),
+        dropped=np.full(2 * total, np.datetime64("NaT", "us")),
+        estimated_minutes=np.where(np.arange(2 * total) % 3, 30, NO_INTEGER),
+        open=np.tile([True, False], total),
+    )
+    rows = []
+    for d in range(days):
+        window = np.arange(d * CHURN, d * CHURN + num_tasks)
+        rows.append(2 * window + (done_day[window] <= d))
+    return SnapshotHistory(
+        days=np.datetime64("2020-01-01", "D") + np.arange(days),
+        offsets=np.arange(days + 1, dtype=np.int64) * num_tasks,
+        rows=np.concatenate(rows),
+        versions=versions,
+    )
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def write_dumps(directory, num_tasks, days):
+    """Write a dump a day of ``num_tasks`` tasks.
+
+    Each day, ``CHURN`` tasks are completed, and then left out of the next
+    day's dump to make room for as many new ones.
+    """
+    tasks = list(synthetic_tasks(num_tasks + days * CHURN))
+    dumps = []
+    for d in range(days):
+        first = d * CHURN
+        last = first + num_tasks
+        for i in range(first, first + CHURN):
+            tasks[i] = replace(tasks[i], is_effectively_completed=True)
+        path = Path(directory) / f"{d}.json"
+        with path.open("w") as f:
+            write_json(tasks[first:last], f)
+        dumps.append(Dump(date(2020, 1, 1) + timedelta(days=d), path))
+    return dumps
+
+
+def main(num_tasks=50_000, days=365, load_days=365):
+    history = synthetic_history(num_tasks, days)
+    print(f"{days} snapshots of {num_tasks} tasks, {len(history.rows)} rows")
+    total = 0.0
+    seconds, daily = timed(daily_throughput, history)
+    total += seconds
+    print(f"daily_throughput:  {seconds:.3f}s")
+    seconds, _ = timed(weekly_throughput, daily)
+    total += seconds
+    print(f"weekly_throughput: {seconds:.3f}s")
+    print(f"total:             {total:.3f}s")
+    with tempfile.TemporaryDirectory() as directory:
+        dumps = write_dumps(directory, num_tasks, load_days)
+        seconds, _ = timed(load_history, dumps)
+    print(
+        f"load_history:      {seconds:.3f}s for {load_days} dumps, "
+        f"{seconds / load_days:.3f}s a dump"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
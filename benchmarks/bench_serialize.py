@@ -0,0 +1,95 @@
+"""Compare the compiled JSON serialiser with ``asdict`` and ``json.dumps``.
+
+Run with ``python benchmarks/bench_serialize.py [NUM_TASKS]``.
+"""
+
+import io
+import json
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime, timedelta
+
+from omnimetrics._database import ProjectReference, TagReference, Task, TaskReference
+from omnimetrics._formats import write_json
+
+
+def synthetic_tasks(num_tasks):
+    start = datetime(2020, 1, 1)
+    projects = [ProjectReference(name=f"Project {i}") for i in range(100)]
+    tags = [TagReference(name=f"Tag {i}") for i in range(20)]
+    for i in range(num_tasks):
+        created = start + timedelta(minutes=i)
+        yield Task(
+            id=f"task-{i}",
+            name=f"Task number {i}",
+            creation_date=created,
+            modification_date=created + timedelta(days=1),
+            due_date=created + timedelta(days=7) if i % 3 == 0 else None,
+            effective_due_date=created + timedelta(days=7) if i % 3 == 0 else None,
+            next_due_date=None,
+            defer_date=created + timedelta(days=2) if i % 5 == 0 else None,
+            effective_defer_date=created + timedelta(days=2) if i % 5 == 0 else None,
+            next_defer_date=None,
+            dropped_date=None,
+            completion_date=created + timedelta(days=3) if i % 2 == 0 else None,
+            primary_tag=tags[i % len(tags)] if i % 4 else None,
+            parent_task=TaskReference(id=f"task-{i // 10}", name=f"Task number {i // 10}"),
+            estimated_minutes=(i % 12) * 5 or None,
+            containing_project=projects[i % len(projects)],
+            is_next=i % 7 == 0,
+            num_available_tasks=0,
+            num_completed_tasks=0,
+            num_tasks=0,
+            is_in_inbox=False,
+            is_sequential=False,
+            is_flagged=i % 11 == 0,
+            is_completed=i % 2 == 0,
+            is_dropped=False,
+            is_blocked=False,
+            is_completed_by_children=False,
+            is_effectively_dropped=False,
+            is_effectively_completed=i % 2 == 0,
+            should_use_floating_timezone=True,
+            note=f"Notes on task number {i}" if i % 4 == 0 else "",
+            has_children=False,
+            is_effectively_flagged=i % 11 == 0,
+            effective_completion_date=created + timedelta(days=3) if i % 2 == 0 else None,
+            effective_dropped_date=None,
+        )
+
+
+def jsonify(o):
+    if isinstance(o, datetime):
+        return o.isoformat()
+    return o
+
+
+def write_json_with_asdict(tasks, output):
+    """How tasks were serialised before ``write_json``."""
+    for task in tasks:
+        task_dict = asdict(task)
+        output.write(json.dumps(task_dict, default=jsonify))
+        output.write("\n")
+
+
+def timed(write, tasks):
+    output = io.StringIO()
+    start = time.perf_counter()
+    write(tasks, output)
+    return time.perf_counter() - start, output.getvalue()
+
+
+def main(num_tasks=100_000):
+    tasks = list(synthetic_tasks(num_tasks))
+    before, expected = timed(write_json_with_asdict, tasks)
+    after, actual = timed(write_json, tasks)
+    assert actual == expected, "Serialisers disagree"
+    print(f"{num_tasks} tasks")
+    print(f"asdict + json.dumps: {before:.3f}s")
+    print(f"compiled serialiser: {after:.3f}s")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
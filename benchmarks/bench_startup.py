@@ -0,0 +1,74 @@
+"""Check that the command-line tools start quickly.
+
+Runs each command that doesn't need Google Cloud with ``--help`` in a fresh
+interpreter, and fails if it takes longer than the budget on top of starting
+Python, or if it imports anything only the cloud commands need.
+
+Run with ``python benchmarks/bench_startup.py [BUDGET_SECONDS]``.
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+# Entry points, and the arguments to run them with.
+COMMANDS = [
+    ("omnimetrics._script:omnimetrics", ["--help"]),
+    ("omnimetrics._script:omnimetrics", ["dump-file", "--help"]),
+    ("omnimetrics._script:omnimetrics", ["dump", "--help"]),
+    ("omnimetrics._script:omnimetrics", ["query", "--help"]),
+    ("omnimetrics._script:omnimetrics", ["history", "--help"]),
+    ("omnimetrics._script:omnimetrics", ["serve", "--help"]),
+    ("omnimetrics._viewit:main", ["--help"]),
+]
+
+# Modules that take a long time to import, and that only some commands need.
+HEAVY_MODULES = ["google.cloud.bigquery", "google.cloud.storage", "pyarrow", "fastavro"]
+
+RUNS = 5
+
+SCRIPT = """
+import importlib, sys
+module, name = sys.argv[1].split(":")
+command = getattr(importlib.import_module(module), name)
+try:
+    command(sys.argv[2:])
+except SystemExit:
+    pass
+heavy = [m for m in {heavy!r} if m in sys.modules]
+if heavy:
+    sys.exit("Imported " + ", ".join(heavy))
+"""
+
+
+def timed(args):
+    start = time.perf_counter()
+    result = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed: {result.stderr.strip()}")
+    return seconds
+
+
+def median_time(args):
+    return statistics.median(timed(args) for _ in range(RUNS))
+
+
+def main(budget=0.3):
+    baseline = median_time([sys.executable, "-c", "pass"])
+    print(f"{'python -c pass':<50} {baseline:.3f}s")
+    script = SCRIPT.format(heavy=HEAVY_MODULES)
+    over = []
+    for entry_point, args in COMMANDS:
+        seconds = median_time([sys.executable, "-c", script, entry_point, *args]) - baseline
+        name = f"{entry_point} {' '.join(args)}"
+        print(f"{name:<50} +{seconds:.3f}s")
+        if seconds > budget:
+            over.append(name)
+    if over:
+        sys.exit(f"Over the budget of {budget:.3f}s: {', '.join(over)}")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,35 @@
+"""Compare the memory used by a list of tasks and by a ``TaskTable``.
+
+Run with ``python benchmarks/bench_table.py [NUM_TASKS]``.
+"""
+
+import sys
+import tracemalloc
+from dataclasses import asdict
+
+from bench_serialize import synthetic_tasks
+
+from omnimetrics._table import TaskTable
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, used
+
+
+def main(num_tasks=100_000):
+    _, dicts = measure(lambda: [asdict(task) for task in synthetic_tasks(num_tasks)])
+    _, tasks = measure(lambda: list(synthetic_tasks(num_tasks)))
+    table, table_bytes = measure(lambda: TaskTable.from_tasks(synthetic_tasks(num_tasks)))
+    print(f"{num_tasks} tasks, bytes per task")
+    print(f"dicts:          {dicts / num_tasks:.0f}")
+    print(f"slotted Tasks:  {tasks / num_tasks:.0f}")
+    print(f"TaskTable:      {table_bytes / num_tasks:.0f}")
+    print(f"  (of which columns: {table.nbytes / num_tasks:.0f})")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
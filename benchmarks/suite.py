@@ -0,0 +1,162 @@
+"""Benchmark omnimetrics against synthetic OmniFocus databases.
+
+Runs without OmniFocus, using the fake backends in ``omnimetrics._fakeapp``.
+Each benchmark is timed, and the number of Apple Events it would have sent is
+counted. With ``--latency``, each event also takes that long, which is how
+most of the time is spent against the real thing.
+
+Run with e.g.::
+
+    python benchmarks/suite.py --sizes 1000,10000 --output results.json
+    python benchmarks/suite.py --baseline results.json
+
+Results are written as JSON so that later runs can be compared with them.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+from omnimetrics import _viewit
+from omnimetrics._database import load_task_tags, load_tasks, load_tasks_bulk
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._script import _dump_omnifocus
+
+
+def bench_load_tasks(database, latency):
+    omnifocus = database.appscript(latency)
+    for _ in load_tasks(omnifocus.default_document):
+        pass
+    return omnifocus
+
+
+def bench_load_tasks_bulk(database, latency):
+    omnifocus = database.appscript(latency)
+    for _ in load_tasks_bulk(omnifocus.default_document):
+        pass
+    return omnifocus
+
+
+def bench_load_task_tags(database, latency):
+    omnifocus = database.appscript(latency)
+    for _ in load_task_tags(omnifocus.default_document):
+        pass
+    return omnifocus
+
+
+def bench_dump_omnifocus(database, latency):
+    omnifocus = database.appscript(latency)
+    _dump_omnifocus(io.StringIO(), omnifocus=omnifocus)
+    return omnifocus
+
+
+def _items_in_view(app):
+    content = app.documents()[0].documentWindows()[0].content()
+    return [leaf.value() for leaf in content.leaves()]
+
+
+def bench_report_estimates(database, latency):
+    omnifocus = database.appscript(latency)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _viewit.reportEstimates(item for item in _viewit.tasksInView(omnifocus) if not item.blocked)
+    return omnifocus
+
+
+def bench_qualified_name(database, latency):
+    app = database.scripting_bridge(latency)
+    for item in _items_in_view(app):
+        _viewit.qualifiedName(item)
+    return app
+
+
+BENCHMARKS = {
+    "load_tasks": bench_load_tasks,
+    "load_tasks_bulk": bench_load_tasks_bulk,
+    "load_task_tags": bench_load_task_tags,
+    "dump_omnifocus": bench_dump_omnifocus,
+    "viewit.reportEstimates": bench_report_estimates,
+    "viewit.qualifiedName": bench_qualified_name,
+}
+
+
+def run(sizes, latency, names, max_depth, num_tags, tag_skew):
+    results = []
+    for size in sizes:
+        database = synthetic_database(
+            size, max_depth=max_depth, num_tags=num_tags, tag_skew=tag_skew
+        )
+        for name in names:
+            start = time.perf_counter()
+            app = BENCHMARKS[name](database, latency)
+            seconds = time.perf_counter() - start
+            result = {
+                "benchmark": name,
+                "tasks": size,
+                "seconds": seconds,
+                "events": app.event_count,
+            }
+            print(f"{name:<24} {size:>7} tasks {seconds:>9.3f}s {app.event_count:>9} events")
+            results.append(result)
+    return results
+
+
+def compare(results, baseline):
+    previous = {(r["benchmark"], r["tasks"]): r for r in baseline["results"]}
+    print()
+    print("Compared with baseline from", baseline["timestamp"])
+    for result in results:
+        before = previous.get((result["benchmark"], result["tasks"]))
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        events = result["events"] - before["events"]
+        print(
+            f"{result['benchmark']:<24} {result['tasks']:>7} tasks "
+            f"{ratio:>6.2f}x time {events:>+9} events"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per Apple Event")
+    parser.add_argument("--max-depth", type=int, default=3)
+    parser.add_argument("--num-tags", type=int, default=50)
+    parser.add_argument("--tag-skew", type=float, default=1.0)
+    parser.add_argument("--benchmark", action="append", choices=sorted(BENCHMARKS))
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results in this JSON file")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(
+        sizes,
+        args.latency,
+        args.benchmark or list(BENCHMARKS),
+        args.max_depth,
+        args.num_tags,
+        args.tag_skew,
+    )
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "latency": args.latency,
+        "max_depth": args.max_depth,
+        "num_tags": args.num_tags,
+        "tag_skew": args.tag_skew,
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
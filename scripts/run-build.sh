@@ -2,8 +2,8 @@
 
 set -e -u -x
 
-black --check src tests setup.py
-isort -rc --check src tests setup.py
-flake8 src tests setup.py
+black --check src tests benchmarks setup.py
+isort -rc --check src tests benchmarks setup.py
+flake8 src tests benchmarks setup.py
 coverage run --branch -m pytest tests/
 pipenv run coverage report --show-missing --fail-under=100
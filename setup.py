@@ -33,6 +33,7 @@ setuptools.setup(
     description="Tools for exploring OmniFocus 3 data",
     zip_safe=False,
     install_requires=["appscript", "click", "google-cloud-bigquery", "google-cloud-storage", "pyobjc"],
+    extras_require={"analysis": ["numpy"], "avro": ["fastavro"], "parquet": ["pyarrow"]},
     python_requires=">=3.8",
     classifiers=[
         "Operating System :: MacOS :: MacOS X",
@@ -1,5 +1,44 @@
-from ._procrastinatron import attempt, tasksInView
+from datetime import datetime
+from pathlib import Path
 
+import click
 
-def procrastinatron():
-    print(attempt(next(tasksInView())))
+from ._procrastinatron import AttemptLog, Scheduler, attempt, parseYesNo
+from ._source import connect_source, source_options
+
+# Where procrastinatron logs attempts and excuses, unless told otherwise.
+DEFAULT_LOG = Path.home() / ".procrastinatron" / "attempts.jsonl"
+
+
+@click.command()
+@source_options
+@click.option(
+    "--log",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=str(DEFAULT_LOG),
+    envvar="PROCRASTINATRON_LOG",
+    show_default=True,
+    help="Where to log attempts and excuses.",
+)
+def procrastinatron(daemon, source, dump, log):  # pragma: no cover
+    """Offer up available tasks one at a time, recording excuses."""
+    poll = connect_source(daemon, source, dump).availability
+    with AttemptLog(Path(log)) as attemptLog:
+        _loop(poll, Scheduler(), attemptLog)
+
+
+def _loop(poll, scheduler, log):  # pragma: no cover
+    while True:
+        availabilities, hierarchy = poll(datetime.now())
+        scheduler.update(availabilities)
+        task = scheduler.nextTask()
+        if task is None:
+            if not scheduler.hasDeferred():
+                break
+            if not parseYesNo(input("That's everything. Another round? (y/n) ")):
+                break
+            scheduler.startNextRound()
+            continue
+        outcome = attempt(task.task, hierarchy, log)
+        scheduler.record(outcome)
+        print(outcome)
@@ -0,0 +1,259 @@
+"""Load months of local dumps into BigQuery with as few jobs as possible.
+
+``run-pipeline`` loads each day's dump into its own partition with its own
+load job. Doing that for every day of a backfill takes hundreds of jobs, and
+runs into BigQuery's quotas. Instead, a backfill:
+
+1. stages the latest dump of each day under one GCS prefix, gzipped, with a
+   ``snapshot_date`` added to each row;
+2. loads all of them into a staging table with one load job;
+3. replaces the destination table's partitions for those days with the rows
+   from the staging table, with one query job.
+
+A job can only load so many files, so really it's one load job and one query
+job per ``max_files_per_job`` days.
+
+A local manifest records which days have been loaded into which tables, so
+that running a backfill again only loads new days.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timezone
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List
+
+from omnimetrics._formats import (
+    DUMP_NAME,
+    TASK_SCHEMA,
+    Field,
+    bigquery_schema,
+    compile_json_serializer,
+    deserialize_task,
+)
+from omnimetrics._upload import upload_compressed
+
+# The most source URIs a BigQuery load job can have.
+MAX_FILES_PER_JOB = 10_000
+
+SNAPSHOT_DATE = Field(name="snapshot_date", type="DATE", nullable=False)
+
+
+@dataclass(frozen=True)
+class Dump:
+    """A dump of a day's tasks."""
+
+    day: date
+    path: Path
+
+    @property
+    def partition(self) -> str:
+        return self.day.strftime("%Y%m%d")
+
+
+def find_dumps(directory: Path) -> List[Dump]:
+    """Find the latest JSON dump of each day in ``directory``, oldest first.
+
+    Raises ``ValueError`` if any of them is a change log, since partitions
+    of change logs can't be rebuilt from one another.
+    """
+    latest: Dict[date, datetime] = {}
+    paths: Dict[date, Path] = {}
+    for path in directory.glob("omnifocus-*.json"):
+        try:
+            # Only dumps of tasks, with the default name.
+            taken_at = datetime.strptime(path.name, DUMP_NAME)
+        except ValueError:
+            continue
+        day = taken_at.date()
+        if day not in latest or taken_at > latest[day]:
+            latest[day] = taken_at
+            paths[day] = path
+    dumps = [Dump(day, paths[day]) for day in sorted(paths)]
+    for dump in dumps:
+        if _is_change_log(dump.path):
+            raise ValueError(f"{dump.path} is a change log, not a snapshot")
+    return dumps
+
+
+def _is_change_log(path: Path) -> bool:
+    with path.open() as f:
+        first = f.readline()
+    return bool(first) and "deleted" in json.loads(first)
+
+
+class Manifest:
+    """Which days have been loaded into which tables."""
+
+    def __init__(self, loaded: Dict[str, Dict[str, Dict[str, str]]]) -> None:
+        self._loaded = loaded
+
+    @classmethod
+    def load(cls, path: Path) -> Manifest:
+        """Load the manifest at ``path``, or an empty one if there isn't one."""
+        try:
+            with path.open() as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls({})
+
+    def save(self, path: Path) -> None:
+        """Save the manifest to ``path``, replacing whatever was there."""
+        temp_path = path.with_name(path.name + ".tmp")
+        with temp_path.open("w") as f:
+            json.dump(self._loaded, f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+    def is_loaded(self, table: str, dump: Dump) -> bool:
+        return dump.partition in self._loaded.get(table, {})
+
+    def record(self, table: str, dumps: List[Dump], loaded_at: datetime) -> None:
+        partitions = self._loaded.setdefault(table, {})
+        for dump in dumps:
+            partitions[dump.partition] = {
+                "dump": dump.path.name,
+                "loaded_at": loaded_at.isoformat(),
+            }
+
+
+def pending(dumps: List[Dump], manifest: Manifest, table: str) -> List[Dump]:
+    """The dumps that haven't been loaded into ``table`` yet."""
+    return [dump for dump in dumps if not manifest.is_loaded(table, dump)]
+
+
+def backfill(
+    dumps: List[Dump],
+    storage_client: Any,
+    bigquery_client: Any,
+    gcs_bucket: str,
+    gcs_prefix: str,
+    destination_table: str,
+    manifest: Manifest,
+    manifest_path: Path,
+    max_files_per_job: int = MAX_FILES_PER_JOB,
+    echo: Callable[[str], None] = print,
+) -> List[List[Dump]]:
+    """Load every dump in ``dumps`` that isn't in ``manifest`` into its partition.
+
+    ``destination_table`` is ingestion-time partitioned, as for
+    ``run-pipeline``. Columns added to ``Task`` since it was created are
+    added to it first. The manifest is saved after each batch is loaded.
+    The staging table and staged dumps are deleted afterwards, whether or not
+    every batch was loaded.
+
+    Returns the batches that were loaded, each of which took one load job and
+    one query job.
+    """
+    from google.cloud import bigquery
+
+    todo = pending(dumps, manifest, destination_table)
+    batches = []
+    for start in range(0, len(todo), max_files_per_job):
+        end = start + max_files_per_job
+        batches.append(todo[start:end])
+    run = datetime.now().strftime("backfill-%Y%m%d-%H%M%S")
+    bucket = storage_client.bucket(gcs_bucket)
+    staging_table = f"{destination_table}_backfill_staging"
+    if not batches:
+        return batches
+    add_missing_columns(bigquery_client, destination_table)
+    staged = []
+    try:
+        for number, batch in enumerate(batches):
+            uris = []
+            for dump in batch:
+                gcs_path = str(Path(gcs_prefix) / run / f"{number}" / f"{dump.partition}.json.gz")
+                blob = bucket.blob(gcs_path)
+                _, stats = upload_compressed(blob, _stager(dump))
+                staged.append(blob)
+                echo(f"{dump.path.name}: {stats.summary()}")
+                uris.append(f"gs://{gcs_bucket}/{gcs_path}")
+            echo(f"Loading {len(batch)} days into {staging_table}")
+            bigquery_client.load_table_from_uri(
+                uris,
+                staging_table,
+                job_config=bigquery.LoadJobConfig(
+                    schema=bigquery_schema(TASK_SCHEMA + (SNAPSHOT_DATE,)),
+                    source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                    write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+                ),
+            ).result()
+            echo(f"Replacing {len(batch)} partitions of {destination_table}")
+            bigquery_client.query(
+                replace_partitions_sql(staging_table, destination_table),
+                job_config=bigquery.QueryJobConfig(
+                    query_parameters=[
+                        bigquery.ArrayQueryParameter(
+                            "partitions",
+                            "TIMESTAMP",
+                            [datetime.combine(dump.day, time(), timezone.utc) for dump in batch],
+                        )
+                    ]
+                ),
+            ).result()
+            manifest.record(destination_table, batch, datetime.now())
+            manifest.save(manifest_path)
+    finally:
+        # Everything staged is either in the destination table by now, or
+        # will be staged again by the next backfill.
+        echo(f"Deleting {staging_table} and {len(staged)} staged dumps")
+        bigquery_client.delete_table(staging_table, not_found_ok=True)
+        for blob in staged:
+            blob.delete()
+    return batches
+
+
+def add_missing_columns(bigquery_client: Any, table_name: str) -> None:
+    """Add the columns of ``Task`` that the table ``table_name`` doesn't have.
+
+    e.g. for a table that ``run-pipeline`` created, by detecting the schema
+    of dumps taken before those fields existed. They're all nullable, so
+    older rows just have nulls in them.
+    """
+    table = bigquery_client.get_table(table_name)
+    existing = {field.name for field in table.schema}
+    missing = [
+        field
+        for field in bigquery_schema(TASK_SCHEMA, all_nullable=True)
+        if field.name not in existing
+    ]
+    if missing:
+        table.schema = [*table.schema, *missing]
+        bigquery_client.update_table(table, ["schema"])
+
+
+def replace_partitions_sql(staging_table: str, destination_table: str) -> str:
+    """SQL that replaces the partitions in ``@partitions`` with rows from staging.
+
+    Each statement in a BigQuery script commits on its own, so deleting and
+    inserting happen in one transaction. If inserting fails, the old
+    partitions are still there.
+    """
+    columns = ", ".join(f"`{field.name}`" for field in TASK_SCHEMA)
+    return (
+        "BEGIN TRANSACTION;\n"
+        f"DELETE FROM `{destination_table}` WHERE _PARTITIONTIME IN UNNEST(@partitions);\n"
+        f"INSERT INTO `{destination_table}` (_PARTITIONTIME, {columns})\n"
+        f"SELECT TIMESTAMP(snapshot_date), {columns} FROM `{staging_table}`;\n"
+        "COMMIT TRANSACTION;\n"
+    )
+
+
+def _stager(dump: Dump) -> Callable[[IO[str]], None]:
+    """Copy ``dump`` to an output, adding its snapshot date to each row.
+
+    Rows from before ``Task`` gained fields get nulls for them, so every
+    staged row has the same fields.
+    """
+    serialize = compile_json_serializer(TASK_SCHEMA, {SNAPSHOT_DATE.name: dump.day.isoformat()})
+
+    def stage(output: IO[str]) -> None:
+        with dump.path.open() as f:
+            for line in f:
+                if line.strip():
+                    output.write(serialize(deserialize_task(json.loads(line))))
+                    output.write("\n")
+
+    return stage
@@ -0,0 +1,373 @@
+"""Keep a snapshot of OmniFocus warm, and answer questions about it over a socket.
+
+Every run of ``viewit``, ``procrastinatron`` or ``omnimetrics`` starts a new
+interpreter, connects to OmniFocus, and reads everything from scratch. The
+daemon does that once, and then keeps its snapshot up to date by reading only
+what has changed, every so often. Clients ask it questions over a Unix domain
+socket instead.
+
+The protocol is one request per connection. The client sends a JSON object
+on one line, e.g. ``{"command": "next-task", "exclude": ["abc"]}``. The
+daemon replies with a JSON object on one line: either ``{"ok": true,
+"result": ...}`` or ``{"ok": false, "error": "..."}``. For ``dump``, the
+result is followed by the tasks, as newline-delimited JSON.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from omnimetrics._database import Task, load_tasks_bulk
+from omnimetrics._formats import dump_taken_at, serialize_task
+from omnimetrics._hierarchy import Hierarchy, is_available_at
+from omnimetrics._incremental import Watermark, load_changes
+from omnimetrics._procrastinatron import Availability
+from omnimetrics._source import NameIndex, load_dump
+from omnimetrics._viewit import ViewItem, viewItems, visibleTaskIds
+
+# Where the daemon listens, unless told otherwise.
+DEFAULT_SOCKET = Path.home() / ".omnimetrics" / "omnimetrics.sock"
+
+
+def socket_path() -> Path:
+    """Where to find the daemon: ``$OMNIMETRICS_SOCKET``, or ``DEFAULT_SOCKET``."""
+    return Path(os.environ.get("OMNIMETRICS_SOCKET", DEFAULT_SOCKET))
+
+
+class Snapshot:
+    """Every task, as of some time, indexed for answering questions."""
+
+    def __init__(self, tasks: Iterable[Task], taken_at: datetime) -> None:
+        # In database order, as far as we know it.
+        self.tasks: Dict[str, Task] = {task.id: task for task in tasks}
+        self.taken_at = taken_at
+        self.hierarchy = Hierarchy(self.tasks.values())
+
+
+class LiveBackend:
+    """Reads everything from OmniFocus once, and after that only what has changed.
+
+    Refreshing costs a handful of Apple Events to find out what has changed,
+    and then one per changed task.
+
+    What's in view changes whenever the user clicks on something, so we ask
+    OmniFocus every time, in two Apple Events.
+    """
+
+    def __init__(self, omnifocus: Any) -> None:
+        self._omnifocus = omnifocus
+        self._watermark: Optional[Watermark] = None
+
+    def load(self) -> Snapshot:
+        document = self._omnifocus.default_document
+        now = datetime.now()
+        tasks = list(load_tasks_bulk(document))
+        self._watermark = Watermark(
+            modification_date=max((task.modification_date for task in tasks), default=None),
+            ids=frozenset(task.id for task in tasks),
+        )
+        return Snapshot(tasks, now)
+
+    def refresh(self, snapshot: Snapshot) -> Snapshot:
+        if self._watermark is None:
+            return self.load()
+        document = self._omnifocus.default_document
+        now = datetime.now()
+        changes = load_changes(document, self._watermark)
+        tasks = dict(snapshot.tasks)
+        for task in changes.upserts:
+            tasks[task.id] = task
+        for task_id in changes.deleted:
+            del tasks[task_id]
+        self._watermark = changes.watermark
+        return Snapshot(tasks.values(), now)
+
+    def visible(self) -> Optional[List[str]]:
+        """The ids of the tasks in view, right now."""
+        return visibleTaskIds(self._omnifocus.default_document)
+
+
+class SnapshotFileBackend:
+    """Reads tasks from a dump, and again whenever the dump changes.
+
+    We can't tell what's in view from a dump, so the tasks that are available
+    count as being in view.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._stat: Optional[Tuple[int, int]] = None
+
+    def load(self) -> Snapshot:
+        stat = self._path.stat()
+        tasks = load_dump(self._path)
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        return Snapshot(tasks, dump_taken_at(self._path))
+
+    def refresh(self, snapshot: Snapshot) -> Snapshot:
+        stat = self._path.stat()
+        if (stat.st_mtime_ns, stat.st_size) == self._stat:
+            return snapshot
+        return self.load()
+
+    def visible(self) -> Optional[List[str]]:
+        return None
+
+
+class DaemonError(Exception):
+    """The daemon couldn't answer a request."""
+
+
+class Daemon:
+    """Answers requests about the latest snapshot from ``backend``."""
+
+    def __init__(self, backend: Any) -> None:
+        self._backend = backend
+        # Requests are answered on threads of their own, but the backend
+        # might be talking to OmniFocus, which can only do one thing at once.
+        self._backend_lock = threading.Lock()
+        self.snapshot: Snapshot = backend.load()
+        self._commands: Dict[str, Callable[..., Any]] = {
+            "status": self.status,
+            "next-task": self.next_task,
+            "availability": self.availability,
+            "view": self.view,
+            "refresh": self.refresh,
+        }
+
+    def refresh(self) -> Dict[str, Any]:
+        """Bring the snapshot up to date."""
+        with self._backend_lock:
+            self.snapshot = self._backend.refresh(self.snapshot)
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {"taken_at": snapshot.taken_at.isoformat(), "tasks": len(snapshot.tasks)}
+
+    def next_task(self, exclude: Iterable[str] = (), now: Optional[str] = None) -> Any:
+        """The first available task that isn't in ``exclude``, if there is one."""
+        snapshot = self.snapshot
+        when = _parse_now(now)
+        excluded = set(exclude)
+        for task in snapshot.tasks.values():
+            if task.id not in excluded and is_available_at(task, when):
+                return {"id": task.id, "name": snapshot.hierarchy.qualified_name(task.id)}
+        return None
+
+    def availability(self, now: Optional[str] = None) -> List[List[Any]]:
+        """What ``pollAvailability`` would say, along with each task's qualified name."""
+        snapshot = self.snapshot
+        when = _parse_now(now)
+        return [
+            [
+                task.id,
+                task.modification_date.isoformat(),
+                is_available_at(task, when),
+                snapshot.hierarchy.qualified_name(task.id),
+            ]
+            for task in snapshot.tasks.values()
+        ]
+
+    def view(self) -> List[List[Any]]:
+        """The tasks in view, as ``ViewItem`` fields.
+
+        Asks the backend what's in view, but describes those tasks using the
+        snapshot.
+        """
+        snapshot = self.snapshot
+        with self._backend_lock:
+            visible = self._backend.visible()
+        if visible is None:
+            now = datetime.now()
+            visible = [task.id for task in snapshot.tasks.values() if is_available_at(task, now)]
+        return [
+            [item.name, item.estimatedMinutes, item.blocked]
+            for item in viewItems(visible, snapshot.hierarchy)
+        ]
+
+    def handle(self, request: Dict[str, Any]) -> Iterator[str]:
+        """Answer ``request``, as lines of JSON."""
+        command = request.pop("command", None)
+        if command == "dump":
+            snapshot = self.snapshot
+            yield json.dumps({"ok": True, "result": {"tasks": len(snapshot.tasks)}})
+            for task in snapshot.tasks.values():
+                yield serialize_task(task)
+            return
+        if command not in self._commands:
+            yield json.dumps({"ok": False, "error": f"Unknown command: {command!r}"})
+            return
+        try:
+            result = self._commands[command](**request)
+        except (TypeError, ValueError) as e:
+            yield json.dumps({"ok": False, "error": f"Bad request: {e}"})
+            return
+        yield json.dumps({"ok": True, "result": result})
+
+    def serve(self, path: Path, refresh_interval: float = 60.0) -> Server:
+        """Start listening on ``path``, refreshing every ``refresh_interval`` seconds.
+
+        Returns the server, which is already serving on a thread of its own.
+        Stop it with ``shutdown``.
+        """
+        return Server(self, path, refresh_interval)
+
+
+class Server:
+    """Serves a ``Daemon`` on a Unix domain socket."""
+
+    def __init__(self, daemon: Daemon, path: Path, refresh_interval: float) -> None:
+        self.path = path
+        self.daemon = daemon
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            if _is_listening(path):
+                raise DaemonError(f"Already serving on {path}")
+            # Left behind by a daemon that didn't shut down cleanly.
+            path.unlink()
+        self._server = socketserver.ThreadingUnixStreamServer(str(path), _handler(daemon))
+        self._server.daemon_threads = True
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, daemon=True),
+            threading.Thread(target=self._refresh, args=(refresh_interval,), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _refresh(self, interval: float) -> None:
+        while not self._stopping.wait(interval):
+            try:
+                self.daemon.refresh()
+            except Exception:
+                # Keep serving the last good snapshot, and try again next time.
+                traceback.print_exc()
+
+    def wait(self) -> None:
+        """Block until the server is shut down."""
+        for thread in self._threads:
+            thread.join()
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.path.exists():
+            self.path.unlink()
+
+
+def _handler(daemon: Daemon) -> type:
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            line = self.rfile.readline()
+            if not line:
+                # Someone checking whether we're listening.
+                return
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+            except ValueError as e:
+                lines: Iterable[str] = [json.dumps({"ok": False, "error": f"Bad request: {e}"})]
+            else:
+                lines = daemon.handle(request)
+            try:
+                for response in lines:
+                    self.wfile.write(response.encode("utf-8"))
+                    self.wfile.write(b"\n")
+            except BrokenPipeError:
+                pass
+
+    return Handler
+
+
+def _parse_now(now: Optional[str]) -> datetime:
+    return datetime.now() if now is None else datetime.fromisoformat(now)
+
+
+def _is_listening(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+    return True
+
+
+class Client:
+    """Asks the daemon listening on ``path`` questions."""
+
+    def __init__(self, path: Path, timeout: float = 5.0) -> None:
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, command: str, **parameters: Any) -> Any:
+        """Send a request, and return its result.
+
+        Raises ``DaemonError`` if the daemon can't answer it.
+        """
+        with self._connect(command, parameters) as response:
+            return _result(response)
+
+    def status(self) -> Dict[str, Any]:
+        return self.request("status")
+
+    def availability(self, now: datetime) -> Tuple[List[Availability], NameIndex]:
+        """What's available at ``now``, and the names of all the tasks."""
+        rows = self.request("availability", now=now.isoformat())
+        availabilities = [
+            Availability(taskId, datetime.fromisoformat(modified), available)
+            for taskId, modified, available, _ in rows
+        ]
+        return availabilities, NameIndex({row[0]: row[3] for row in rows})
+
+    def view(self) -> List[ViewItem]:
+        return [ViewItem(*fields) for fields in self.request("view")]
+
+    def dump(self, output: IO[str]) -> int:
+        """Write the daemon's snapshot to ``output``, and return how many tasks there were."""
+        with self._connect("dump", {}) as response:
+            result = _result(response)
+            for line in response:
+                output.write(line)
+        return result["tasks"]
+
+    def _connect(self, command: str, parameters: Dict[str, Any]) -> IO[str]:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(str(self.path))
+            request = dict(parameters, command=command)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            return sock.makefile("r", encoding="utf-8")
+        finally:
+            # The file has a reference of its own.
+            sock.close()
+
+
+def _result(response: IO[str]) -> Any:
+    header = json.loads(response.readline() or "null")
+    if not header:
+        raise DaemonError("The daemon hung up")
+    if not header["ok"]:
+        raise DaemonError(header["error"])
+    return header["result"]
+
+
+def connect_client(path: Optional[Path] = None) -> Optional[Client]:
+    """A client of the daemon, if there's one listening at ``path``."""
+    if path is None:
+        path = socket_path()
+    if not path.exists() or not _is_listening(path):
+        return None
+    return Client(path)
@@ -9,15 +9,45 @@ Source:
 """
 from __future__ import annotations
 
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, fields
 from datetime import datetime
+from functools import lru_cache
 from pprint import pprint
-from typing import Any, Callable, Iterable, Optional, TypeVar
-
-from appscript import app, k
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+try:
+    from appscript import app, k
+except ImportError:  # pragma: no cover
+    # appscript only exists on macOS. Elsewhere we can still extract tasks from
+    # the fake backend in ``_fakeapp``, as long as we agree on its keywords.
+    from omnimetrics._fakeapp import k
+
+
+@lru_cache(maxsize=None)
+def omnifocus() -> Any:  # pragma: no cover
+    """The OmniFocus app, connected the first time we need it.
+
+    Connecting takes a while, and most commands don't need to.
+    """
+    return connect()
 
 
-OMNIFOCUS = app("OmniFocus")
+def connect() -> Any:  # pragma: no cover
+    """Open a new connection to OmniFocus, e.g. for another thread to use."""
+    return app("OmniFocus")
 
 
 S = TypeVar("S")
@@ -35,6 +65,37 @@ def resolve_missing_value(value: T) -> Optional[T]:
     return value if value != k.missing_value else None
 
 
+C = TypeVar("C", bound=type)
+
+
+def with_slots(cls: C) -> C:
+    """Rebuild a dataclass so that its instances use ``__slots__``.
+
+    Saves a ``__dict__`` per instance, which adds up over a whole database.
+    The same as ``@dataclass(slots=True)``, which needs Python 3.10.
+    """
+    names = tuple(field.name for field in fields(cls))
+    namespace = {
+        key: value
+        for key, value in cls.__dict__.items()
+        if key not in names and key not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = names
+
+    # Frozen instances can't be unpickled by setting attributes the usual way.
+    def __getstate__(self: Any) -> List[Any]:
+        return [getattr(self, name) for name in names]
+
+    def __setstate__(self: Any, state: List[Any]) -> None:
+        for name, value in zip(names, state):
+            object.__setattr__(self, name, value)
+
+    namespace["__getstate__"] = __getstate__
+    namespace["__setstate__"] = __setstate__
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@with_slots
 @dataclass(frozen=True)
 class TagReference:
     name: str
@@ -44,6 +105,7 @@ class TagReference:
         return cls(name=tag_reference.name())
 
 
+@with_slots
 @dataclass(frozen=True)
 class ProjectReference:
     name: str
@@ -53,6 +115,7 @@ class ProjectReference:
         return cls(name=project_reference.name())
 
 
+@with_slots
 @dataclass(frozen=True)
 class Task:
     """An OmniFocus Task.
@@ -109,6 +172,19 @@ class Task:
     is_effectively_completed: bool
     should_use_floating_timezone: bool
 
+    # Fields that ``properties`` doesn't return. They're fetched for all tasks
+    # at once, and are ``None`` in dumps taken before we exported them.
+    # The note of the task.
+    note: Optional[str] = None
+    # Returns true if this task has children, more efficiently than checking if children is empty.
+    has_children: Optional[bool] = None
+    # Returns the computed effective flagged status for the Task, based on its local flagged and those of its containers.
+    is_effectively_flagged: Optional[bool] = None
+    # Returns the computed effective completion date for the Task, based on its local completionDate and those of its containers.
+    effective_completion_date: Optional[datetime] = None
+    # Returns the computed effective drop date for the Task, based on its local dropDate and those of its containers.
+    effective_dropped_date: Optional[datetime] = None
+
     #repetition = "<null>"
     # The object holding the repetition properties for this task, or null if it is not repeating. See related documentation.
     #repetitionRule = "<null>";
@@ -116,7 +192,8 @@ class Task:
     """Missing properties.
 
     This list comes from the OmniFocus Task documentation.
-    They are properties of the task that are not returned by the ``properties`` method.
+    They are properties of the task that are not returned by the ``properties`` method,
+    and that we don't fetch some other way.
 
     after (Task.ChildInsertionLocation r/o) • A positional indicator that reference the list posotion directly following this task instance.
     assignedContainer (Project, Task, or Inbox or null) • For tasks in the inbox, the tentatively assigned project or parent task, which will be applied on cleanup.
@@ -125,26 +202,39 @@ class Task:
     beginning (Task.ChildInsertionLocation r/o) • A positional indicator that references the very start of the task’s container object.
     children (Array of Task r/o) • Returns all the child tasks of this task, sorted by library order.
     containingProject (Project or null r/o) • The Project that this Task is contained in, either as the root of the project or indirectly from a parent task. If this task is in the inbox, then this will be null.
-    effectiveCompletedDate (Date or null r/o) • (v3.8) Returns the computed effective completion date for the Task, based on its local completionDate and those of its containers.
-    effectiveDropDate (Date or null r/o) • (v3.8) Returns the computed effective drop date for the Task, based on its local dropDate and those of its containers.
-    effectiveFlagged (Boolean r/o) • Returns the computed effective flagged status for the Task, based on its local flagged and those of its containers.
     ending (Task.ChildInsertionLocation r/o) • A positional indicator that references the position at the very end of the task’s container object.
     flattenedChildren (TaskArray r/o) • An alias for flattenedTasks.
     flattenedTasks (TaskArray r/o) • Returns a flat array of all tasks contained within this task. Tasks are sorted by their order in the database. This flat array is often used for processing the entire task hierarchy of a specific task.
-    hasChildren (Boolean r/o) • Returns true if this task has children, more efficiently than checking if children is empty.
     linkedFileURLs (Array of URL r/o) • The list of file URLs linked to this task. The files at these URLs are not present in the database, rather the database holds bookmarks leading to these files. These links can be read on iOS, but not written to.
-    note (String) • The note of the task.
     notifications (Array of Task.Notification r/o) • An array of the notifications that are active for this task. (see related documentation)
     project (Project or null r/o) • The Project that this Task is the root task of, or null if this task is in the inbox or contained by another task.
     sequential (Boolean) • If true, then children of this task form a dependency chain. For example, the first task blocks the second one until the first is completed.
     shouldUseFloatingTimeZone (Boolean) • (v3.6) When set, the dueDate and deferDate properties will use floating time zones. (Note: if a Task has no due or defer dates assigned, this property will revert to the database’s default setting.)
-    tags (TagArray r/o) • Returns the Tags associated with this Task.
+    tags (TagArray r/o) • Returns the Tags associated with this Task. (Exported separately, by ``load_task_tags``.)
     taskStatus (Task.Status r/o) • Returns the current status of the task.
     tasks (TaskArray r/o) • Returns all the tasks contained directly in this task, sorted by their library order.
     """
 
     @classmethod
-    def from_omnifocus_task(cls, task) -> Task:
+    def from_omnifocus_task(
+        cls,
+        task,
+        references: Optional[ReferenceCache] = None,
+        extras: Optional[Dict[str, Any]] = None,
+    ) -> Task:
+        """Load ``task``, e.g. ``flattened_tasks[1]``.
+
+        ``extras`` has the values of ``EXTRA_TASK_COLUMNS`` for this task, e.g.
+        as fetched for all tasks by ``load_extra_columns``. If not given, each
+        is fetched for this task alone, costing an Apple Event apiece.
+        """
+        if references is None:
+            references = ReferenceCache()
+        if extras is None:
+            extras = {
+                field: resolve_missing_value(getattr(task, prop)())
+                for field, prop in EXTRA_TASK_COLUMNS.items()
+            }
         properties = task.properties()
         try:
             return cls(
@@ -161,10 +251,10 @@ class Task:
                 dropped_date=resolve_missing_value(properties[k.dropped_date]),
                 completion_date=resolve_missing_value(properties[k.completion_date]),
 
-                primary_tag=optional(TagReference.from_reference, resolve_missing_value(properties[k.primary_tag])),
-                parent_task=optional(TaskReference.from_reference, resolve_missing_value(properties[k.parent_task])),
+                primary_tag=references.resolve(TagReference, properties[k.primary_tag]),
+                parent_task=references.resolve(TaskReference, properties[k.parent_task]),
                 estimated_minutes=resolve_missing_value(properties[k.estimated_minutes]),
-                containing_project=optional(ProjectReference.from_reference, resolve_missing_value(properties[k.containing_project])),
+                containing_project=references.resolve(ProjectReference, properties[k.containing_project]),
 
                 is_next=properties[k.next_],
                 num_available_tasks=properties[k.number_of_available_tasks],
@@ -181,12 +271,15 @@ class Task:
                 is_effectively_dropped=properties[k.effectively_dropped],
                 is_effectively_completed=properties[k.effectively_completed],
                 should_use_floating_timezone=properties[k.should_use_floating_time_zone],
+                has_children=properties[k.number_of_tasks] > 0,
+                **extras,
             )
         except KeyError:
             pprint(properties)
             raise
 
 
+@with_slots
 @dataclass(frozen=True)
 class TaskReference:
     id: str
@@ -197,6 +290,375 @@ class TaskReference:
         return cls(id=task_reference.id(), name=task_reference.name())
 
 
-def load_tasks(omni_database: Any) -> Iterable[Task]:
-    for task in omni_database.flattened_tasks():
-        yield Task.from_omnifocus_task(task)
+R = TypeVar("R", TagReference, ProjectReference, TaskReference)
+
+
+class ReferenceCache:
+    """Resolves references to OmniFocus objects, remembering what it's seen.
+
+    Thousands of tasks share a few hundred projects and tags, and resolving
+    each reference costs an Apple Event per property. The cache is keyed on the
+    object specifier, and hands out the same reference instance every time it
+    sees the same specifier.
+
+    Only the ``maxsize`` most recently used references are kept.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._resolved: OrderedDict[Tuple[type, Hashable], Any] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._resolved)
+
+    def resolve(self, cls: Type[R], reference: Any) -> Optional[R]:
+        """Resolve ``reference`` into a ``cls``, or ``None`` if it's missing."""
+        if resolve_missing_value(reference) is None:
+            return None
+        key = (cls, reference)
+        try:
+            resolved = self._resolved[key]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._resolved.move_to_end(key)
+            return resolved
+        resolved = self._resolved[key] = cls.from_reference(reference)
+        if len(self._resolved) > self.maxsize:
+            self._resolved.popitem(last=False)
+        return resolved
+
+
+def load_tasks(omni_database: Any, references: Optional[ReferenceCache] = None) -> Iterable[Task]:
+    if references is None:
+        references = ReferenceCache()
+    tasks = omni_database.flattened_tasks
+    extras = load_extra_columns(tasks)
+    for i, task in enumerate(tasks()):
+        row = {field: values[i] for field, values in extras.items()}
+        yield Task.from_omnifocus_task(task, references, row)
+
+
+# Maps the ``Task`` fields that ``properties()`` doesn't return to the
+# appscript properties they are read from.
+EXTRA_TASK_COLUMNS = {
+    "note": "note",
+    "is_effectively_flagged": "effectively_flagged",
+    "effective_completion_date": "effective_completion_date",
+    "effective_dropped_date": "effective_dropped_date",
+}
+
+
+def load_extra_columns(tasks: Any) -> Dict[str, List[Any]]:
+    """Fetch ``EXTRA_TASK_COLUMNS`` for all of ``tasks`` at once, one Apple Event each."""
+    return _load_columns(tasks, EXTRA_TASK_COLUMNS)
+
+
+# Maps ``Task`` fields to the appscript properties they are read from.
+TASK_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "creation_date": "creation_date",
+    "modification_date": "modification_date",
+    "due_date": "due_date",
+    "effective_due_date": "effective_due_date",
+    "next_due_date": "next_due_date",
+    "defer_date": "defer_date",
+    "effective_defer_date": "effective_defer_date",
+    "next_defer_date": "next_defer_date",
+    "dropped_date": "dropped_date",
+    "completion_date": "completion_date",
+    "estimated_minutes": "estimated_minutes",
+    "is_next": "next_",
+    "num_available_tasks": "number_of_available_tasks",
+    "num_completed_tasks": "number_of_completed_tasks",
+    "num_tasks": "number_of_tasks",
+    "is_in_inbox": "in_inbox",
+    "is_sequential": "sequential",
+    "is_flagged": "flagged",
+    "is_completed": "completed",
+    "is_dropped": "dropped",
+    "is_blocked": "blocked",
+    "is_completed_by_children": "completed_by_children",
+    "is_effectively_dropped": "effectively_dropped",
+    "is_effectively_completed": "effectively_completed",
+    "should_use_floating_timezone": "should_use_floating_time_zone",
+    **EXTRA_TASK_COLUMNS,
+}
+
+# Columns that OmniFocus reports as ``missing value`` when they aren't set.
+OPTIONAL_COLUMNS = frozenset(
+    [
+        "due_date",
+        "effective_due_date",
+        "next_due_date",
+        "defer_date",
+        "effective_defer_date",
+        "next_defer_date",
+        "dropped_date",
+        "completion_date",
+        "estimated_minutes",
+        "effective_completion_date",
+        "effective_dropped_date",
+    ]
+)
+
+
+def load_tasks_bulk(omni_database: Any) -> Iterable[Task]:
+    """Load all tasks, fetching each property for every task at once.
+
+    ``load_tasks`` sends at least one Apple Event per task. This sends one per
+    column, plus one per property of the tasks' tags, parents, and projects,
+    no matter how many tasks there are. It yields the same tasks in the same
+    order.
+    """
+    return load_task_elements(omni_database.flattened_tasks)
+
+
+def load_task_elements(tasks: Any) -> Iterator[Task]:
+    """Load the tasks ``tasks`` refers to, e.g. ``flattened_tasks[1:100]``, in bulk."""
+    columns = {field: getattr(tasks, prop)() for field, prop in TASK_COLUMNS.items()}
+    for field in OPTIONAL_COLUMNS:
+        columns[field] = [resolve_missing_value(value) for value in columns[field]]
+    tag_names = tasks.primary_tag.name()
+    parent_ids = tasks.parent_task.id()
+    parent_names = tasks.parent_task.name()
+    project_names = tasks.containing_project.name()
+    for i in range(len(columns["id"])):
+        yield Task(
+            has_children=columns["num_tasks"][i] > 0,
+            primary_tag=optional(TagReference, resolve_missing_value(tag_names[i])),
+            parent_task=_task_reference(parent_ids[i], parent_names[i]),
+            containing_project=optional(
+                ProjectReference, resolve_missing_value(project_names[i])
+            ),
+            **{field: values[i] for field, values in columns.items()},
+        )
+
+
+def _task_reference(task_id: Any, name: Any) -> Optional[TaskReference]:
+    if resolve_missing_value(task_id) is None:
+        return None
+    return TaskReference(id=task_id, name=name)
+
+
+@with_slots
+@dataclass(frozen=True)
+class TaskTag:
+    """A tag that a task has.
+
+    A task can have any number of tags, which won't fit in a column of
+    ``Task``, so each pairing is a row of its own.
+    """
+
+    task_id: str
+    tag_id: str
+    tag_name: str
+
+
+def load_task_tags(omni_database: Any) -> Iterable[TaskTag]:
+    """Load the tags of all tasks, fetching them for every task at once.
+
+    Sends three Apple Events, no matter how many tasks or tags there are. The
+    tags of each task come out together, in the same order as the tasks.
+    """
+    tasks = omni_database.flattened_tasks
+    task_ids = tasks.id()
+    tag_ids = tasks.tags.id()
+    tag_names = tasks.tags.name()
+    for task_id, ids, names in zip(task_ids, tag_ids, tag_names):
+        for tag_id, tag_name in zip(ids, names):
+            yield TaskTag(task_id=task_id, tag_id=tag_id, tag_name=tag_name)
+
+
+@with_slots
+@dataclass(frozen=True)
+class FolderReference:
+    id: str
+    name: str
+
+
+@with_slots
+@dataclass(frozen=True)
+class Project:
+    """An OmniFocus project.
+
+    See https://omni-automation.com/omnifocus/project.html
+    """
+
+    id: str
+    name: str
+
+    creation_date: datetime
+    modification_date: datetime
+    due_date: Optional[datetime]
+    defer_date: Optional[datetime]
+    completion_date: Optional[datetime]
+    dropped_date: Optional[datetime]
+    last_review_date: Optional[datetime]
+    next_review_date: Optional[datetime]
+
+    # One of "active", "on_hold", "done" or "dropped".
+    status: str
+    # The folder the project is in, if any.
+    folder: Optional[FolderReference]
+    estimated_minutes: Optional[int]
+
+    num_tasks: int
+    num_available_tasks: int
+    num_completed_tasks: int
+
+    is_sequential: bool
+    is_flagged: bool
+    # Whether this is a single-action list, rather than a project.
+    is_singleton_action_holder: bool
+
+
+@with_slots
+@dataclass(frozen=True)
+class Tag:
+    """An OmniFocus tag.
+
+    See https://omni-automation.com/omnifocus/tag.html
+    """
+
+    id: str
+    name: str
+    # The tag this tag is in, if any.
+    parent: Optional[TagReference]
+    allows_next_action: bool
+    is_hidden: bool
+    is_effectively_hidden: bool
+    num_available_tasks: int
+    num_remaining_tasks: int
+
+
+@with_slots
+@dataclass(frozen=True)
+class Folder:
+    """An OmniFocus folder.
+
+    See https://omni-automation.com/omnifocus/folder.html
+    """
+
+    id: str
+    name: str
+    creation_date: datetime
+    modification_date: datetime
+    # The folder this folder is in, if any.
+    parent: Optional[FolderReference]
+    is_hidden: bool
+    is_effectively_hidden: bool
+
+
+# Maps ``Project`` fields to the appscript properties they are read from.
+PROJECT_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "creation_date": "creation_date",
+    "modification_date": "modification_date",
+    "due_date": "due_date",
+    "defer_date": "defer_date",
+    "completion_date": "completion_date",
+    "dropped_date": "dropped_date",
+    "last_review_date": "last_review_date",
+    "next_review_date": "next_review_date",
+    "status": "status",
+    "estimated_minutes": "estimated_minutes",
+    "num_tasks": "number_of_tasks",
+    "num_available_tasks": "number_of_available_tasks",
+    "num_completed_tasks": "number_of_completed_tasks",
+    "is_sequential": "sequential",
+    "is_flagged": "flagged",
+    "is_singleton_action_holder": "singleton_action_holder",
+}
+
+# Maps ``Tag`` fields to the appscript properties they are read from.
+TAG_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "allows_next_action": "allows_next_action",
+    "is_hidden": "hidden",
+    "is_effectively_hidden": "effectively_hidden",
+    "num_available_tasks": "available_task_count",
+    "num_remaining_tasks": "remaining_task_count",
+}
+
+# Maps ``Folder`` fields to the appscript properties they are read from.
+FOLDER_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "creation_date": "creation_date",
+    "modification_date": "modification_date",
+    "is_hidden": "hidden",
+    "is_effectively_hidden": "effectively_hidden",
+}
+
+
+def load_projects(omni_database: Any) -> Iterable[Project]:
+    """Load all projects, fetching each property for every project at once."""
+    projects = omni_database.flattened_projects
+    columns = _load_columns(projects, PROJECT_COLUMNS)
+    columns["status"] = [_status_name(status) for status in columns["status"]]
+    folder_ids = projects.folder.id()
+    folder_names = projects.folder.name()
+    for i in range(len(columns["id"])):
+        yield Project(
+            folder=_folder_reference(folder_ids[i], folder_names[i]),
+            **{field: values[i] for field, values in columns.items()},
+        )
+
+
+def load_tags(omni_database: Any) -> Iterable[Tag]:
+    """Load all tags, fetching each property for every tag at once."""
+    tags = omni_database.flattened_tags
+    columns = _load_columns(tags, TAG_COLUMNS)
+    # Top-level tags are in the document, rather than in another tag.
+    parent_classes = tags.container.class_()
+    parent_names = tags.container.name()
+    for i in range(len(columns["id"])):
+        yield Tag(
+            parent=TagReference(parent_names[i]) if parent_classes[i] == k.tag else None,
+            **{field: values[i] for field, values in columns.items()},
+        )
+
+
+def load_folders(omni_database: Any) -> Iterable[Folder]:
+    """Load all folders, fetching each property for every folder at once."""
+    folders = omni_database.flattened_folders
+    columns = _load_columns(folders, FOLDER_COLUMNS)
+    # Top-level folders are in the document, rather than in another folder.
+    parent_classes = folders.container.class_()
+    parent_ids = folders.container.id()
+    parent_names = folders.container.name()
+    for i in range(len(columns["id"])):
+        yield Folder(
+            parent=(
+                FolderReference(parent_ids[i], parent_names[i])
+                if parent_classes[i] == k.folder
+                else None
+            ),
+            **{field: values[i] for field, values in columns.items()},
+        )
+
+
+def _load_columns(collection: Any, columns: Dict[str, str]) -> Dict[str, List[Any]]:
+    return {
+        field: [resolve_missing_value(value) for value in getattr(collection, prop)()]
+        for field, prop in columns.items()
+    }
+
+
+def _folder_reference(folder_id: Any, name: Any) -> Optional[FolderReference]:
+    if resolve_missing_value(folder_id) is None:
+        return None
+    return FolderReference(id=folder_id, name=name)
+
+
+def _status_name(status: Any) -> str:
+    # e.g. ``k.on_hold_status`` -> "on_hold"
+    name: str = status.name
+    return name[: -len("_status")] if name.endswith("_status") else name
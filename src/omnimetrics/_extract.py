@@ -0,0 +1,88 @@
+"""Extract tasks, projects, tags and folders from OmniFocus at the same time.
+
+Which tasks have which tags is extracted too, as a collection of its own:
+one row for each tag of each task.
+
+Each collection is loaded by a worker from a bounded pool, over a connection
+to OmniFocus of its own, and written to an output of its own. Nearly all the
+time spent loading goes on waiting for OmniFocus to answer Apple Events, so
+extracting everything takes about as long as the slowest collection, rather
+than as long as all of them added together.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List
+
+from omnimetrics._database import (
+    Folder,
+    Project,
+    Tag,
+    TaskTag,
+    load_folders,
+    load_projects,
+    load_tags,
+    load_task_tags,
+    load_tasks_bulk,
+)
+from omnimetrics._formats import compile_json_serializer, schema_for, serialize_task, write_json
+
+
+@dataclass(frozen=True)
+class Collection:
+    """Something we can extract from OmniFocus."""
+
+    name: str
+    # Loads everything in the collection from a document.
+    load: Callable[[Any], Iterable[Any]]
+    # Serialises one of them as a JSON object.
+    serialize: Callable[[Any], str]
+
+
+COLLECTIONS = {
+    collection.name: collection
+    for collection in [
+        Collection("tasks", load_tasks_bulk, serialize_task),
+        Collection("projects", load_projects, compile_json_serializer(schema_for(Project))),
+        Collection("tags", load_tags, compile_json_serializer(schema_for(Tag))),
+        Collection("folders", load_folders, compile_json_serializer(schema_for(Folder))),
+        Collection("task-tags", load_task_tags, compile_json_serializer(schema_for(TaskTag))),
+    ]
+}
+
+
+def extract(
+    connect: Callable[[], Any], outputs: Dict[str, IO[str]], max_workers: int = 4
+) -> Dict[str, int]:
+    """Write each collection named in ``outputs`` to its output, as newline-delimited JSON.
+
+    At most ``max_workers`` collections are extracted at once. ``connect`` is
+    called once for each collection, by the worker that extracts it, and must
+    return a new connection to OmniFocus.
+
+    Returns how many of each thing were written, by collection.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            name: pool.submit(_extract_one, COLLECTIONS[name], connect, output)
+            for name, output in outputs.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def _extract_one(collection: Collection, connect: Callable[[], Any], output: IO[str]) -> int:
+    omnifocus = connect()
+    count: List[int] = [0]
+    write_json(
+        _counted(collection.load(omnifocus.default_document), count),
+        output,
+        serialize=collection.serialize,
+    )
+    return count[0]
+
+
+def _counted(items: Iterable[Any], count: List[int]) -> Iterator[Any]:
+    for item in items:
+        count[0] += 1
+        yield item
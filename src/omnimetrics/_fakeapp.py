@@ -0,0 +1,629 @@
+"""Fake appscript and ScriptingBridge backends for OmniFocus.
+
+Mimics just enough of appscript's object specifiers, and of the ScriptingBridge
+objects used by ``viewit`` and ``procrastinatron``, to run our code without
+OmniFocus (or macOS). Both record every Apple Event that the real thing would
+have sent, and can be made to take a while to send each one.
+"""
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    from appscript import k
+except ImportError:  # pragma: no cover
+
+    @dataclass(frozen=True)
+    class Keyword:
+        """Stand-in for ``appscript.Keyword``."""
+
+        name: str
+
+    class _Keywords:
+        def __getattr__(self, name: str) -> Keyword:
+            return Keyword(name)
+
+    k = _Keywords()
+
+
+MISSING_VALUE = k.missing_value
+
+# The error number of an Apple Event that timed out.
+TIMEOUT_ERROR = -1712
+
+
+class FakeCommandError(Exception):
+    """Stand-in for ``appscript.reference.CommandError``."""
+
+    def __init__(self, errornumber: int) -> None:
+        super().__init__(f"Command failed: OSERROR: {errornumber}")
+        self.errornumber = errornumber
+
+
+class FakeObject:
+    """An object in the fake OmniFocus object graph.
+
+    ``properties`` maps appscript property names (e.g. ``"creation_date"``) to
+    values, which may themselves be ``FakeObject``s. ``elements`` maps element
+    names (e.g. ``"flattened_tasks"``) to lists of ``FakeObject``. The
+    ``unlisted`` properties can be asked for, but like some of the real
+    thing's, aren't returned by ``properties()``.
+    """
+
+    def __init__(
+        self,
+        properties: Optional[Dict[str, Any]] = None,
+        elements: Optional[Dict[str, List[FakeObject]]] = None,
+        unlisted: Iterable[str] = (),
+    ) -> None:
+        self.properties = dict(properties or {})
+        self.elements = dict(elements or {})
+        self.unlisted = frozenset(unlisted)
+
+    def __repr__(self) -> str:
+        return f"<FakeObject {self.properties.get('name')!r}>"
+
+
+class _EventRecorder:
+    """Records the events sent to a fake app.
+
+    ``events`` holds a description of every event sent, in order. Each event
+    takes ``latency`` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.events: List[Tuple[str, ...]] = []
+        self.latency = latency
+
+    def record(self, event: Tuple[str, ...]) -> None:
+        self.events.append(event)
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def event_count(self) -> int:
+        return len(self.events)
+
+
+class FakeApp(_EventRecorder):
+    """A fake ``appscript.app("OmniFocus")``.
+
+    Events are recorded as the path of the specifier they were sent to.
+
+    Events time out, raising ``FakeCommandError``, if they ask about a range
+    of more than ``max_range`` elements, as big requests to the real thing
+    do. The next ``busy`` events time out too, as if OmniFocus were busy.
+    """
+
+    def __init__(self, document: FakeObject, latency: float = 0.0) -> None:
+        super().__init__(latency)
+        self._document = document
+        self.max_range: Optional[int] = None
+        self.busy = 0
+
+    def record(self, event: Tuple[Any, ...]) -> None:
+        super().record(event)
+        if self.busy:
+            self.busy -= 1
+            raise FakeCommandError(TIMEOUT_ERROR)
+        if self.max_range is not None:
+            for part in event:
+                if isinstance(part, slice) and part.stop - part.start + 1 > self.max_range:
+                    raise FakeCommandError(TIMEOUT_ERROR)
+
+    @property
+    def default_document(self) -> Reference:
+        return Reference(self, self._document, ())
+
+
+class Reference:
+    """An appscript-style object specifier.
+
+    Attribute access builds up a longer specifier without talking to the app.
+    Calling the specifier (or its ``get`` method) sends a single event. As with
+    appscript, a property of an element collection resolves to a list with one
+    value per element.
+    """
+
+    def __init__(self, app: FakeApp, root: FakeObject, path: Tuple[Any, ...]) -> None:
+        self._app = app
+        self._root = root
+        self._path = path
+
+    def __getattr__(self, name: str) -> Reference:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return Reference(self._app, self._root, self._path + (name,))
+
+    def __getitem__(self, index: Union[int, slice]) -> Reference:
+        """Refer to an element by its index, which counts from 1.
+
+        Or to a range of elements, e.g. ``[1:100]``, which includes both ends.
+        """
+        return Reference(self._app, self._root, self._path + (index,))
+
+    def __call__(self) -> Any:
+        return self.get()
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Reference):
+            return NotImplemented
+        return self._root is other._root and self._path == other._path
+
+    def __hash__(self) -> int:
+        return hash((id(self._root), self._path))
+
+    def __repr__(self) -> str:
+        return f"<Reference {self._root!r} {'.'.join(map(str, self._path))}>"
+
+    def get(self) -> Any:
+        self._app.record(self._path)
+        return self._wrap(_resolve(self._root, self._path))
+
+    def _wrap(self, value: Any) -> Any:
+        if isinstance(value, FakeObject):
+            return Reference(self._app, value, ())
+        if isinstance(value, list):
+            return [self._wrap(v) for v in value]
+        if isinstance(value, dict):
+            return {key: self._wrap(v) for key, v in value.items()}
+        return value
+
+
+def _resolve(value: Any, path: Tuple[Any, ...]) -> Any:
+    for i, name in enumerate(path):
+        if isinstance(value, list):
+            if isinstance(name, int):
+                value = value[name - 1]
+                continue
+            if isinstance(name, slice):
+                first = name.start - 1
+                value = value[first:name.stop]
+                continue
+            return [_resolve(v, path[i:]) for v in value]
+        if not isinstance(value, FakeObject):
+            # Asking for a property of a missing value gets you a missing value.
+            return MISSING_VALUE
+        if name == "properties":
+            value = {
+                getattr(k, key): v
+                for key, v in value.properties.items()
+                if key not in value.unlisted
+            }
+        elif name in value.elements:
+            value = value.elements[name]
+        else:
+            value = value.properties[name]
+    return value
+
+
+# The properties that OmniFocus returns from ``task.properties()``, with the
+# values a brand new task would have.
+TASK_DEFAULTS: Dict[str, Any] = {
+    "class_": k.task,
+    "due_date": MISSING_VALUE,
+    "effective_due_date": MISSING_VALUE,
+    "next_due_date": MISSING_VALUE,
+    "defer_date": MISSING_VALUE,
+    "effective_defer_date": MISSING_VALUE,
+    "next_defer_date": MISSING_VALUE,
+    "dropped_date": MISSING_VALUE,
+    "completion_date": MISSING_VALUE,
+    "primary_tag": MISSING_VALUE,
+    "parent_task": MISSING_VALUE,
+    "estimated_minutes": MISSING_VALUE,
+    "containing_project": MISSING_VALUE,
+    "next_": False,
+    "number_of_available_tasks": 0,
+    "number_of_completed_tasks": 0,
+    "number_of_tasks": 0,
+    "in_inbox": False,
+    "sequential": False,
+    "flagged": False,
+    "completed": False,
+    "dropped": False,
+    "blocked": False,
+    "completed_by_children": False,
+    "effectively_dropped": False,
+    "effectively_completed": False,
+    "should_use_floating_time_zone": False,
+}
+
+# The properties of a task that ``task.properties()`` leaves out, with the
+# values a brand new task would have.
+TASK_EXTRAS: Dict[str, Any] = {
+    "note": "",
+    "effectively_flagged": False,
+    "effective_completion_date": MISSING_VALUE,
+    "effective_dropped_date": MISSING_VALUE,
+}
+
+
+def fake_task(
+    id: str,
+    name: str,
+    created: datetime,
+    tags: Optional[List[FakeObject]] = None,
+    **properties: Any,
+) -> FakeObject:
+    """Make a fake OmniFocus task, with ``tags``.
+
+    Any property not given takes its value from ``TASK_DEFAULTS`` or
+    ``TASK_EXTRAS``.
+    """
+    values = dict(TASK_DEFAULTS)
+    values.update(TASK_EXTRAS)
+    values.update(id=id, name=name, creation_date=created, modification_date=created)
+    values.update(properties)
+    return FakeObject(values, {"tags": list(tags or [])}, unlisted=TASK_EXTRAS)
+
+
+# What top-level tags and folders are in.
+DOCUMENT = FakeObject({"class_": k.document, "id": "document", "name": "OmniFocus"})
+
+PROJECT_DEFAULTS: Dict[str, Any] = {
+    "class_": k.project,
+    "due_date": MISSING_VALUE,
+    "defer_date": MISSING_VALUE,
+    "completion_date": MISSING_VALUE,
+    "dropped_date": MISSING_VALUE,
+    "last_review_date": MISSING_VALUE,
+    "next_review_date": MISSING_VALUE,
+    "status": k.active_status,
+    "folder": MISSING_VALUE,
+    "estimated_minutes": MISSING_VALUE,
+    "number_of_tasks": 0,
+    "number_of_available_tasks": 0,
+    "number_of_completed_tasks": 0,
+    "sequential": False,
+    "flagged": False,
+    "singleton_action_holder": False,
+}
+
+TAG_DEFAULTS: Dict[str, Any] = {
+    "class_": k.tag,
+    "container": DOCUMENT,
+    "allows_next_action": True,
+    "hidden": False,
+    "effectively_hidden": False,
+    "available_task_count": 0,
+    "remaining_task_count": 0,
+}
+
+FOLDER_DEFAULTS: Dict[str, Any] = {
+    "class_": k.folder,
+    "container": DOCUMENT,
+    "hidden": False,
+    "effectively_hidden": False,
+}
+
+
+def fake_project(id: str, name: str, created: datetime, **properties: Any) -> FakeObject:
+    """Make a fake OmniFocus project, with defaults from ``PROJECT_DEFAULTS``."""
+    values = dict(PROJECT_DEFAULTS)
+    values.update(id=id, name=name, creation_date=created, modification_date=created)
+    values.update(properties)
+    return FakeObject(values)
+
+
+def fake_tag(id: str, name: str, **properties: Any) -> FakeObject:
+    """Make a fake OmniFocus tag, with defaults from ``TAG_DEFAULTS``."""
+    values = dict(TAG_DEFAULTS)
+    values.update(id=id, name=name)
+    values.update(properties)
+    return FakeObject(values)
+
+
+def fake_folder(id: str, name: str, created: datetime, **properties: Any) -> FakeObject:
+    """Make a fake OmniFocus folder, with defaults from ``FOLDER_DEFAULTS``."""
+    values = dict(FOLDER_DEFAULTS)
+    values.update(id=id, name=name, creation_date=created, modification_date=created)
+    values.update(properties)
+    return FakeObject(values)
+
+
+def fake_omnifocus(
+    tasks: List[FakeObject],
+    latency: float = 0.0,
+    visible: Optional[List[FakeObject]] = None,
+    projects: Optional[List[FakeObject]] = None,
+    tags: Optional[List[FakeObject]] = None,
+    folders: Optional[List[FakeObject]] = None,
+) -> FakeApp:
+    """Make a fake OmniFocus app whose default document has ``tasks``.
+
+    The document has one window, which shows ``visible`` (by default, nothing).
+    """
+    leaves = [FakeObject({"id": item.properties["id"], "value": item}) for item in visible or []]
+    window = FakeObject({"content": FakeObject(elements={"leaves": leaves})})
+    document = FakeObject(
+        elements={
+            "flattened_tasks": tasks,
+            "flattened_projects": projects or [],
+            "flattened_tags": tags or [],
+            "flattened_folders": folders or [],
+            "document_windows": [window],
+        }
+    )
+    return FakeApp(document, latency)
+
+
+# Stands in for the ScriptingBridge class of OmniFocus tasks.
+FAKE_TASK_CLASS = object()
+
+
+class FakeBridgeApp(_EventRecorder):
+    """A fake ScriptingBridge ``SBApplication`` for OmniFocus.
+
+    Has one document with one window, whose content shows ``tasks``. Events
+    are recorded as the name of the method that sent them.
+    """
+
+    def __init__(self, tasks: List[FakeObject], latency: float = 0.0) -> None:
+        super().__init__(latency)
+        self._tasks = tasks
+
+    def classForScriptingClass_(self, name: str) -> Any:
+        assert name == "task"
+        return FAKE_TASK_CLASS
+
+    def defaultDocument(self) -> _BridgeDocument:
+        return _BridgeDocument(self)
+
+    def documents(self) -> List[_BridgeDocument]:
+        return [_BridgeDocument(self)]
+
+    def item(self, task: Optional[FakeObject]) -> Optional[FakeBridgeTask]:
+        if not isinstance(task, FakeObject):
+            return None
+        return FakeBridgeTask(self, task)
+
+
+class _BridgeDocument:
+    def __init__(self, app: FakeBridgeApp) -> None:
+        self._app = app
+
+    def documentWindows(self) -> List[_BridgeWindow]:
+        return [_BridgeWindow(self._app)]
+
+
+class _BridgeWindow:
+    def __init__(self, app: FakeBridgeApp) -> None:
+        self._app = app
+
+    def content(self) -> _BridgeContent:
+        return _BridgeContent(self._app)
+
+
+class _BridgeContent:
+    def __init__(self, app: FakeBridgeApp) -> None:
+        self._app = app
+
+    def leaves(self) -> List[_BridgeLeaf]:
+        self._app.record(("leaves",))
+        return [_BridgeLeaf(self._app, task) for task in self._app._tasks]
+
+
+class _BridgeLeaf:
+    def __init__(self, app: FakeBridgeApp, task: FakeObject) -> None:
+        self._app = app
+        self._task = task
+
+    def value(self) -> Optional[FakeBridgeTask]:
+        self._app.record(("value",))
+        return self._app.item(self._task)
+
+
+class _Thunk:
+    """A reference that ScriptingBridge hasn't evaluated yet."""
+
+    def __init__(self, app: FakeBridgeApp, name: str, value: Any) -> None:
+        self._app = app
+        self._name = name
+        self._value = value
+
+    def get(self) -> Any:
+        self._app.record((self._name,))
+        return self._value
+
+
+class FakeBridgeTask:
+    """A task as seen through ScriptingBridge."""
+
+    def __init__(self, app: FakeBridgeApp, task: FakeObject) -> None:
+        self._app = app
+        self._task = task
+
+    def _property(self, name: str) -> Any:
+        self._app.record((name,))
+        return resolve_fake_value(self._task.properties[name])
+
+    def isKindOfClass_(self, cls: Any) -> bool:
+        # Answered locally, without an event.
+        return cls is FAKE_TASK_CLASS
+
+    def id(self) -> str:
+        return self._property("id")
+
+    def name(self) -> str:
+        return self._property("name")
+
+    def blocked(self) -> bool:
+        return self._property("blocked")
+
+    def completed(self) -> bool:
+        return self._property("completed")
+
+    def modificationDate(self) -> datetime:
+        return self._property("modification_date")
+
+    def parentTask(self) -> _Thunk:
+        return _Thunk(self._app, "parentTask", self._app.item(self._task.properties["parent_task"]))
+
+    def estimatedMinutes(self) -> _Thunk:
+        minutes = resolve_fake_value(self._task.properties["estimated_minutes"])
+        return _Thunk(self._app, "estimatedMinutes", minutes)
+
+
+def resolve_fake_value(value: Any) -> Any:
+    return None if value == MISSING_VALUE else value
+
+
+@dataclass(frozen=True)
+class SyntheticDatabase:
+    """A generated OmniFocus database.
+
+    ``tasks`` includes the root task of each project, as OmniFocus's
+    ``flattened_tasks`` does, and is in database order.
+    """
+
+    tasks: List[FakeObject]
+    projects: List[FakeObject]
+    tags: List[FakeObject]
+    folders: List[FakeObject]
+
+    @property
+    def available(self) -> List[FakeObject]:
+        """The tasks that haven't been completed or dropped."""
+        return [
+            task
+            for task in self.tasks
+            if not task.properties["completed"] and not task.properties["dropped"]
+        ]
+
+    def appscript(self, latency: float = 0.0) -> FakeApp:
+        """A fake appscript app whose window shows the available tasks."""
+        return fake_omnifocus(
+            self.tasks,
+            latency,
+            visible=self.available,
+            projects=self.projects,
+            tags=self.tags,
+            folders=self.folders,
+        )
+
+    def scripting_bridge(self, latency: float = 0.0) -> FakeBridgeApp:
+        """A fake ScriptingBridge app whose window shows the available tasks."""
+        return FakeBridgeApp(self.available, latency)
+
+
+def synthetic_database(
+    num_tasks: int,
+    max_depth: int = 3,
+    tasks_per_project: int = 50,
+    num_tags: int = 50,
+    tag_skew: float = 1.0,
+    seed: int = 0,
+) -> SyntheticDatabase:
+    """Generate a plausible OmniFocus database of ``num_tasks`` tasks.
+
+    Tasks are nested up to ``max_depth`` deep under the root tasks of projects.
+    Tags are assigned following a Zipf-like distribution: the ``n``th tag is
+    used in proportion to ``1 / n ** tag_skew``, and a fifth of tasks have no
+    tag. The same ``seed`` always gives the same database.
+
+    There's a folder for every ten projects. Every fifth project, and every
+    fourth folder, is at the top level, and the rest are in folders. The
+    first ten tags are at the top level, and the rest are in them.
+    """
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    tags: List[FakeObject] = []
+    for i in range(num_tags):
+        parent = DOCUMENT if i < 10 else tags[i % 10]
+        tags.append(fake_tag(f"tag-{i}", f"Tag {i}", container=parent))
+    tag_weights = [1 / (rank ** tag_skew) for rank in range(1, num_tags + 1)]
+    num_projects = max(1, num_tasks // tasks_per_project)
+    folders: List[FakeObject] = []
+    for i in range(max(1, num_projects // 10)):
+        parent = DOCUMENT if i % 4 == 0 else folders[i // 4]
+        folders.append(fake_folder(f"folder-{i}", f"Folder {i}", start, container=parent))
+    projects = [
+        fake_project(
+            f"project-{i}",
+            f"Project {i}",
+            start,
+            folder=MISSING_VALUE if i % 5 == 0 else folders[i % len(folders)],
+        )
+        for i in range(num_projects)
+    ]
+    tasks: List[FakeObject] = []
+    # Tasks that can still have children, with the depth of those children.
+    parents: List[Tuple[FakeObject, int]] = []
+    for i in range(num_tasks):
+        created = start + timedelta(minutes=i * 7)
+        if i < num_projects:
+            project = projects[i]
+            parent = None
+            depth = 0
+        else:
+            parent, depth = rng.choice(parents)
+            project = parent.properties["containing_project"]
+        completed = rng.random() < 0.4
+        dropped = not completed and rng.random() < 0.05
+        modified = created + timedelta(hours=rng.randrange(24 * 30))
+        primary_tag = (
+            rng.choices(tags, tag_weights)[0] if tags and rng.random() < 0.8 else MISSING_VALUE
+        )
+        completion_date = _days_later(rng, created) if completed else MISSING_VALUE
+        dropped_date = _days_later(rng, created) if dropped else MISSING_VALUE
+        task = fake_task(
+            f"task-{i}",
+            f"Task {i}" if parent is not None else project.properties["name"],
+            created,
+            tags=_task_tags(i, primary_tag, tags),
+            modification_date=modified,
+            containing_project=project,
+            parent_task=MISSING_VALUE if parent is None else parent,
+            primary_tag=primary_tag,
+            estimated_minutes=rng.choice([MISSING_VALUE, 5, 15, 30, 60, 120]),
+            due_date=_days_later(rng, created) if rng.random() < 0.2 else MISSING_VALUE,
+            completion_date=completion_date,
+            effective_completion_date=completion_date,
+            dropped_date=dropped_date,
+            effective_dropped_date=dropped_date,
+            completed=completed,
+            effectively_completed=completed,
+            dropped=dropped,
+            effectively_dropped=dropped,
+            flagged=rng.random() < 0.1,
+            blocked=rng.random() < 0.3,
+            note=f"Notes on task {i}" if i % 4 == 0 else "",
+        )
+        task.properties["effectively_flagged"] = task.properties["flagged"] or (
+            parent is not None and parent.properties["effectively_flagged"]
+        )
+        if parent is not None:
+            parent.properties["number_of_tasks"] += 1
+        tasks.append(task)
+        if parent is None:
+            project.properties.update(
+                creation_date=created,
+                modification_date=task.properties["modification_date"],
+                completion_date=task.properties["completion_date"],
+                dropped_date=task.properties["dropped_date"],
+                status=(
+                    k.done_status if completed else k.dropped_status if dropped else k.active_status
+                ),
+            )
+        if depth < max_depth:
+            parents.append((task, depth + 1))
+    return SyntheticDatabase(tasks=tasks, projects=projects, tags=tags, folders=folders)
+
+
+def _task_tags(index: int, primary_tag: Any, tags: List[FakeObject]) -> List[FakeObject]:
+    # Tagged tasks have their primary tag, and every third has another too.
+    if primary_tag == MISSING_VALUE:
+        return []
+    other = tags[index % len(tags)]
+    if index % 3 == 0 and other is not primary_tag:
+        return [primary_tag, other]
+    return [primary_tag]
+
+
+def _days_later(rng: random.Random, when: datetime) -> datetime:
+    return when + timedelta(days=rng.randrange(1, 30))
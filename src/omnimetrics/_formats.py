@@ -0,0 +1,344 @@
+"""Serialise tasks, with schemas derived from ``Task``.
+
+Avro and Parquet support are optional. Install ``omnimetrics[avro]`` or
+``omnimetrics[parquet]`` to get them.
+"""
+from __future__ import annotations
+
+import dataclasses
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from omnimetrics._database import Task
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+# How to represent the Python types we find on dataclasses, using BigQuery's names.
+_TYPES = {
+    str: "STRING",
+    int: "INTEGER",
+    float: "FLOAT",
+    bool: "BOOLEAN",
+    datetime: "TIMESTAMP",
+}
+
+
+@dataclass(frozen=True)
+class Field:
+    """A field in a schema."""
+
+    name: str
+    # One of the values of ``_TYPES``, or ``RECORD`` if it has ``fields``.
+    type: str
+    nullable: bool
+    fields: Tuple[Field, ...] = ()
+
+
+def schema_for(cls: Type[Any]) -> Tuple[Field, ...]:
+    """Derive a schema from the fields of a dataclass.
+
+    ``Optional`` fields are nullable, and fields that are themselves
+    dataclasses become nested records.
+    """
+    hints = get_type_hints(cls)
+    return tuple(_field_for(field.name, hints[field.name]) for field in dataclasses.fields(cls))
+
+
+def unwrap_optional(hint: Any) -> Tuple[Any, bool]:
+    """Split a type hint of ``Optional[X]`` into ``X`` and whether it was optional."""
+    args = get_args(hint)
+    if get_origin(hint) is Union and type(None) in args:
+        [hint] = [arg for arg in args if arg is not type(None)]
+        return hint, True
+    return hint, False
+
+
+def _field_for(name: str, hint: Any) -> Field:
+    hint, nullable = unwrap_optional(hint)
+    if dataclasses.is_dataclass(hint):
+        return Field(name=name, type="RECORD", nullable=nullable, fields=schema_for(hint))
+    return Field(name=name, type=_TYPES[hint], nullable=nullable)
+
+
+TASK_SCHEMA = schema_for(Task)
+
+
+def flatten(fields: Tuple[Field, ...], prefix: str = "") -> List[Tuple[str, Field]]:
+    """Flatten records into their fields, named e.g. ``containing_project.name``."""
+    columns = []
+    for field in fields:
+        if field.type == "RECORD":
+            for name, subfield in flatten(field.fields, f"{prefix}{field.name}."):
+                # A field of a missing record is missing too.
+                columns.append((name, Field(subfield.name, subfield.type, True)))
+        else:
+            columns.append((prefix + field.name, field))
+    return columns
+
+
+def bigquery_schema(
+    fields: Tuple[Field, ...], all_nullable: bool = False
+) -> List[bigquery.SchemaField]:
+    """The BigQuery schema of ``fields``.
+
+    With ``all_nullable``, every field is nullable, as for loading into or
+    adding columns to an existing table. A table that ``run-pipeline``
+    created by detecting the schema of JSON dumps has only nullable columns,
+    and BigQuery won't load a required field into a nullable column.
+    """
+    # Only imported when needed, because it takes a long time to import.
+    from google.cloud import bigquery
+
+    return [
+        bigquery.SchemaField(
+            field.name,
+            field.type,
+            mode="NULLABLE" if field.nullable or all_nullable else "REQUIRED",
+            fields=bigquery_schema(field.fields, all_nullable),
+        )
+        for field in fields
+    ]
+
+
+def compile_json_serializer(
+    fields: Tuple[Field, ...], extra_fields: Optional[Dict[str, Any]] = None
+) -> Callable[[Any], str]:
+    """Make a function that serialises a dataclass instance to a JSON object.
+
+    The output is the same as ``json.dumps(asdict(row))`` with datetimes in
+    ISO 8601 format, but it doesn't copy the row into a dict first, and it
+    formats each field according to its type rather than discovering the type
+    at runtime.
+
+    ``extra_fields`` are added to the end of every object, with the same
+    values each time, e.g. to mark the rows of a change log.
+    """
+    namespace: Dict[str, Any] = {"_string": json.encoder.encode_basestring_ascii}
+    members = []
+    for field in fields:
+        value = f"row.{field.name}"
+        if field.type == "RECORD":
+            namespace[f"_{field.name}"] = compile_json_serializer(field.fields)
+            expression = f"_{field.name}({value})"
+        else:
+            expression = _JSON_EXPRESSIONS[field.type].format(value)
+        if field.nullable:
+            expression = f'("null" if {value} is None else {expression})'
+        members.append((field.name, expression))
+    for name, constant in (extra_fields or {}).items():
+        members.append((name, repr(json.dumps(constant))))
+    parts = []
+    for i, (name, expression) in enumerate(members):
+        separator = "{" if i == 0 else ", "
+        parts.append(repr(f"{separator}{json.dumps(name)}: "))
+        parts.append(expression)
+    parts.append(repr("}") if members else repr("{}"))
+    source = "def serialize(row):\n    return " + " + ".join(parts) + "\n"
+    exec(source, namespace)
+    return namespace["serialize"]
+
+
+# Python expressions that turn a value into JSON, by type.
+_JSON_EXPRESSIONS = {
+    "STRING": "_string({})",
+    "INTEGER": "str({})",
+    "FLOAT": "repr({})",
+    "BOOLEAN": '("true" if {} else "false")',
+    "TIMESTAMP": "'\"' + {}.isoformat() + '\"'",
+}
+
+serialize_task = compile_json_serializer(TASK_SCHEMA)
+
+
+def _parse_timestamp(value: Union[str, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        # Columnar formats store our naive datetimes as UTC, so undo that.
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(value)
+
+
+def compile_json_deserializer(cls: Type[Any]) -> Callable[[Dict[str, Any]], Any]:
+    """Make a function that turns a parsed JSON object back into an instance of ``cls``.
+
+    The inverse of ``compile_json_serializer``, for the schema of ``cls``.
+    Also takes rows read from Avro or Parquet, which have datetimes already.
+    Fields with defaults may be missing, e.g. from rows written before they
+    were added.
+    """
+    hints = get_type_hints(cls)
+    converters: List[Tuple[str, Optional[Callable[[Any], Any]]]] = []
+    for field in dataclasses.fields(cls):
+        hint, _ = unwrap_optional(hints[field.name])
+        if dataclasses.is_dataclass(hint):
+            converters.append((field.name, compile_json_deserializer(hint)))
+        elif hint is datetime:
+            converters.append((field.name, _parse_timestamp))
+        else:
+            converters.append((field.name, None))
+    defaults = {
+        field.name: field.default
+        for field in dataclasses.fields(cls)
+        if field.default is not dataclasses.MISSING
+    }
+
+    def deserialize(row: Dict[str, Any]) -> Any:
+        values = {}
+        for name, convert in converters:
+            value = row[name] if name not in defaults else row.get(name, defaults[name])
+            values[name] = value if convert is None or value is None else convert(value)
+        return cls(**values)
+
+    return deserialize
+
+
+deserialize_task = compile_json_deserializer(Task)
+
+
+def write_json(
+    tasks: Iterable[Any],
+    output: IO[str],
+    batch_size: int = 1000,
+    serialize: Callable[[Any], str] = serialize_task,
+) -> None:
+    """Write ``tasks`` to ``output`` as newline-delimited JSON.
+
+    Rows are written ``batch_size`` at a time. To write something other than
+    tasks, pass a ``serialize`` made by ``compile_json_serializer``.
+    """
+    tasks = iter(tasks)
+    while True:
+        batch = [serialize(task) for task in islice(tasks, batch_size)]
+        if not batch:
+            break
+        batch.append("")
+        output.write("\n".join(batch))
+
+
+# The default name of a dump of tasks, as a strftime pattern.
+DUMP_NAME = "omnifocus-%Y%m%d-%H%M%S.json"
+
+
+def dump_taken_at(path: Path) -> datetime:
+    """When the dump at ``path`` was taken.
+
+    Taken from its name, if it has the default name, and otherwise from when
+    it was last modified.
+    """
+    try:
+        return datetime.strptime(path.name, DUMP_NAME)
+    except ValueError:
+        return datetime.fromtimestamp(path.stat().st_mtime)
+
+
+_AVRO_TYPES: Dict[str, Any] = {
+    "STRING": "string",
+    "INTEGER": "long",
+    "FLOAT": "double",
+    "BOOLEAN": "boolean",
+    "TIMESTAMP": {"type": "long", "logicalType": "timestamp-micros"},
+}
+
+
+def avro_schema(fields: Tuple[Field, ...], name: str = "Task") -> Dict[str, Any]:
+    """Make an Avro record schema called ``name``.
+
+    Nested records are named after their parents, since Avro names must be
+    unique within a schema.
+    """
+    avro_fields = []
+    for field in fields:
+        if field.type == "RECORD":
+            avro_type = avro_schema(field.fields, f"{name}_{field.name}")
+        else:
+            avro_type = _AVRO_TYPES[field.type]
+        if field.nullable:
+            avro_fields.append({"name": field.name, "type": ["null", avro_type], "default": None})
+        else:
+            avro_fields.append({"name": field.name, "type": avro_type})
+    return {"type": "record", "name": name, "fields": avro_fields}
+
+
+def arrow_schema(fields: Tuple[Field, ...]) -> Any:
+    import pyarrow
+
+    return pyarrow.schema(_arrow_fields(fields))
+
+
+def _arrow_fields(fields: Tuple[Field, ...]) -> List[Any]:
+    import pyarrow
+
+    types = {
+        "STRING": pyarrow.string(),
+        "INTEGER": pyarrow.int64(),
+        "FLOAT": pyarrow.float64(),
+        "BOOLEAN": pyarrow.bool_(),
+        # OmniFocus gives us naive datetimes. Like our JSON dumps, treat them as UTC.
+        "TIMESTAMP": pyarrow.timestamp("us", tz="UTC"),
+    }
+    return [
+        pyarrow.field(
+            field.name,
+            (
+                pyarrow.struct(_arrow_fields(field.fields))
+                if field.type == "RECORD"
+                else types[field.type]
+            ),
+            nullable=field.nullable,
+        )
+        for field in fields
+    ]
+
+
+def write_avro(tasks: Iterable[Task], output: IO[bytes]) -> None:
+    """Write ``tasks`` to ``output`` as an Avro container file."""
+    import fastavro
+
+    schema = fastavro.parse_schema(avro_schema(TASK_SCHEMA))
+    fastavro.writer(output, schema, (asdict(task) for task in tasks), codec="deflate")
+
+
+def write_parquet(tasks: Iterable[Task], output: IO[bytes], batch_size: int = 10_000) -> None:
+    """Write ``tasks`` to ``output`` as a Parquet file.
+
+    Only ``batch_size`` tasks are held in memory at once, each batch becoming
+    a row group.
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = arrow_schema(TASK_SCHEMA)
+    rows = (asdict(task) for task in tasks)
+    with pyarrow.parquet.ParquetWriter(output, schema, compression="snappy") as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+
+
+# Columnar formats, how to write them, and how BigQuery knows them (as the
+# values of ``bigquery.SourceFormat``, which we don't import until we need it).
+COLUMNAR_FORMATS = {
+    "avro": (write_avro, "AVRO"),
+    "parquet": (write_parquet, "PARQUET"),
+}
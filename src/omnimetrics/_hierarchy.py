@@ -0,0 +1,171 @@
+"""How tasks nest inside one another, and what that adds up to.
+
+Walking up from a task to find its qualified name, or down to add up its
+estimates, is one Apple Event per step when done against OmniFocus, and
+ancestors shared by many tasks get fetched over and over. A ``Hierarchy`` is
+built once from ``load_tasks`` output, after which these are all lookups.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from omnimetrics._database import Task
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """Totals over a set of tasks, e.g. a task and everything under it."""
+
+    num_tasks: int = 0
+    num_available: int = 0
+    num_completed: int = 0
+    estimated_minutes: int = 0
+
+    def __add__(self, other: Rollup) -> Rollup:
+        return Rollup(
+            num_tasks=self.num_tasks + other.num_tasks,
+            num_available=self.num_available + other.num_available,
+            num_completed=self.num_completed + other.num_completed,
+            estimated_minutes=self.estimated_minutes + other.estimated_minutes,
+        )
+
+    @classmethod
+    def of_task(cls, task: Task) -> Rollup:
+        """The totals for ``task`` on its own."""
+        return cls(
+            num_tasks=1,
+            num_available=int(is_available(task)),
+            num_completed=int(task.is_effectively_completed),
+            estimated_minutes=task.estimated_minutes or 0,
+        )
+
+
+def is_available(task: Task) -> bool:
+    """Could we work on ``task`` now?
+
+    Doesn't look at defer dates.
+    """
+    return not (task.is_effectively_completed or task.is_effectively_dropped or task.is_blocked)
+
+
+def is_available_at(task: Task, now: datetime) -> bool:
+    """Could we work on ``task`` at ``now``, taking defer dates into account?"""
+    return is_available(task) and (
+        task.effective_defer_date is None or task.effective_defer_date <= now
+    )
+
+
+class Hierarchy:
+    """An index of tasks by id, and of how they nest.
+
+    Tasks whose parents aren't in the index (e.g. if the root tasks of
+    projects weren't loaded) are treated as being at the top, under their
+    parent's name.
+    """
+
+    def __init__(self, tasks: Iterable[Task]) -> None:
+        self._tasks: Dict[str, Task] = {}
+        self._children: Dict[str, List[str]] = {}
+        for task in tasks:
+            self._tasks[task.id] = task
+            self._children.setdefault(task.id, [])
+        self._roots: List[str] = []
+        for task in self._tasks.values():
+            parent = self.parent(task.id)
+            if parent is None:
+                self._roots.append(task.id)
+            else:
+                self._children[parent].append(task.id)
+
+        self._depths: Dict[str, int] = {}
+        self._names: Dict[str, Optional[str]] = {}
+        # Parents come before their children in ``order``.
+        order = []
+        for root in self._roots:
+            task = self._tasks[root]
+            prefix = task.parent_task.name if task.parent_task is not None else ""
+            self._depths[root] = 0 if task.parent_task is None else 1
+            self._names[root] = _qualify(prefix, task.name)
+            order.append(root)
+        for task_id in order:
+            for child in self._children[task_id]:
+                self._depths[child] = self._depths[task_id] + 1
+                self._names[child] = _qualify(self._names[task_id], self._tasks[child].name)
+                order.append(child)
+
+        self._subtrees: Dict[str, Rollup] = {}
+        for task_id in reversed(order):
+            rollup = Rollup.of_task(self._tasks[task_id])
+            for child in self._children[task_id]:
+                rollup += self._subtrees[child]
+            self._subtrees[task_id] = rollup
+
+        self._projects: Dict[Optional[str], Rollup] = {}
+        for task in self._tasks.values():
+            project = task.containing_project.name if task.containing_project else None
+            self._projects[project] = self._projects.get(project, Rollup()) + Rollup.of_task(task)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._tasks
+
+    def __getitem__(self, task_id: str) -> Task:
+        return self._tasks[task_id]
+
+    def __iter__(self) -> Iterator[Task]:
+        return iter(self._tasks.values())
+
+    def parent(self, task_id: str) -> Optional[str]:
+        """The id of the parent of a task, if it's in the index."""
+        parent = self._tasks[task_id].parent_task
+        if parent is None or parent.id not in self._tasks:
+            return None
+        return parent.id
+
+    def children(self, task_id: str) -> List[str]:
+        """The ids of the tasks directly under a task."""
+        return list(self._children[task_id])
+
+    def ancestors(self, task_id: str) -> Iterator[str]:
+        """The ids of all the parents of a task, nearest first."""
+        parent = self.parent(task_id)
+        while parent is not None:
+            yield parent
+            parent = self.parent(parent)
+
+    def qualified_name(self, task_id: str) -> Optional[str]:
+        """The full name of a task, including the names of all its parents.
+
+        ``None`` if the task or any of its parents doesn't have a name.
+        """
+        return self._names[task_id]
+
+    def depth(self, task_id: str) -> int:
+        """How many parents a task has."""
+        return self._depths[task_id]
+
+    def subtree(self, task_id: str) -> Rollup:
+        """Totals over a task and everything under it."""
+        return self._subtrees[task_id]
+
+    def project(self, name: Optional[str]) -> Rollup:
+        """Totals over the tasks in the project called ``name``.
+
+        ``None`` for the tasks that aren't in a project.
+        """
+        return self._projects.get(name, Rollup())
+
+    @property
+    def projects(self) -> Dict[Optional[str], Rollup]:
+        """Totals for every project, by name."""
+        return dict(self._projects)
+
+
+def _qualify(prefix: Optional[str], name: Optional[str]) -> Optional[str]:
+    if prefix is None or name is None:
+        return None
+    return f"{prefix} / {name}" if prefix else name
@@ -0,0 +1,272 @@
+"""A history of snapshots, which stores each version of each task only once.
+
+A history is a directory::
+
+    versions.tsv              every version we have: hash, pack, offset, length
+    packs/<snapshot>.pack     the versions first seen in <snapshot>, each
+                              compressed on its own
+    snapshots/<snapshot>.tsv.gz
+                              the manifest of <snapshot>: for each task, in
+                              order, its id, the hash of its version, and
+                              where to find that version
+
+A version is a task serialised as a line of JSON, exactly as in a dump, and
+its hash is a hash of that line. Snapshots are named after when they were
+taken, e.g. ``20200901-123000``.
+
+A manifest says where to find every version it needs, so reconstructing a
+snapshot only reads its manifest and those versions. Adding a snapshot only
+writes the versions that no earlier snapshot had.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+from omnimetrics._database import Task
+from omnimetrics._formats import serialize_task
+
+_NAME_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class Location(NamedTuple):
+    """Where to find a version."""
+
+    pack: str
+    offset: int
+    length: int
+
+
+class Entry(NamedTuple):
+    """A task in a snapshot."""
+
+    id: str
+    hash: str
+    location: Location
+
+
+@dataclass(frozen=True)
+class AddResult:
+    """What adding a snapshot did."""
+
+    taken_at: datetime
+    num_tasks: int
+    new_versions: int
+    bytes_written: int
+
+
+@dataclass(frozen=True)
+class HistoryDiff:
+    """How the tasks changed between two snapshots.
+
+    Tasks are given as the JSON objects from the dumps.
+    """
+
+    added: List[Dict[str, object]]
+    removed: List[Dict[str, object]]
+    changed: List[Tuple[Dict[str, object], Dict[str, object]]]
+
+
+def version_hash(line: str) -> str:
+    """The hash of a version of a task, serialised as a line of JSON."""
+    return hashlib.blake2b(line.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class History:
+    """A directory of snapshots of tasks, stored as deltas."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._packs = root / "packs"
+        self._snapshots = root / "snapshots"
+        self._versions = root / "versions.tsv"
+
+    def snapshots(self) -> List[datetime]:
+        """When each of the snapshots in the history was taken, oldest first."""
+        if not self._snapshots.exists():
+            return []
+        return sorted(
+            datetime.strptime(path.name.split(".")[0], _NAME_FORMAT)
+            for path in self._snapshots.glob("*.tsv.gz")
+        )
+
+    def snapshot_at(self, when: datetime) -> datetime:
+        """The latest snapshot taken at or before ``when``.
+
+        Raises ``LookupError`` if there isn't one.
+        """
+        earlier = [taken_at for taken_at in self.snapshots() if taken_at <= when]
+        if not earlier:
+            raise LookupError(f"No snapshot at or before {when.isoformat()}")
+        return earlier[-1]
+
+    def add_tasks(self, tasks: Iterable[Task], taken_at: datetime) -> AddResult:
+        """Add a snapshot of ``tasks``, e.g. as returned by ``load_tasks``."""
+        return self._add((serialize_task(task) for task in tasks), taken_at)
+
+    def add_dump(self, path: Path, taken_at: datetime) -> AddResult:
+        """Add a newline-delimited JSON dump as a snapshot.
+
+        Raises ``ValueError`` if the dump is a change log, rather than a
+        snapshot.
+        """
+        with path.open() as dump:
+            return self._add(_snapshot_lines(dump, path), taken_at)
+
+    def _add(self, lines: Iterable[str], taken_at: datetime) -> AddResult:
+        name = taken_at.strftime(_NAME_FORMAT)
+        manifest_path = self._manifest_path(name)
+        if manifest_path.exists():
+            raise FileExistsError(f"Already have a snapshot taken at {taken_at.isoformat()}")
+        self._packs.mkdir(parents=True, exist_ok=True)
+        self._snapshots.mkdir(parents=True, exist_ok=True)
+        known = self._load_versions()
+        # A run that failed after recording its versions, but before writing
+        # its manifest, leaves a pack that versions.tsv points into. Replacing
+        # it would leave those entries pointing at the wrong bytes.
+        if any(location.pack == name for location in known.values()):
+            raise FileExistsError(f"Already have versions from a snapshot named {name}")
+        entries = []
+        new_versions = []
+        pack_path = self._packs / f"{name}.pack"
+        temp_pack = pack_path.with_name(pack_path.name + ".tmp")
+        offset = 0
+        try:
+            with temp_pack.open("wb") as pack:
+                for line in lines:
+                    task_hash = version_hash(line)
+                    location = known.get(task_hash)
+                    if location is None:
+                        data = zlib.compress(line.encode("utf-8"))
+                        pack.write(data)
+                        location = Location(name, offset, len(data))
+                        offset += len(data)
+                        known[task_hash] = location
+                        new_versions.append((task_hash, location))
+                    entries.append(Entry(json.loads(line)["id"], task_hash, location))
+            # Write everything else before the manifest, so that a snapshot
+            # only exists once all of its versions do.
+            if new_versions:
+                os.replace(temp_pack, pack_path)
+                with self._versions.open("a") as versions:
+                    for task_hash, location in new_versions:
+                        versions.write(f"{task_hash}\t{location.pack}\t{location.offset}\t")
+                        versions.write(f"{location.length}\n")
+        finally:
+            # Gone already if it was moved into place.
+            if temp_pack.exists():
+                temp_pack.unlink()
+        temp_manifest = manifest_path.with_name(manifest_path.name + ".tmp")
+        with gzip.open(temp_manifest, "wt", encoding="utf-8") as manifest:
+            for entry in entries:
+                manifest.write(
+                    f"{entry.id}\t{entry.hash}\t{entry.location.pack}\t"
+                    f"{entry.location.offset}\t{entry.location.length}\n"
+                )
+        os.replace(temp_manifest, manifest_path)
+        return AddResult(
+            taken_at=taken_at,
+            num_tasks=len(entries),
+            new_versions=len(new_versions),
+            bytes_written=offset + manifest_path.stat().st_size,
+        )
+
+    def manifest(self, taken_at: datetime) -> List[Entry]:
+        """The tasks in the snapshot taken at ``taken_at``, in order."""
+        path = self._manifest_path(taken_at.strftime(_NAME_FORMAT))
+        if not path.exists():
+            raise LookupError(f"No snapshot taken at {taken_at.isoformat()}")
+        entries = []
+        with gzip.open(path, "rt", encoding="utf-8") as manifest:
+            for line in manifest:
+                task_id, task_hash, pack, offset, length = line.rstrip("\n").split("\t")
+                entries.append(Entry(task_id, task_hash, Location(pack, int(offset), int(length))))
+        return entries
+
+    def reconstruct(self, taken_at: datetime) -> Iterator[str]:
+        """The lines of the dump of the snapshot taken at ``taken_at``."""
+        return self._read(entry.location for entry in self.manifest(taken_at))
+
+    def write_snapshot(self, taken_at: datetime, output: IO[str]) -> None:
+        """Write the snapshot taken at ``taken_at`` as newline-delimited JSON."""
+        for line in self.reconstruct(taken_at):
+            output.write(line)
+            output.write("\n")
+
+    def diff(self, before: datetime, after: datetime) -> HistoryDiff:
+        """How the tasks changed between two snapshots.
+
+        Only reads the versions that differ.
+        """
+        old = {entry.id: entry for entry in self.manifest(before)}
+        new = {entry.id: entry for entry in self.manifest(after)}
+        added = [task_id for task_id in new if task_id not in old]
+        removed = [task_id for task_id in old if task_id not in new]
+        changed = [
+            task_id for task_id in new if task_id in old and old[task_id].hash != new[task_id].hash
+        ]
+        return HistoryDiff(
+            added=self._load(new[task_id].location for task_id in added),
+            removed=self._load(old[task_id].location for task_id in removed),
+            changed=list(
+                zip(
+                    self._load(old[task_id].location for task_id in changed),
+                    self._load(new[task_id].location for task_id in changed),
+                )
+            ),
+        )
+
+    def _load(self, locations: Iterable[Location]) -> List[Dict[str, object]]:
+        return [json.loads(line) for line in self._read(locations)]
+
+    def _read(self, locations: Iterable[Location]) -> Iterator[str]:
+        packs: Dict[str, IO[bytes]] = {}
+        try:
+            for location in locations:
+                pack = packs.get(location.pack)
+                if pack is None:
+                    pack = packs[location.pack] = (self._packs / f"{location.pack}.pack").open("rb")
+                pack.seek(location.offset)
+                yield zlib.decompress(pack.read(location.length)).decode("utf-8")
+        finally:
+            for pack in packs.values():
+                pack.close()
+
+    def _load_versions(self) -> Dict[str, Location]:
+        versions = {}
+        if self._versions.exists():
+            with self._versions.open() as f:
+                for line in f:
+                    task_hash, pack, offset, length = line.rstrip("\n").split("\t")
+                    versions[task_hash] = Location(pack, int(offset), int(length))
+        return versions
+
+    def _manifest_path(self, name: str) -> Path:
+        return self._snapshots / f"{name}.tsv.gz"
+
+
+def _snapshot_lines(dump: Iterable[str], path: Path) -> Iterator[str]:
+    for line in dump:
+        line = line.rstrip("\n")
+        if '"deleted": ' in line and "deleted" in json.loads(line):
+            raise ValueError(f"{path} is a change log, not a snapshot")
+        yield line
+
+
+def parse_when(value: str) -> datetime:
+    """Parse a date, or a date and time, given on the command line.
+
+    A date on its own means the end of that day, so that it picks out the
+    last snapshot taken that day.
+    """
+    when = datetime.fromisoformat(value)
+    if len(value) == len("2020-09-01"):
+        when = when.replace(hour=23, minute=59, second=59)
+    return when
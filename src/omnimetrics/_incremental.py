@@ -0,0 +1,116 @@
+"""Export only the tasks that have changed since the last export."""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, FrozenSet, Iterable, Optional
+
+from omnimetrics._database import ReferenceCache, Task, load_extra_columns
+
+
+@dataclass(frozen=True)
+class Watermark:
+    """How far an incremental export has got.
+
+    ``modification_date`` is the latest modification date of any task we've
+    exported, and ``ids`` are the ids of every task that existed at the time.
+    """
+
+    modification_date: Optional[datetime]
+    ids: FrozenSet[str]
+
+    @classmethod
+    def load(cls, path: Path) -> Watermark:
+        """Load a watermark from ``path``.
+
+        If there's nothing at ``path``, we haven't exported anything yet, so
+        return a watermark that's older than every task.
+        """
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(modification_date=None, ids=frozenset())
+        modification_date = data["modification_date"]
+        return cls(
+            modification_date=(
+                None if modification_date is None else datetime.fromisoformat(modification_date)
+            ),
+            ids=frozenset(data["ids"]),
+        )
+
+    def save(self, path: Path) -> None:
+        """Save the watermark to ``path``, replacing whatever was there."""
+        data = {
+            "modification_date": (
+                None if self.modification_date is None else self.modification_date.isoformat()
+            ),
+            "ids": sorted(self.ids),
+        }
+        temp_path = path.with_name(path.name + ".tmp")
+        with temp_path.open("w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+
+@dataclass(frozen=True)
+class Changes:
+    """The changes to an OmniFocus database since some watermark.
+
+    ``upserts`` are loaded lazily, so iterate over them only once.
+    """
+
+    upserts: Iterable[Task]
+    deleted: FrozenSet[str]
+    watermark: Watermark
+
+
+def load_changes(
+    omni_database: Any, since: Watermark, references: Optional[ReferenceCache] = None
+) -> Changes:
+    """Load the tasks that have changed since the ``since`` watermark.
+
+    Costs three Apple Events to find out what has changed, and then one per
+    changed task, rather than one per task. If anything has changed, the
+    properties that a task's ``properties`` leaves out are fetched for every
+    task at once, for one more event each.
+
+    Tasks modified at exactly the watermark are exported again, so that we
+    don't miss any that changed within the same second as the last export.
+    Writing the same task twice is harmless.
+    """
+    if references is None:
+        references = ReferenceCache()
+    tasks = omni_database.flattened_tasks
+    specifiers = tasks()
+    ids = tasks.id()
+    modification_dates = tasks.modification_date()
+    changed = [
+        i
+        for i, (task_id, modified) in enumerate(zip(ids, modification_dates))
+        if task_id not in since.ids
+        or since.modification_date is None
+        or modified >= since.modification_date
+    ]
+    current_ids = frozenset(ids)
+    latest = max(modification_dates, default=None)
+    if latest is None or (since.modification_date and since.modification_date > latest):
+        # Never move the watermark backwards, e.g. if the newest task is deleted.
+        latest = since.modification_date
+    watermark = Watermark(modification_date=latest, ids=current_ids)
+    extras = load_extra_columns(tasks) if changed else {}
+    return Changes(
+        upserts=(
+            Task.from_omnifocus_task(
+                specifiers[i],
+                references,
+                {field: values[i] for field, values in extras.items()},
+            )
+            for i in changed
+        ),
+        deleted=since.ids - current_ids,
+        watermark=watermark,
+    )
@@ -0,0 +1,167 @@
+"""Metrics about each run of a command, for keeping an eye on scheduled jobs.
+
+A ``RunMetrics`` says how a run of e.g. ``omnimetrics dump`` went: whether it
+succeeded, how many tasks it extracted, how many bytes it wrote, how many
+Apple Events it sent, and how long each stage took. It can be written as a
+Prometheus textfile, for node exporter's textfile collector to pick up and
+alert on, and appended to a JSON run log, to see how runs change as the
+database grows.
+
+Both are replaced atomically, so nothing ever reads half of either.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from omnimetrics._profile import Profile
+
+# How many runs the run log keeps, dropping the oldest first. About three
+# years of nightly dumps.
+RUN_LOG_SIZE = 1000
+
+
+@dataclass
+class RunMetrics:
+    """How a run of ``command`` went.
+
+    Counts we don't know, e.g. the tasks in a dump read from the daemon, are
+    ``None``.
+    """
+
+    command: str
+    started_at: datetime
+    seconds: float = 0.0
+    succeeded: bool = False
+    tasks: Optional[int] = None
+    bytes_written: Optional[int] = None
+    events: Optional[int] = None
+    # How long each stage took, e.g. "extract", "serialize", "upload" and "load".
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def add_profile(self, profile: Profile) -> None:
+        """Take the tasks, Apple Events and stages from ``profile``.
+
+        Extracting and serialising tasks are interleaved, so the time spent
+        serialising is whatever the "dump" stage spent not extracting. When
+        the dump is streamed, uploading is interleaved too, so the "dump and
+        upload" stage also spent the "upload" time recorded on this run.
+        """
+        self.tasks = profile.counts.get("tasks", self.tasks)
+        self.events = profile.event_count
+        self.stages.update(profile.stages)
+        if "dump" in self.stages:
+            dumping: Optional[float] = self.stages["dump"]
+        elif "dump and upload" in self.stages and "upload" in self.stages:
+            dumping = self.stages["dump and upload"] - self.stages["upload"]
+        else:
+            dumping = None
+        if dumping is not None and "extract" in self.stages:
+            self.stages["serialize"] = max(0.0, dumping - self.stages["extract"])
+
+    def to_json(self) -> Dict[str, object]:
+        values = asdict(self)
+        values["started_at"] = self.started_at.isoformat()
+        return values
+
+
+# (name, help, how to get the value) for each metric with just a command label.
+_GAUGES = [
+    (
+        "omnimetrics_run_timestamp_seconds",
+        "When the last run started, in seconds since the epoch.",
+        lambda run: run.started_at.timestamp(),
+    ),
+    (
+        "omnimetrics_run_success",
+        "Whether the last run succeeded.",
+        lambda run: int(run.succeeded),
+    ),
+    (
+        "omnimetrics_run_duration_seconds",
+        "How long the last run took.",
+        lambda run: run.seconds,
+    ),
+    (
+        "omnimetrics_tasks_extracted",
+        "How many tasks the last run extracted.",
+        lambda run: run.tasks,
+    ),
+    (
+        "omnimetrics_bytes_written",
+        "How many bytes the last run wrote.",
+        lambda run: run.bytes_written,
+    ),
+    (
+        "omnimetrics_apple_events",
+        "How many Apple Events the last run sent to OmniFocus.",
+        lambda run: run.events,
+    ),
+]
+
+
+def prometheus_text(run: RunMetrics) -> str:
+    """``run`` in the Prometheus text exposition format.
+
+    Metrics we don't know the value of are left out.
+    """
+    command = _label_value(run.command)
+    lines: List[str] = []
+    for name, help_, get in _GAUGES:
+        value = get(run)
+        if value is None:
+            continue
+        lines.extend(_header(name, help_))
+        lines.append(f'{name}{{command="{command}"}} {value}')
+    if run.stages:
+        help_ = "How long each stage of the last run took."
+        lines.extend(_header("omnimetrics_stage_duration_seconds", help_))
+        for stage, seconds in run.stages.items():
+            lines.append(
+                f'omnimetrics_stage_duration_seconds{{command="{command}",'
+                f'stage="{_label_value(stage)}"}} {seconds}'
+            )
+    return "".join(line + "\n" for line in lines)
+
+
+def _header(name: str, help_: str) -> Tuple[str, str]:
+    return f"# HELP {name} {help_}", f"# TYPE {name} gauge"
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_textfile(path: Path, run: RunMetrics) -> None:
+    """Replace the Prometheus textfile at ``path`` with the metrics of ``run``.
+
+    Node exporter only reads files ending in ``.prom``, so give ``path`` a
+    name like that, and use a file of its own for each command.
+    """
+    _replace(path, prometheus_text(run))
+
+
+def append_run_log(path: Path, run: RunMetrics, size: int = RUN_LOG_SIZE) -> None:
+    """Add ``run`` to the newline-delimited JSON log at ``path``.
+
+    Keeps only the ``size`` most recent runs.
+    """
+    try:
+        with path.open() as log:
+            lines = [line for line in log if line.strip()]
+    except FileNotFoundError:
+        lines = []
+    lines.append(json.dumps(run.to_json()) + "\n")
+    first = max(0, len(lines) - size)
+    _replace(path, "".join(lines[first:]))
+
+
+def _replace(path: Path, text: str) -> None:
+    temp_path = path.with_name(path.name + ".tmp")
+    with temp_path.open("w") as f:
+        f.write(text)
+    os.replace(temp_path, path)
@@ -0,0 +1,252 @@
+"""Extract tasks a page at a time, so that an interrupted extraction can resume.
+
+``load_tasks`` and ``load_tasks_bulk`` ask about every task at once. If
+OmniFocus times out, or is too busy to answer, partway through, everything
+read so far is lost. ``extract_pages`` asks about a range of tasks at a time,
+e.g. ``flattened_tasks[1:500]``, and saves each page to a checkpoint as soon
+as it has it. If it's interrupted, running it again with the same checkpoint
+picks up from the first page it doesn't have.
+
+A page that times out is retried, smaller, after a pause. Pages grow while
+OmniFocus answers quickly, and shrink when it doesn't. So however big the
+database, we only hold one page in memory, and a failure only costs a page.
+
+A checkpoint is a directory::
+
+    state.json            which tasks we're extracting, and which pages we have
+    pages/<start>.json    the tasks in each page, as newline-delimited JSON
+
+Tasks are paged by their index in ``flattened_tasks``, so a checkpoint is only
+good for as long as the tasks stay in the same order. If tasks are added,
+removed, or moved in between runs, the next run starts again from scratch.
+
+Tasks can also be edited without moving, and the pages we already have won't
+show that. So a checkpoint is only good for ``max_age`` after it was started,
+a few hours by default. After that, the next run starts again from scratch
+too, rather than mixing tasks from one day with tasks from the next.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from omnimetrics._database import Task, load_task_elements
+from omnimetrics._formats import deserialize_task, write_json
+
+# Apple Event errors that are worth retrying: the event timed out
+# (errAETimeout), or OmniFocus went away while we were waiting
+# (connectionInvalid).
+RETRYABLE_ERRORS = frozenset([-1712, -609])
+
+# How long a checkpoint is good for, unless told otherwise.
+DEFAULT_MAX_AGE = timedelta(hours=6)
+
+
+class DatabaseChanged(Exception):
+    """The tasks in OmniFocus changed order while we were extracting them."""
+
+
+class PageSizer:
+    """Decides how many tasks to ask for at once.
+
+    Doubles the page while pages take less than half of ``target_seconds``,
+    and halves it when they take longer than that, or time out.
+    """
+
+    def __init__(
+        self,
+        size: int = 500,
+        minimum: int = 10,
+        maximum: int = 20_000,
+        target_seconds: float = 5.0,
+    ) -> None:
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+
+    def succeeded(self, seconds: float) -> None:
+        if seconds < self.target_seconds / 2:
+            self.size = min(self.maximum, self.size * 2)
+        elif seconds > self.target_seconds:
+            self.shrink()
+
+    def shrink(self) -> None:
+        self.size = max(self.minimum, self.size // 2)
+
+
+class Checkpoint:
+    """The pages of an extraction that we have so far, in ``directory``.
+
+    Pages started more than ``max_age`` ago are thrown away when we resume.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_age: timedelta = DEFAULT_MAX_AGE,
+        now: Callable[[], datetime] = datetime.now,
+    ) -> None:
+        self.directory = directory
+        self.max_age = max_age
+        self._now = now
+        self._state_path = directory / "state.json"
+        self._pages = directory / "pages"
+
+    def resume(self, ids: List[str]) -> int:
+        """Get ready to extract the tasks with ``ids``, in order.
+
+        Returns the index of the first task we don't have yet, counting from
+        1. Starts again if the checkpoint is for different tasks, or is too
+        old.
+        """
+        digest = _ids_digest(ids)
+        state = self._load_state()
+        if state is None or state["ids"] != digest or self._expired(state):
+            self.clear()
+            self._pages.mkdir(parents=True)
+            state = {
+                "ids": digest,
+                "tasks": len(ids),
+                "started_at": self._now().isoformat(),
+                "pages": [],
+            }
+            self._save_state(state)
+        pages = state["pages"]
+        return pages[-1][1] + 1 if pages else 1
+
+    def __len__(self) -> int:
+        """How many tasks we have so far."""
+        state = self._load_state()
+        return sum(end - start + 1 for start, end in state["pages"]) if state else 0
+
+    def add_page(self, start: int, end: int, tasks: List[Task]) -> None:
+        """Save the tasks from ``start`` to ``end``, which come after those we have."""
+        path = self._page_path(start)
+        temp_path = path.with_name(path.name + ".tmp")
+        with temp_path.open("w") as f:
+            write_json(tasks, f)
+        os.replace(temp_path, path)
+        state = self._load_state()
+        assert state is not None, "Call resume first"
+        state["pages"].append([start, end])
+        self._save_state(state)
+
+    def copy_to(self, output: IO[str]) -> None:
+        """Write every task we have to ``output``, as newline-delimited JSON."""
+        for path in self._page_paths():
+            with path.open() as page:
+                shutil.copyfileobj(page, output)
+
+    def tasks(self) -> Iterator[Task]:
+        """Every task we have, in order."""
+        for path in self._page_paths():
+            with path.open() as page:
+                for line in page:
+                    yield deserialize_task(json.loads(line))
+
+    def clear(self) -> None:
+        """Throw away the checkpoint, e.g. once what we extracted is safely stored."""
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+
+    def _expired(self, state: Dict[str, Any]) -> bool:
+        # Checkpoints from before we recorded when they started are too old.
+        if "started_at" not in state:
+            return True
+        return self._now() - datetime.fromisoformat(state["started_at"]) > self.max_age
+
+    def _page_paths(self) -> Iterator[Path]:
+        state = self._load_state()
+        for start, _ in state["pages"] if state else []:
+            yield self._page_path(start)
+
+    def _page_path(self, start: int) -> Path:
+        return self._pages / f"{start:09d}.json"
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with self._state_path.open() as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        temp_path = self._state_path.with_name(self._state_path.name + ".tmp")
+        with temp_path.open("w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self._state_path)
+
+
+def _ids_digest(ids: List[str]) -> str:
+    return hashlib.blake2b("\n".join(ids).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def extract_pages(
+    omni_database: Any,
+    checkpoint: Checkpoint,
+    sizer: Optional[PageSizer] = None,
+    max_retries: int = 5,
+    backoff_seconds: float = 1.0,
+    sleep: Callable[[float], None] = time.sleep,
+    echo: Callable[[str], None] = lambda message: None,
+) -> Checkpoint:
+    """Extract every task into ``checkpoint``, carrying on from where it stopped.
+
+    A page that fails with one of ``RETRYABLE_ERRORS`` is retried, smaller,
+    after waiting ``backoff_seconds``, and twice as long after each failure
+    in a row. Gives up after ``max_retries`` failures in a row.
+
+    Raises ``DatabaseChanged`` if the tasks change order partway through.
+    Running again will start from scratch.
+    """
+    if sizer is None:
+        sizer = PageSizer()
+    tasks = omni_database.flattened_tasks
+
+    def retrying(fetch: Callable[[], Any]) -> Any:
+        failures = 0
+        while True:
+            try:
+                result = fetch()
+            except Exception as e:
+                if getattr(e, "errornumber", None) not in RETRYABLE_ERRORS:
+                    raise
+                failures += 1
+                if failures > max_retries:
+                    raise
+                sizer.shrink()
+                wait = backoff_seconds * 2 ** (failures - 1)
+                echo(f"{e}; retrying in {wait:.0f}s with pages of {sizer.size}")
+                sleep(wait)
+                continue
+            return result
+
+    ids = retrying(tasks.id)
+    start = checkpoint.resume(ids)
+    if start > 1:
+        echo(f"Resuming from task {start} of {len(ids)}")
+    while start <= len(ids):
+
+        def fetch_page() -> Tuple[int, List[Task]]:
+            end = min(len(ids), start + sizer.size - 1)
+            began = time.perf_counter()
+            page = list(load_task_elements(tasks[start:end]))
+            sizer.succeeded(time.perf_counter() - began)
+            return end, page
+
+        end, page = retrying(fetch_page)
+        first = start - 1
+        if [task.id for task in page] != ids[first:end]:
+            raise DatabaseChanged(
+                f"Tasks {start} to {end} have changed since we started. Try again."
+            )
+        checkpoint.add_page(start, end, page)
+        start = end + 1
+    return checkpoint
@@ -3,17 +3,34 @@
 Command-line tool that shows exactly one OmniFocus task to do.
 """
 
-import time
+import heapq
+import itertools
+import json
+import os
 from dataclasses import dataclass
-from typing import Any
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from Foundation import NSURL
-from ScriptingBridge import SBApplication
+from omnimetrics._database import resolve_missing_value
 
-omniFocus = SBApplication.applicationWithURL_(
-    NSURL.URLWithString_("file:///Applications/OmniFocus.app")
-)
-taskClass = omniFocus.classForScriptingClass_("task")
+
+@lru_cache(maxsize=None)
+def omniFocus():  # pragma: no cover
+    """Connect to OmniFocus through ScriptingBridge, the first time we need it."""
+    from Foundation import NSURL
+    from ScriptingBridge import SBApplication
+
+    return SBApplication.applicationWithURL_(
+        NSURL.URLWithString_("file:///Applications/OmniFocus.app")
+    )
+
+
+@lru_cache(maxsize=None)
+def taskClass():  # pragma: no cover
+    """The ScriptingBridge class of OmniFocus tasks."""
+    return omniFocus().classForScriptingClass_("task")
 
 
 def itemsInView():  # pragma: no cover
@@ -24,7 +41,7 @@ def itemsInView():  # pragma: no cover
 
     XXX: Which window?
     """
-    content = omniFocus.defaultDocument().documentWindows()[0].content()
+    content = omniFocus().defaultDocument().documentWindows()[0].content()
     for element in content.leaves():
         # XXX: Still unsure of the distinction between `.value()` and `.get()`
         yield element.value()
@@ -32,7 +49,7 @@ def itemsInView():  # pragma: no cover
 
 def isTask(item):  # pragma: no cover
     """Is the given item an OmniFocus task?"""
-    return item.isKindOfClass_(taskClass)
+    return item.isKindOfClass_(taskClass())
 
 
 def tasksInView():  # pragma: no cover
@@ -85,28 +102,313 @@ class DeferredTask:
     reason: Any
 
 
-def attempt(task):  # pragma: no cover
-    """Offer the user a single task to perform."""
-    ui = UI()
-    clock = time
+# How many times a task can be deferred before we suggest giving up on it.
+EXCUSE_LIMIT = 3
+
+
+def taskIdOf(task):
+    """The id of a task, which might be a task or already be its id."""
+    return task if isinstance(task, str) else task.id()
+
+
+class AttemptLog:
+    """An append-only log of every attempt at every task, and every excuse.
+
+    The log is newline-delimited JSON, one record per line::
+
+        {"task": "abc", "event": "deferred", "time": "...", "reason": "..."}
+
+    Alongside it is an index with a line for each record: the task's id, the
+    kind of event, and where the record is in the log. The index is read
+    when the log is opened, so finding a task's records means reading just
+    those records, however long the log gets.
+
+    Records are written to the log before the index. If the index is missing,
+    or is missing the last few records (e.g. after a crash), it's rebuilt from
+    the log when the log is opened.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.indexPath = path.with_name(path.name + ".idx")
+        self._index: Dict[str, List[Tuple[str, int, int]]] = {}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._log = path.open("ab+")
+        indexed, validBytes = self._loadIndex()
+        self._indexFile = self.indexPath.open("a", encoding="utf-8")
+        self._indexFile.truncate(validBytes)
+        self._catchUp(indexed)
+
+    def close(self):
+        self._log.close()
+        self._indexFile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def record(self, outcome, when=None):
+        """Log what happened when we offered a task.
+
+        ``outcome`` is what ``attempt`` returned, or a ``StartedTask``.
+        ``when`` defaults to now, for outcomes that don't say when they
+        happened.
+        """
+        taskId = taskIdOf(outcome.task)
+        if isinstance(outcome, DeferredTask):
+            event = {"event": "deferred", "time": when or datetime.now(), "reason": outcome.reason}
+        elif isinstance(outcome, StartedTask):
+            event = {"event": "started", "time": outcome.startTime}
+        elif isinstance(outcome, CompletedTask):
+            event = {"event": "completed", "time": outcome.endTime, "start": outcome.startTime}
+        elif isinstance(outcome, Task):
+            event = {"event": "abandoned", "time": when or datetime.now()}
+        else:
+            raise TypeError(f"Cannot log {outcome!r}")
+        self._append(taskId, event)
+
+    def attempts(self, taskId):
+        """Everything that's happened to a task, oldest first."""
+        return [self._read(offset, length) for _, offset, length in self._index.get(taskId, [])]
+
+    def excuses(self, taskId):
+        """Why we didn't do a task, every time we didn't, oldest first."""
+        return [
+            self._read(offset, length)["reason"]
+            for event, offset, length in self._index.get(taskId, [])
+            if event == "deferred"
+        ]
+
+    def _append(self, taskId, event):
+        record = {"task": taskId}
+        for key, value in event.items():
+            record[key] = value.isoformat() if isinstance(value, datetime) else value
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        self._log.seek(0, os.SEEK_END)
+        offset = self._log.tell()
+        self._log.write(line)
+        self._log.flush()
+        self._addToIndex(taskId, record["event"], offset, len(line))
+
+    def _read(self, offset, length):
+        self._log.seek(offset)
+        return json.loads(self._log.read(length))
+
+    def _addToIndex(self, taskId, event, offset, length):
+        self._index.setdefault(taskId, []).append((event, offset, length))
+        self._indexFile.write(f"{taskId}\t{event}\t{offset}\t{length}\n")
+        self._indexFile.flush()
+
+    def _loadIndex(self):
+        """Load the index.
+
+        Returns how much of the log it covers, and how much of the index is
+        whole lines.
+        """
+        indexed = validBytes = 0
+        if not self.indexPath.exists():
+            return indexed, validBytes
+        with self.indexPath.open("rb") as index:
+            for line in index:
+                if not line.endswith(b"\n"):
+                    # Torn write. Anything after this gets indexed again.
+                    break
+                taskId, event, offset, length = line.decode("utf-8").rstrip("\n").split("\t")
+                self._index.setdefault(taskId, []).append((event, int(offset), int(length)))
+                indexed = int(offset) + int(length)
+                validBytes += len(line)
+        return indexed, validBytes
+
+    def _catchUp(self, indexed):
+        """Index any records in the log after ``indexed``."""
+        self._log.seek(indexed)
+        offset = indexed
+        for line in self._log:
+            if not line.endswith(b"\n"):
+                # Torn write. Drop it, so the next record starts a new line.
+                self._log.truncate(offset)
+                break
+            record = json.loads(line)
+            self._addToIndex(record["task"], record["event"], offset, len(line))
+            offset += len(line)
+
+
+def attempt(task, hierarchy=None, log=None, ui=None, clock=datetime):
+    """Offer the user a single task to perform.
+
+    If given a ``Hierarchy`` of tasks, use it to name the task. If given an
+    ``AttemptLog``, show past excuses for the task, and log what happens.
+    ``ui`` is how we talk to the user, and defaults to the terminal.
+    """
+    if ui is None:
+        ui = UI(hierarchy, log)
 
     t = Task(task)
     wantToAttempt = ui.offerTask(task)
     if not wantToAttempt:
-        # TODO: Do something with `reason`.
         reason = ui.requestReasonForDeferral(task)
-        return t.defer(reason)
-    # TODO: timer & completion logic
-    started = t.start(clock.now())
+        return _logged(log, t.defer(reason))
+    started = _logged(log, t.start(clock.now()))
     result = ui.waitUntilDone(task)
     if result == 'done':
-        return started.complete(clock.now())
+        return _logged(log, started.complete(clock.now()))
     elif result == 'abandoned':
-        return started.abandon()
+        return _logged(log, started.abandon())
     else:
         raise ValueError('Unexpected response from UI (%r): %r' % (ui, result))
 
 
+def _logged(log, outcome):
+    if log is not None:
+        log.record(outcome)
+    return outcome
+
+
+@dataclass(frozen=True)
+class Availability:
+    """Whether a task could be worked on, as of when we last looked."""
+
+    taskId: str
+    modified: datetime
+    available: bool
+
+
+def pollAvailability(document, now):
+    """Find out which tasks are available, without reading every task.
+
+    Sends the same six Apple Events however many tasks there are, each of
+    which gets one property of every task.
+    """
+    tasks = document.flattened_tasks
+    columns = zip(
+        tasks.id(),
+        tasks.modification_date(),
+        tasks.blocked(),
+        tasks.effectively_completed(),
+        tasks.effectively_dropped(),
+        tasks.effective_defer_date(),
+    )
+    return [
+        Availability(
+            taskId=taskId,
+            modified=modified,
+            available=not (blocked or completed or dropped)
+            and (resolve_missing_value(deferUntil) is None or deferUntil <= now),
+        )
+        for taskId, modified, blocked, completed, dropped, deferUntil in columns
+    ]
+
+
+class Scheduler:
+    """Decides which task to offer next.
+
+    Keeps the available tasks in a priority queue. Tasks that were available
+    from the start are offered in database order. Tasks that become available
+    later jump to the front of the queue, most recent first, so that we can
+    flow from one task to the next. Deferred or abandoned tasks go to the back,
+    and only come round again once everything else has been done or deferred,
+    in the next round.
+
+    ``update`` only does work for the tasks whose availability has changed,
+    and choosing the next task takes O(log n) time.
+    """
+
+    def __init__(self):
+        self.round = 0
+        # Entries are [round, priority, order, count, taskId]. Entries that
+        # are no longer wanted have their taskId set to None, and are skipped.
+        # The count is unique, so comparing entries never gets to the taskId.
+        self._queue: List[List[Any]] = []
+        self._entries: Dict[str, List[Any]] = {}
+        self._known: Dict[str, Availability] = {}
+        self._order: Dict[str, int] = {}
+        self._started = set()
+        self._deferred = set()
+        self._arrivals = itertools.count(1)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, availabilities: Iterable[Availability]) -> None:
+        """Bring the queue up to date with what's available now."""
+        first = not self._known
+        seen = set()
+        for availability in availabilities:
+            taskId = availability.taskId
+            seen.add(taskId)
+            previous = self._known.get(taskId)
+            if previous == availability:
+                continue
+            self._known[taskId] = availability
+            self._order.setdefault(taskId, len(self._order))
+            wasAvailable = previous is not None and previous.available
+            if not availability.available:
+                self._deferred.discard(taskId)
+                self._remove(taskId)
+            elif not wasAvailable and taskId not in self._started:
+                # Becoming available again clears any deferral.
+                self._deferred.discard(taskId)
+                self._push(taskId, self.round, 0 if first else -next(self._arrivals))
+        for taskId in set(self._known) - seen:
+            del self._known[taskId]
+            self._deferred.discard(taskId)
+            self._remove(taskId)
+
+    def nextTask(self) -> Optional[Task]:
+        """The task to offer next, or ``None`` if this round is done."""
+        while self._queue:
+            entryRound, _, _, _, taskId = self._queue[0]
+            if taskId is None:
+                heapq.heappop(self._queue)
+                continue
+            if entryRound > self.round:
+                return None
+            return Task(taskId)
+        return None
+
+    def record(self, outcome: Any) -> None:
+        """Record what happened when we offered a task.
+
+        ``outcome`` is what ``attempt`` returned, or a ``StartedTask`` while
+        the task is being worked on.
+        """
+        taskId = outcome.task
+        if isinstance(outcome, StartedTask):
+            self._started.add(taskId)
+            self._remove(taskId)
+            return
+        self._started.discard(taskId)
+        if isinstance(outcome, CompletedTask):
+            self._remove(taskId)
+        else:
+            # Deferred, or abandoned after starting.
+            self._deferred.add(taskId)
+            self._push(taskId, self.round + 1, 0)
+
+    def hasDeferred(self) -> bool:
+        """Are there any deferred tasks waiting for another round?"""
+        return bool(self._deferred)
+
+    def startNextRound(self) -> None:
+        """Go round again, offering the deferred tasks."""
+        self.round += 1
+        self._deferred.clear()
+
+    def _push(self, taskId: str, entryRound: int, priority: int) -> None:
+        self._remove(taskId)
+        entry = [entryRound, priority, self._order[taskId], next(self._counter), taskId]
+        self._entries[taskId] = entry
+        heapq.heappush(self._queue, entry)
+
+    def _remove(self, taskId: str) -> None:
+        entry = self._entries.pop(taskId, None)
+        if entry is not None:
+            entry[-1] = None
+
+
 def qualifiedName(task):  # pragma: no cover
     """Return the full name of a task, including any projects that it's in.
 
@@ -125,14 +427,43 @@ def iterParents(task):  # pragma: no cover
         eachTask = eachTask.parentTask().get()
 
 
-def showTask(task):  # pragma: no cover
-    """Show a task to the end-user."""
+def showTask(task, hierarchy=None):
+    """Show a task to the end-user.
+
+    Looks up the task's name in ``hierarchy``, if we have one, rather than
+    asking OmniFocus for the names of all of its parents.
+    """
+    if hierarchy is not None:
+        # We might only have the task's id, e.g. from a ``Scheduler``.
+        taskId = taskIdOf(task)
+        if taskId in hierarchy:
+            return hierarchy.qualified_name(taskId)
+        if isinstance(task, str):
+            return taskId
     return qualifiedName(task)
 
 
+def showExcuses(excuses):
+    """Show the end-user why they didn't do a task before, if they didn't."""
+    lines = [f"  - {excuse}" for excuse in excuses]
+    if lines:
+        lines.insert(0, "Previous excuses:")
+    if len(excuses) >= EXCUSE_LIMIT:
+        lines.append("That's a lot of excuses. Maybe drop this task?")
+    return "\n".join(lines)
+
+
 class UI:
+    def __init__(self, hierarchy=None, log=None):
+        self.hierarchy = hierarchy
+        self.log = log
+
     def offerTask(self, task):
-        print(showTask(task))
+        print(showTask(task, self.hierarchy))
+        if self.log is not None:
+            excuses = showExcuses(self.log.excuses(taskIdOf(task)))
+            if excuses:
+                print(excuses)
         wantToAttempt = None
         while wantToAttempt is None:
             wantToAttempt = parseYesNo(input("Do this now? (y/n) "))
@@ -144,6 +475,13 @@ class UI:
             reason = input("Why not? ").strip()
         return reason
 
+    def waitUntilDone(self, task):
+        """Wait while the user works on a task, then ask how it went."""
+        result = None
+        while result is None:
+            result = parseDoneOrAbandoned(input("Done, or abandoned? (d/a) "))
+        return result
+
 
 def parseYesNo(response):
     """Take a response from a user and interpret it as either 'yes' or 'no'.
@@ -159,3 +497,14 @@ def parseYesNo(response):
     if first == "n":  # pragma: no cover
         return False
     return None  # pragma: no cover
+
+
+def parseDoneOrAbandoned(response):
+    """Interpret what a user said about a task they started.
+
+    Returns 'done', 'abandoned', or ``None`` if we can't tell which.
+    """
+    response = response.strip()
+    if not response:
+        return None
+    return {"d": "done", "a": "abandoned"}.get(response[0].lower())
@@ -0,0 +1,194 @@
+"""Find out where the time goes when we talk to OmniFocus.
+
+``instrument`` wraps an appscript app or a ScriptingBridge object so that every
+round trip to OmniFocus made through it is counted and timed in a ``Profile``,
+keyed by the command or property that was asked for. A ``Profile`` also times
+the stages of a pipeline, and counts things, e.g. the tasks it extracted.
+"""
+from __future__ import annotations
+
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class EventStats:
+    """How many times we sent an event, and how long they took in total."""
+
+    count: int = 0
+    seconds: float = 0.0
+
+
+class Profile:
+    """Timings of Apple Events and of pipeline stages, and counts of things."""
+
+    def __init__(self) -> None:
+        self.events: Dict[str, EventStats] = {}
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def record_event(self, name: str, seconds: float) -> None:
+        stats = self.events.setdefault(name, EventStats())
+        stats.count += 1
+        stats.seconds += seconds
+
+    @property
+    def event_count(self) -> int:
+        return sum(stats.count for stats in self.events.values())
+
+    @property
+    def event_seconds(self) -> float:
+        return sum(stats.seconds for stats in self.events.values())
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def counted(self, name: str, items: Iterable[T], stage: str) -> Iterator[T]:
+        """Count ``items`` as ``name`` as we go, timing getting each as ``stage``.
+
+        e.g. to time extracting tasks separately from writing them out.
+        """
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+            self.count(name)
+            yield item
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the code in the ``with`` block as the stage ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "stages": dict(self.stages),
+            "counts": dict(self.counts),
+            "events": {
+                name: {"count": stats.count, "seconds": stats.seconds}
+                for name, stats in self.events.items()
+            },
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as output:
+            json.dump(self.to_json(), output, indent=2)
+
+    def report(self) -> str:
+        """A breakdown of where the time went, for humans."""
+        lines = ["Stages:"]
+        for name, seconds in self.stages.items():
+            lines.append(f"  {name:<48} {seconds:>9.3f}s")
+        for name, count in self.counts.items():
+            lines.append(f"Count of {name}: {count}")
+        lines.append(f"Apple Events: {self.event_count} in {self.event_seconds:.3f}s")
+        by_time = sorted(self.events.items(), key=lambda item: item[1].seconds, reverse=True)
+        for name, stats in by_time:
+            each = stats.seconds / stats.count * 1000
+            lines.append(
+                f"  {name:<48} {stats.count:>9} {stats.seconds:>9.3f}s {each:>8.2f}ms each"
+            )
+        return "\n".join(lines)
+
+
+# Values that come back from OmniFocus as plain data, rather than as references
+# to more objects in OmniFocus.
+_DATA = (str, bytes, int, float, bool, date, datetime, type(None))
+
+
+class Instrumented:
+    """A reference to something in OmniFocus, which times each round trip.
+
+    Works for both appscript references and ScriptingBridge objects. For both,
+    getting an attribute is local, and calling it (almost always) talks to
+    OmniFocus, so we count every call as a round trip. Whatever comes back is
+    instrumented too.
+    """
+
+    def __init__(self, target: Any, profile: Profile, path: Tuple[str, ...] = ()) -> None:
+        self._target = target
+        self._profile = profile
+        self._path = path
+
+    def __getattr__(self, name: str) -> Instrumented:
+        return Instrumented(getattr(self._target, name), self._profile, self._path + (name,))
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = self._target(*args, **kwargs)
+        finally:
+            self._profile.record_event(_event_name(self._path), time.perf_counter() - start)
+        return _instrument(result, self._profile, self._path)
+
+    def __getitem__(self, key: Any) -> Any:
+        return _instrument(self._target[key], self._profile, self._path + ("[]",))
+
+    def __iter__(self) -> Iterator[Any]:
+        for item in self._target:
+            yield _instrument(item, self._profile, self._path + ("[]",))
+
+    def __len__(self) -> int:
+        return len(self._target)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Instrumented):
+            other = other._target
+        return bool(self._target == other)
+
+    def __hash__(self) -> int:
+        return hash(self._target)
+
+    def __repr__(self) -> str:
+        return f"<Instrumented {self._target!r}>"
+
+
+def instrument(target: Any, profile: Profile) -> Any:
+    """Count and time every round trip to OmniFocus made through ``target``."""
+    return Instrumented(target, profile)
+
+
+def _instrument(value: Any, profile: Profile, path: Tuple[str, ...]) -> Any:
+    if isinstance(value, _DATA):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_instrument(item, profile, path + ("[]",)) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: _instrument(item, profile, (getattr(key, "name", str(key)),))
+            for key, item in value.items()
+        }
+    return Instrumented(value, profile, path)
+
+
+def _event_name(path: Tuple[str, ...]) -> str:
+    """Name an event after the last couple of steps it took to get there.
+
+    e.g. ``flattened_tasks.name``, or ``parent_task.id``.
+    """
+    parts = []
+    element = False
+    for part in reversed(path):
+        if part == "[]":
+            element = True
+            continue
+        parts.append(part + "[]" if element else part)
+        element = False
+        if len(parts) == 2:
+            break
+    return ".".join(reversed(parts))
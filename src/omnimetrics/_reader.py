@@ -0,0 +1,120 @@
+"""Read many JSON dumps at once, on a pool of processes.
+
+Parsing a dump is nearly all ``json.loads``, which holds the GIL, so unlike
+extracting from OmniFocus, threads don't help. ``read_dumps`` parses each
+dump in a worker process of its own, into a ``DumpColumns``: one tuple of
+values per column, with repeated strings (e.g. the names of projects and
+tags) shared, so that sending it back to us is cheap.
+
+Results come back in the order the dumps were taken, whichever worker
+finishes first. Only a few dumps are parsed ahead of the one we're waiting
+for, so memory use doesn't grow with the number of dumps.
+"""
+from __future__ import annotations
+
+import json
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from omnimetrics._formats import TASK_SCHEMA, dump_taken_at, flatten
+
+# Every column of a task, with references flattened, e.g. ``containing_project.name``.
+TASK_COLUMNS = tuple(path for path, _ in flatten(TASK_SCHEMA))
+
+_TYPES = {path: field.type for path, field in flatten(TASK_SCHEMA)}
+
+
+@dataclass(frozen=True)
+class DumpColumns:
+    """The tasks in a dump, a column at a time.
+
+    Tombstones are left out, if the dump is a change log.
+    """
+
+    path: Path
+    taken_at: datetime
+    names: Tuple[str, ...]
+    columns: Tuple[Tuple[Any, ...], ...]
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name: str) -> Tuple[Any, ...]:
+        return self.columns[self.names.index(name)]
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        """The tasks, as tuples of the values in ``names``."""
+        return zip(*self.columns)
+
+
+def read_dump(
+    path: Path, taken_at: Optional[datetime] = None, names: Sequence[str] = TASK_COLUMNS
+) -> DumpColumns:
+    """Read the columns ``names`` of the tasks in the dump at ``path``.
+
+    Unless given, the time the dump was taken comes from its name, or when it
+    was last modified.
+    """
+    if taken_at is None:
+        taken_at = dump_taken_at(path)
+    with path.open() as dump:
+        rows = [json.loads(line) for line in dump if line != "\n"]
+    rows = [row for row in rows if not row.get("deleted")]
+    columns = tuple(_read_column(rows, name) for name in names)
+    return DumpColumns(path, taken_at, tuple(names), columns)
+
+
+def _read_column(rows: List[Dict[str, Any]], name: str) -> Tuple[Any, ...]:
+    if "." in name:
+        record, field = name.split(".")
+        references = [row.get(record) for row in rows]
+        values = [None if ref is None else ref.get(field) for ref in references]
+    else:
+        values = [row.get(name) for row in rows]
+    if _TYPES[name] == "STRING":
+        # Share equal strings, which pickle then only sends once.
+        share = {}.setdefault
+        values = [share(value, value) for value in values]
+    return tuple(values)
+
+
+def read_dumps(
+    paths: Iterable[Path],
+    workers: Optional[int] = None,
+    names: Sequence[str] = TASK_COLUMNS,
+    ahead: Optional[int] = None,
+) -> Iterator[DumpColumns]:
+    """Read the dumps at ``paths`` on ``workers`` processes, oldest first.
+
+    ``workers`` defaults to the number of CPUs. With one worker, reads the
+    dumps in this process, one at a time. Otherwise, reads at most ``ahead``
+    dumps (by default, twice the number of workers) beyond the one we're
+    waiting for.
+    """
+    dumps = sorted((dump_taken_at(path), path) for path in paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for taken_at, path in dumps:
+            yield read_dump(path, taken_at, names)
+        return
+    if ahead is None:
+        ahead = 2 * workers
+    pending: Deque[Future[DumpColumns]] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for taken_at, path in dumps:
+                pending.append(pool.submit(read_dump, path, taken_at, tuple(names)))
+                if len(pending) > ahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # If we stopped early, don't wait for dumps no one will read.
+            for future in pending:
+                future.cancel()
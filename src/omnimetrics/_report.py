@@ -0,0 +1,274 @@
+"""How much I've added, completed and taken on, from a history of daily dumps.
+
+These are the questions from the README: did I have a productive day or week,
+was it a winning one (more completed than added), and have I taken too much
+on?
+
+``load_history`` reads the latest dump of each day. Consecutive dumps are
+mostly the same, so it only decodes lines that weren't in the day before. A
+``SnapshotHistory`` stores each distinct version of a task once, as columns,
+and each snapshot as the indices of the versions in it. Everything after
+loading works on whole arrays at once, rather than looping over tasks.
+
+Loading still reads every line of every dump, so it's what takes the time: a
+year of dumps of 50,000 tasks takes about a minute, against a second or two
+for the series. ``benchmarks/bench_report.py`` measures both.
+
+Needs NumPy. Install ``omnimetrics[analysis]`` to get it.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from omnimetrics._backfill import Dump
+from omnimetrics._table import NO_INTEGER
+
+# The columns of ``Throughput.rows``.
+THROUGHPUT_COLUMNS = [
+    "period",
+    "added",
+    "completed",
+    "dropped",
+    "net",
+    "winning",
+    "open",
+    "open_minutes",
+]
+
+
+@dataclass(frozen=True)
+class Versions:
+    """Distinct versions of tasks, one per row."""
+
+    # Which task each version is of, numbered from 0.
+    task: np.ndarray
+    created: np.ndarray
+    completed: np.ndarray
+    dropped: np.ndarray
+    # ``NO_INTEGER`` if there's no estimate.
+    estimated_minutes: np.ndarray
+    # Neither completed nor dropped, even effectively.
+    open: np.ndarray
+
+
+@dataclass(frozen=True)
+class SnapshotHistory:
+    """The latest snapshot of each of a run of days.
+
+    The tasks in snapshot ``i`` are the versions in
+    ``rows[offsets[i]:offsets[i + 1]]``.
+    """
+
+    days: np.ndarray
+    offsets: np.ndarray
+    rows: np.ndarray
+    versions: Versions
+
+    def latest_versions(self) -> np.ndarray:
+        """The last version we saw of each task, even if it was later deleted."""
+        tasks = self.versions.task[self.rows]
+        _, last = np.unique(tasks[::-1], return_index=True)
+        return self.rows[len(tasks) - 1 - last]
+
+    def open_tasks(self) -> np.ndarray:
+        """How many tasks were open in each snapshot."""
+        return self._per_snapshot(self.versions.open[self.rows])
+
+    def open_minutes(self) -> np.ndarray:
+        """The estimated minutes of the open tasks in each snapshot."""
+        minutes = self.versions.estimated_minutes
+        open_minutes = np.where(self.versions.open & (minutes != NO_INTEGER), minutes, 0)
+        return self._per_snapshot(open_minutes[self.rows])
+
+    def _per_snapshot(self, values: np.ndarray) -> np.ndarray:
+        # Unlike ``np.add.reduceat``, copes with empty snapshots.
+        totals = np.concatenate([[0], np.cumsum(values, dtype=np.int64)])
+        return totals[self.offsets[1:]] - totals[self.offsets[:-1]]
+
+
+class _VersionBuilder:
+    """Decodes lines of dumps into versions, each distinct line once."""
+
+    def __init__(self) -> None:
+        self._task_numbers: Dict[str, int] = {}
+        self._columns: Dict[str, List[Any]] = {name: [] for name in Versions.__annotations__}
+        # The versions in the previous snapshot, and in this one so far, by line.
+        self._previous: Dict[str, int] = {}
+        self._current: Dict[str, int] = {}
+
+    def next_snapshot(self) -> None:
+        self._previous, self._current = self._current, {}
+
+    def version(self, line: str) -> int:
+        index = self._previous.get(line)
+        if index is None:
+            index = self._current.get(line)
+        if index is None:
+            index = self._decode(line)
+        self._current[line] = index
+        return index
+
+    def _decode(self, line: str) -> int:
+        row = json.loads(line)
+        if "deleted" in row:
+            raise ValueError("Can't report on change logs, only snapshots")
+        columns = self._columns
+        index = len(columns["task"])
+        columns["task"].append(self._task_numbers.setdefault(row["id"], len(self._task_numbers)))
+        columns["created"].append(row["creation_date"])
+        columns["completed"].append(row["completion_date"])
+        columns["dropped"].append(row["dropped_date"])
+        minutes = row["estimated_minutes"]
+        columns["estimated_minutes"].append(NO_INTEGER if minutes is None else minutes)
+        columns["open"].append(
+            not (row["is_effectively_completed"] or row["is_effectively_dropped"])
+        )
+        return index
+
+    def build(self) -> Versions:
+        columns = self._columns
+        return Versions(
+            task=np.array(columns["task"], dtype=np.int64),
+            # Copes with both ISO 8601 strings and ``None``.
+            created=np.array(columns["created"], dtype="datetime64[us]"),
+            completed=np.array(columns["completed"], dtype="datetime64[us]"),
+            dropped=np.array(columns["dropped"], dtype="datetime64[us]"),
+            estimated_minutes=np.array(columns["estimated_minutes"], dtype=np.int64),
+            open=np.array(columns["open"], dtype=bool),
+        )
+
+
+def load_history(dumps: Iterable[Dump]) -> SnapshotHistory:
+    """Load JSON dumps of tasks, at most one a day, oldest first.
+
+    e.g. as found by ``find_dumps``. Raises ``ValueError`` if any of them is
+    a change log.
+    """
+    builder = _VersionBuilder()
+    days = []
+    offsets = [0]
+    chunks = [np.empty(0, dtype=np.int64)]
+    for dump in dumps:
+        builder.next_snapshot()
+        with dump.path.open() as f:
+            chunk = np.fromiter(
+                (builder.version(line) for line in f if line != "\n"), dtype=np.int64
+            )
+        chunks.append(chunk)
+        days.append(dump.day)
+        offsets.append(offsets[-1] + len(chunk))
+    return SnapshotHistory(
+        days=np.array(days, dtype="datetime64[D]"),
+        offsets=np.array(offsets, dtype=np.int64),
+        rows=np.concatenate(chunks),
+        versions=builder.build(),
+    )
+
+
+@dataclass(frozen=True)
+class Throughput:
+    """How many tasks were added, completed and dropped in each of a run of periods.
+
+    ``open`` and ``open_minutes`` are as of the last snapshot in each period,
+    and are ``NO_INTEGER`` for periods without one.
+    """
+
+    # The first day of each period.
+    periods: np.ndarray
+    added: np.ndarray
+    completed: np.ndarray
+    dropped: np.ndarray
+    open: np.ndarray
+    open_minutes: np.ndarray
+
+    @property
+    def net(self) -> np.ndarray:
+        """How many more tasks were completed than added."""
+        return self.completed - self.added
+
+    @property
+    def winning(self) -> np.ndarray:
+        """Whether more tasks were completed than added."""
+        return self.completed > self.added
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        """One row per period, with ``THROUGHPUT_COLUMNS``."""
+        columns = [
+            self.periods.astype(str),
+            self.added.tolist(),
+            self.completed.tolist(),
+            self.dropped.tolist(),
+            self.net.tolist(),
+            self.winning.tolist(),
+            _nullable(self.open),
+            _nullable(self.open_minutes),
+        ]
+        return zip(*columns)
+
+
+def _nullable(values: np.ndarray) -> List[Any]:
+    return [None if value == NO_INTEGER else value for value in values.tolist()]
+
+
+def daily_throughput(history: SnapshotHistory) -> Throughput:
+    """What happened on each day from the first snapshot to the last.
+
+    ``history`` must have at least one snapshot.
+    Counts each task once, however many snapshots it's in, going by the last
+    version we saw of it. Tasks created before the first snapshot aren't
+    counted as added.
+    """
+    first = history.days[0]
+    num_days = int((history.days[-1] - first).astype(np.int64)) + 1
+    latest = history.latest_versions()
+    versions = history.versions
+
+    def per_day(dates: np.ndarray) -> np.ndarray:
+        days = dates[latest].astype("datetime64[D]")
+        known = ~np.isnat(days)
+        offsets = (days[known] - first).astype(np.int64)
+        in_range = (offsets >= 0) & (offsets < num_days)
+        return np.bincount(offsets[in_range], minlength=num_days)
+
+    snapshot_days = (history.days - first).astype(np.int64)
+    open_tasks = np.full(num_days, NO_INTEGER, dtype=np.int64)
+    open_tasks[snapshot_days] = history.open_tasks()
+    open_minutes = np.full(num_days, NO_INTEGER, dtype=np.int64)
+    open_minutes[snapshot_days] = history.open_minutes()
+    return Throughput(
+        periods=first + np.arange(num_days),
+        added=per_day(versions.created),
+        completed=per_day(versions.completed),
+        dropped=per_day(versions.dropped),
+        open=open_tasks,
+        open_minutes=open_minutes,
+    )
+
+
+def weekly_throughput(daily: Throughput) -> Throughput:
+    """Sum ``daily`` into weeks, starting on Mondays."""
+    # The epoch was a Thursday.
+    weeks = (daily.periods.astype(np.int64) + 3) // 7
+    starts = np.flatnonzero(np.concatenate([[True], weeks[1:] != weeks[:-1]]))
+    week_numbers = weeks[starts]
+    # The last day of each week that has a snapshot.
+    with_snapshot = np.flatnonzero(daily.open != NO_INTEGER)
+    snapshot_weeks = weeks[with_snapshot]
+    last = with_snapshot[np.concatenate([snapshot_weeks[1:] != snapshot_weeks[:-1], [True]])]
+    positions = np.searchsorted(week_numbers, weeks[last])
+    open_tasks = np.full(len(starts), NO_INTEGER, dtype=np.int64)
+    open_tasks[positions] = daily.open[last]
+    open_minutes = np.full(len(starts), NO_INTEGER, dtype=np.int64)
+    open_minutes[positions] = daily.open_minutes[last]
+    return Throughput(
+        periods=(week_numbers * 7 - 3).astype("datetime64[D]"),
+        added=np.add.reduceat(daily.added, starts),
+        completed=np.add.reduceat(daily.completed, starts),
+        dropped=np.add.reduceat(daily.dropped, starts),
+        open=open_tasks,
+        open_minutes=open_minutes,
+    )
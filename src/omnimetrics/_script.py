@@ -4,117 +4,928 @@ Author: Glyph Lefkowitz
 Source: https://gist.github.com/glyph/e51d1809bf1edcb5e8f5dceb48f99ccb
 """
 
+import io
 import json
+import os
+import sqlite3
 import tempfile
-from dataclasses import asdict
-from datetime import datetime
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import datetime, timedelta
+from functools import partial
 from pathlib import Path
-from typing import IO
+from typing import IO, Any, ContextManager, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 import click
-from google.cloud import bigquery, storage
 
-from omnimetrics._database import OMNIFOCUS, load_tasks
+from omnimetrics._backfill import Manifest, backfill, find_dumps, pending
+from omnimetrics._daemon import (
+    Client,
+    Daemon,
+    DaemonError,
+    LiveBackend,
+    SnapshotFileBackend,
+    connect_client,
+    socket_path,
+)
+from omnimetrics._database import connect, load_tasks, load_tasks_bulk, omnifocus
+from omnimetrics._extract import COLLECTIONS, extract
+from omnimetrics._formats import (
+    COLUMNAR_FORMATS,
+    TASK_SCHEMA,
+    bigquery_schema,
+    compile_json_serializer,
+    dump_taken_at,
+    write_json,
+)
+from omnimetrics._history import AddResult, History, parse_when
+from omnimetrics._incremental import Watermark, load_changes
+from omnimetrics._metrics import RunMetrics, append_run_log, write_textfile
+from omnimetrics._paging import DEFAULT_MAX_AGE, Checkpoint, DatabaseChanged, extract_pages
+from omnimetrics._profile import Profile, instrument
+from omnimetrics._reader import read_dumps
+from omnimetrics._store import REPORTS, Store
+from omnimetrics._upload import upload_compressed
 
 
 @click.group()
-def omnimetrics():
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print how long each stage and each kind of Apple Event took.",
+)
+@click.option(
+    "--profile-json",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=None,
+    help="Write how long each stage and each kind of Apple Event took to this JSON file.",
+)
+@click.pass_context
+def omnimetrics(ctx: click.Context, profile: bool, profile_json: Optional[str]) -> None:
     """Top-level omnimetrics command."""
+    if profile or profile_json:
+        ctx.obj = Profile()
+        ctx.call_on_close(partial(_report_profile, ctx.obj, profile, profile_json))
+
+
+def _report_profile(profile: Profile, show: bool, path: Optional[str]) -> None:
+    if show:
+        click.echo(profile.report(), err=True)
+    if path is not None:
+        profile.write_json(path)
+
+
+def _current_profile() -> Optional[Profile]:
+    ctx = click.get_current_context(silent=True)
+    return None if ctx is None else ctx.find_object(Profile)
+
+
+def _stage(name: str) -> ContextManager[None]:
+    """Time a stage of the command, if we're profiling."""
+    profile = _current_profile()
+    return nullcontext() if profile is None else profile.stage(name)
+
+
+T = TypeVar("T")
+
+
+def _extracted(tasks: Iterable[T]) -> Iterable[T]:
+    """Count ``tasks``, and time getting them as the "extract" stage, if we're profiling."""
+    profile = _current_profile()
+    return tasks if profile is None else profile.counted("tasks", tasks, "extract")
+
+
+@contextmanager
+def _run_metrics(
+    command: str, textfile: Optional[str], run_log: Optional[str]
+) -> Iterator[RunMetrics]:
+    """Record metrics about this run of ``command``, whether or not it succeeds.
+
+    They're written to the Prometheus ``textfile`` and added to the JSON
+    ``run_log``, if given. Counting tasks and Apple Events, and timing stages,
+    needs a profile, so we make one if we weren't already profiling.
+    """
+    run = RunMetrics(command, datetime.now())
+    if textfile is None and run_log is None:
+        yield run
+        return
+    profile = _current_profile()
+    if profile is None:
+        profile = click.get_current_context().obj = Profile()
+    start = time.perf_counter()
+    try:
+        yield run
+        run.succeeded = True
+    finally:
+        run.seconds = time.perf_counter() - start
+        run.add_profile(profile)
+        if textfile is not None:
+            write_textfile(Path(textfile), run)
+        if run_log is not None:
+            append_run_log(Path(run_log), run)
+
+
+def _omnifocus() -> Any:
+    """The OmniFocus app, instrumented if we're profiling."""
+    profile = _current_profile()
+    return omnifocus() if profile is None else instrument(omnifocus(), profile)
+
+
+bulk_option = click.option(
+    "--bulk/--no-bulk",
+    default=False,
+    help="Fetch each property for all tasks at once, rather than each task's properties in turn.",
+)
+
+watermark_option = click.option(
+    "--watermark",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=None,
+    help=(
+        "Only export tasks that have changed since the watermark in this file, "
+        "followed by a tombstone for each deleted task. Updates the watermark afterwards."
+    ),
+)
+
+format_option = click.option(
+    "--format",
+    "format_",
+    type=click.Choice(["json", *COLUMNAR_FORMATS]),
+    default="json",
+    help="Newline-delimited JSON, or a columnar format with a schema derived from Task.",
+)
+
+filename_option = click.option(
+    "--filename",
+    default=None,
+    type=str,
+    help="strftime pattern for the dump's name. Defaults to omnifocus-%Y%m%d-%H%M%S.<format>.",
+)
+
+checkpoint_option = click.option(
+    "--checkpoint",
+    type=click.Path(file_okay=False, dir_okay=True),
+    default=None,
+    help=(
+        "Extract tasks a page at a time, saving each page in this directory, "
+        "so that an interrupted dump carries on where it stopped."
+    ),
+)
+
+checkpoint_max_age_option = click.option(
+    "--checkpoint-max-age",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_MAX_AGE / timedelta(hours=1),
+    show_default=True,
+    help="Start the --checkpoint again, rather than carry on, if it's older than this many hours.",
+)
+
+metrics_textfile_option = click.option(
+    "--metrics-textfile",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=None,
+    help=(
+        "Write metrics about this run to this Prometheus textfile, e.g. "
+        "omnimetrics-dump.prom in node exporter's textfile directory."
+    ),
+)
+
+run_log_option = click.option(
+    "--run-log",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=None,
+    help="Add metrics about this run to this newline-delimited JSON log of recent runs.",
+)
+
+daemon_option = click.option(
+    "--daemon/--no-daemon",
+    default=False,
+    help="Dump the snapshot kept by `omnimetrics serve`, rather than reading OmniFocus.",
+)
 
 
 @omnimetrics.command()
-@click.argument("output", type=click.File("w"))
-def dump_file(output: IO[str]) -> None:
-    _dump_omnifocus(output)
+@bulk_option
+@watermark_option
+@format_option
+@daemon_option
+@checkpoint_option
+@checkpoint_max_age_option
+@click.argument("output", type=click.File("wb"))
+def dump_file(
+    bulk: bool,
+    watermark: Optional[str],
+    format_: str,
+    daemon: bool,
+    checkpoint: Optional[str],
+    checkpoint_max_age: float,
+    output: IO[bytes],
+) -> None:
+    _check_format(format_, watermark, daemon, checkpoint, bulk)
+    pages = _checkpoint(checkpoint, checkpoint_max_age)
+    with _stage("dump"):
+        new_watermark = _dump_format(output, format_, bulk, watermark, daemon, pages)
+    _save_watermark(watermark, new_watermark)
+    _clear_checkpoint(pages)
 
 
 @omnimetrics.command()
-@click.option("--filename", default="omnifocus-%Y%m%d-%H%M%S.json", type=str)
+@bulk_option
+@watermark_option
+@format_option
+@daemon_option
+@checkpoint_option
+@checkpoint_max_age_option
+@filename_option
+@metrics_textfile_option
+@run_log_option
 @click.argument("directory", type=click.Path(file_okay=False, dir_okay=True, exists=True))
-def dump(filename: str, directory: str) -> None:
-    now = datetime.now()
-    filename = now.strftime(filename)
-    path = Path(directory).joinpath(filename)
-    with path.open("w") as output:
-        _dump_omnifocus(output)
+def dump(
+    bulk: bool,
+    watermark: Optional[str],
+    format_: str,
+    daemon: bool,
+    checkpoint: Optional[str],
+    checkpoint_max_age: float,
+    filename: Optional[str],
+    metrics_textfile: Optional[str],
+    run_log: Optional[str],
+    directory: str,
+) -> None:
+    _check_format(format_, watermark, daemon, checkpoint, bulk)
+    pages = _checkpoint(checkpoint, checkpoint_max_age)
+    with _run_metrics("dump", metrics_textfile, run_log) as run:
+        now = datetime.now()
+        filename = now.strftime(_default_filename(filename, format_))
+        path = Path(directory).joinpath(filename)
+        with _stage("dump"), path.open("wb") as output:
+            new_watermark = _dump_format(output, format_, bulk, watermark, daemon, pages)
+        run.bytes_written = path.stat().st_size
+        _save_watermark(watermark, new_watermark)
+        _clear_checkpoint(pages)
 
 
-def _dump_omnifocus(output: IO[str]) -> None:
-    for task in load_tasks(OMNIFOCUS.default_document):
-        task_dict = asdict(task)
-        output.write(json.dumps(task_dict, default=jsonify))
+@omnimetrics.command()
+@click.option(
+    "--collection",
+    "collections",
+    type=click.Choice(list(COLLECTIONS)),
+    multiple=True,
+    help="What to extract. Can be given more than once. Defaults to everything.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="How many collections to extract at once.",
+)
+@click.argument("directory", type=click.Path(file_okay=False, dir_okay=True, exists=True))
+def dump_all(collections: Tuple[str, ...], workers: int, directory: str) -> None:
+    """Dump tasks, projects, tags, folders and task tags to DIRECTORY, all at once.
+
+    Each is written as newline-delimited JSON to a file of its own, named e.g.
+    omnifocus-projects-%Y%m%d-%H%M%S.json. Task tags have a row for each tag
+    of each task.
+    """
+    now = datetime.now()
+    paths = {
+        name: Path(directory) / now.strftime(f"omnifocus-{name}-%Y%m%d-%H%M%S.json")
+        for name in collections or COLLECTIONS
+    }
+    with ExitStack() as stack, _stage("dump all"):
+        outputs = {name: stack.enter_context(path.open("w")) for name, path in paths.items()}
+        counts = extract(connect, outputs, max_workers=workers)
+    for name, count in counts.items():
+        click.echo(f"{paths[name]}: {count} {name}", err=True)
+
+
+def _check_format(
+    format_: str,
+    watermark: Optional[str],
+    daemon: bool = False,
+    checkpoint: Optional[str] = None,
+    bulk: bool = False,
+) -> None:
+    if format_ != "json" and watermark is not None:
+        raise click.UsageError("--watermark change logs can only be written as JSON")
+    if bulk and watermark is not None:
+        # Change logs only read the tasks that changed, a task at a time.
+        raise click.UsageError("--bulk can't be used with --watermark")
+    if daemon and (format_ != "json" or watermark is not None):
+        raise click.UsageError("--daemon can only dump a JSON snapshot")
+    if checkpoint is not None and (watermark is not None or daemon):
+        raise click.UsageError("--checkpoint can't be used with --watermark or --daemon")
+
+
+def _default_filename(filename: Optional[str], format_: str) -> str:
+    return filename if filename is not None else f"omnifocus-%Y%m%d-%H%M%S.{format_}"
+
+
+def _dump_format(
+    output: IO[bytes],
+    format_: str,
+    bulk: bool = False,
+    watermark: Optional[str] = None,
+    daemon: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Optional[Watermark]:
+    """Dump OmniFocus tasks to the binary stream ``output`` in ``format_``.
+
+    If ``daemon`` is set, dump the daemon's snapshot instead.
+    """
+    if format_ in COLUMNAR_FORMATS:
+        write, _ = COLUMNAR_FORMATS[format_]
+        if checkpoint is not None:
+            write(_extract_pages(_omnifocus(), checkpoint).tasks(), output)
+            return None
+        loader = load_tasks_bulk if bulk else load_tasks
+        write(_extracted(loader(_omnifocus().default_document)), output)
+        return None
+    text_output = io.TextIOWrapper(output, encoding="utf-8")
+    try:
+        if daemon:
+            _daemon_client().dump(text_output)
+            return None
+        return _dump_omnifocus(text_output, bulk, watermark, checkpoint=checkpoint)
+    finally:
+        text_output.flush()
+        # Leave ``output`` open for our caller to close.
+        text_output.detach()
+
+
+def _dump_omnifocus(
+    output: IO[str],
+    bulk: bool = False,
+    watermark: Optional[str] = None,
+    omnifocus: Any = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Optional[Watermark]:
+    """Dump OmniFocus tasks to ``output`` as newline-delimited JSON.
+
+    If ``watermark`` is given, only dump what has changed since then, and
+    return the watermark to use next time. It's up to the caller to save it
+    once the dump is safely stored.
+
+    If ``checkpoint`` is given, extract a page at a time into it, carrying on
+    from where an earlier dump stopped. It's up to the caller to clear it once
+    the dump is safely stored.
+
+    Reads from ``omnifocus`` if given, and the real OmniFocus otherwise.
+    """
+    if omnifocus is None:
+        omnifocus = _omnifocus()
+    if watermark is not None:
+        return _dump_changes(output, Watermark.load(Path(watermark)), omnifocus)
+    if checkpoint is not None:
+        _extract_pages(omnifocus, checkpoint).copy_to(output)
+        return None
+    loader = load_tasks_bulk if bulk else load_tasks
+    write_json(_extracted(loader(omnifocus.default_document)), output)
+    return None
+
+
+# Serialises a task with a ``deleted`` field, for change logs.
+_serialize_upsert = compile_json_serializer(TASK_SCHEMA, {"deleted": False})
+
+
+def _dump_changes(output: IO[str], since: Watermark, omnifocus: Any) -> Watermark:
+    """Write a change log of upserts and tombstones to ``output``."""
+    with _stage("extract"):
+        changes = load_changes(omnifocus.default_document, since)
+    for task in _extracted(changes.upserts):
+        output.write(_serialize_upsert(task))
+        output.write("\n")
+    for task_id in sorted(changes.deleted):
+        output.write(json.dumps({"id": task_id, "deleted": True}))
         output.write("\n")
+    return changes.watermark
+
+
+def _checkpoint(path: Optional[str], max_age_hours: float) -> Optional[Checkpoint]:
+    if path is None:
+        return None
+    return Checkpoint(Path(path), max_age=timedelta(hours=max_age_hours))
+
+
+def _extract_pages(omnifocus: Any, checkpoint: Checkpoint) -> Checkpoint:
+    try:
+        with _stage("extract"):
+            pages = extract_pages(
+                omnifocus.default_document, checkpoint, echo=partial(click.echo, err=True)
+            )
+    except DatabaseChanged as e:
+        raise click.ClickException(str(e))
+    profile = _current_profile()
+    if profile is not None:
+        profile.count("tasks", len(pages))
+    return pages
+
+
+def _save_watermark(path: Optional[str], watermark: Optional[Watermark]) -> None:
+    if path is not None and watermark is not None:
+        watermark.save(Path(path))
+
+
+def _clear_checkpoint(checkpoint: Optional[Checkpoint]) -> None:
+    if checkpoint is not None:
+        checkpoint.clear()
 
 
 @omnimetrics.command()
+@bulk_option
+@watermark_option
+@format_option
+@click.option(
+    "--stream/--no-stream",
+    default=False,
+    help="Gzip the dump and upload it as it's extracted, rather than via a temporary file.",
+)
 @click.option("--gcs-bucket-prefix", type=str, default="")
-@click.option("--filename", default="omnifocus-%Y%m%d-%H%M%S.json", type=str)
+@checkpoint_option
+@checkpoint_max_age_option
+@filename_option
+@metrics_textfile_option
+@run_log_option
 @click.argument("gcs-bucket", type=str)
 @click.argument("destination-table", type=str)
-def run_pipeline(gcs_bucket_prefix: str, filename: str, gcs_bucket: str, destination_table: str) -> None:
+def run_pipeline(
+    bulk: bool,
+    watermark: Optional[str],
+    format_: str,
+    stream: bool,
+    gcs_bucket_prefix: str,
+    checkpoint: Optional[str],
+    checkpoint_max_age: float,
+    filename: Optional[str],
+    metrics_textfile: Optional[str],
+    run_log: Optional[str],
+    gcs_bucket: str,
+    destination_table: str,
+) -> None:
     """Extract data from Omnifocus and load it to GCS and BigQuery.
 
     The BigQuery destination table needs to exist, and needs to be partitioned.
+    With ``--watermark``, each partition holds that day's change logs rather
+    than a full snapshot, and each run appends its change log to them.
     """
-    now = datetime.now()
-    with tempfile.NamedTemporaryFile("w") as temp_file:
-        # Extract Omnifocus data to a file
-        _dump_omnifocus(temp_file)
-        # Load it to GCS
+    _check_format(format_, watermark, checkpoint=checkpoint, bulk=bulk)
+    if stream and format_ != "json":
+        raise click.UsageError("Only JSON dumps can be streamed")
+    pages = _checkpoint(checkpoint, checkpoint_max_age)
+    with _run_metrics("run_pipeline", metrics_textfile, run_log) as run:
+        now = datetime.now()
+        filename = now.strftime(_default_filename(filename, format_))
+        from google.cloud import storage
+
         storage_client = storage.Client()
         bucket = storage_client.bucket(gcs_bucket)
-        filename = now.strftime(filename)
-        gcs_path = str(Path(gcs_bucket_prefix) / Path(filename))
-        blob = bucket.blob(gcs_path)
-        blob.upload_from_filename(temp_file.name)
-    # TODO: Create the table if it doesn't exist.
-    _load_to_bigquery(gcs_bucket, gcs_path, f"{destination_table}${now.strftime('%Y%m%d')}")
+        if stream:
+            gcs_path = str(Path(gcs_bucket_prefix) / Path(filename + ".gz"))
+            with _stage("dump and upload"):
+                new_watermark, stats = upload_compressed(
+                    bucket.blob(gcs_path),
+                    lambda output: _dump_omnifocus(output, bulk, watermark, checkpoint=pages),
+                )
+            click.echo(stats.summary(), err=True)
+            run.bytes_written = stats.bytes_in
+            run.stages["upload"] = stats.upload_seconds
+        else:
+            gcs_path = str(Path(gcs_bucket_prefix) / Path(filename))
+            with tempfile.NamedTemporaryFile("wb") as temp_file:
+                # Extract Omnifocus data to a file
+                with _stage("dump"):
+                    new_watermark = _dump_format(
+                        temp_file, format_, bulk, watermark, checkpoint=pages
+                    )
+                    temp_file.flush()
+                run.bytes_written = os.path.getsize(temp_file.name)
+                # Load it to GCS
+                with _stage("upload"):
+                    blob = bucket.blob(gcs_path)
+                    blob.upload_from_filename(temp_file.name)
+        # TODO: Create the table if it doesn't exist.
+        with _stage("load"):
+            _load_to_bigquery(
+                gcs_bucket,
+                gcs_path,
+                f"{destination_table}${now.strftime('%Y%m%d')}",
+                format_,
+                # A change log only has what changed since the last run, so
+                # replacing the partition would lose the earlier runs' changes.
+                append=watermark is not None,
+            )
+        _save_watermark(watermark, new_watermark)
+        _clear_checkpoint(pages)
+
+
+store_option = click.option(
+    "--store",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default="omnimetrics.sqlite3",
+    envvar="OMNIMETRICS_STORE",
+    show_default=True,
+    help="The local SQLite store of snapshots.",
+)
+
+
+@omnimetrics.command()
+@store_option
+@bulk_option
+@click.option(
+    "--workers",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="How many processes to read dumps on. 0 for one per CPU.",
+)
+@click.argument("dumps", nargs=-1, type=click.Path(exists=True, file_okay=True, dir_okay=False))
+def ingest(store: str, bulk: bool, workers: int, dumps: Tuple[str, ...]) -> None:
+    """Load JSON dumps into the local store, each as a snapshot, oldest first.
+
+    With no dumps, load a snapshot straight from OmniFocus. Dumps that are
+    already in the store are skipped.
+    """
+    with Store(Path(store)) as snapshots:
+        if not dumps:
+            now = datetime.now()
+            loader = load_tasks_bulk if bulk else load_tasks
+            with _stage("dump"):
+                tasks = list(loader(_omnifocus().default_document))
+            with _stage("ingest"):
+                count = snapshots.ingest_tasks(tasks, now, f"omnifocus:{now.isoformat()}")
+            click.echo(f"OmniFocus: {count} tasks", err=True)
+            return
+        todo = []
+        for dump in dumps:
+            if snapshots.has_source(str(Path(dump).resolve())):
+                click.echo(f"{dump}: already ingested", err=True)
+            else:
+                todo.append(Path(dump))
+        with _stage("ingest"):
+            for columns in read_dumps(todo, workers=workers or None):
+                count = snapshots.ingest_columns(columns)
+                if count is None:
+                    # Given more than once.
+                    click.echo(f"{columns.path}: already ingested", err=True)
+                else:
+                    click.echo(f"{columns.path}: {count} tasks", err=True)
+
+
+@omnimetrics.command()
+@store_option
+@click.option("--report", type=click.Choice(sorted(REPORTS)), default=None, help="A canned report.")
+@click.argument("sql", required=False)
+def query(store: str, report: Optional[str], sql: Optional[str]) -> None:
+    """Run SQL, or a canned report, against the local store.
+
+    Prints tab-separated rows, with a header. The ``current_tasks`` view has
+    the tasks from the most recent snapshot, and ``tasks`` has all of them.
+    """
+    if (report is None) == (sql is None):
+        raise click.UsageError("Give either SQL or --report, but not both")
+    with Store(Path(store)) as snapshots:
+        try:
+            names, rows = snapshots.report(report) if report else snapshots.query(sql or "")
+            _echo_rows(names, rows)
+        except sqlite3.Error as e:
+            raise click.ClickException(str(e))
+
+
+def _echo_rows(names: List[str], rows: Iterable[Tuple[Any, ...]]) -> None:
+    click.echo("\t".join(names))
+    for row in rows:
+        click.echo("\t".join("" if value is None else str(value) for value in row))
+
+
+@omnimetrics.group()
+def history() -> None:
+    """Keep a history of snapshots, storing each version of each task once."""
 
 
-def _load_to_bigquery(gcs_bucket: str, gcs_path: str, destination_table: str) -> None:
+history_argument = click.argument(
+    "history-directory", type=click.Path(file_okay=False, dir_okay=True)
+)
+
+
+class WhenType(click.ParamType):
+    """A date, or a date and time, in ISO 8601 format."""
+
+    name = "when"
+
+    def convert(self, value: Any, param: Any, ctx: Any) -> datetime:
+        if isinstance(value, datetime):
+            return value
+        try:
+            return parse_when(value)
+        except ValueError:
+            self.fail(f"{value!r} is not a date, or a date and time", param, ctx)
+
+
+@history.command(name="add")
+@bulk_option
+@history_argument
+@click.argument("dumps", nargs=-1, type=click.Path(exists=True, file_okay=True, dir_okay=False))
+def history_add(bulk: bool, history_directory: str, dumps: Tuple[str, ...]) -> None:
+    """Add JSON dumps to the history, each as a snapshot.
+
+    With no dumps, add a snapshot straight from OmniFocus.
+    """
+    snapshots = History(Path(history_directory))
+    if not dumps:
+        now = datetime.now()
+        loader = load_tasks_bulk if bulk else load_tasks
+        with _stage("dump and add"):
+            result = snapshots.add_tasks(loader(_omnifocus().default_document), now)
+        _echo_added("OmniFocus", result)
+        return
+    with _stage("add"):
+        for dump in dumps:
+            path = Path(dump)
+            try:
+                result = snapshots.add_dump(path, dump_taken_at(path))
+            except (FileExistsError, ValueError) as e:
+                raise click.ClickException(f"{dump}: {e}")
+            _echo_added(dump, result)
+
+
+def _echo_added(source: str, result: AddResult) -> None:
+    click.echo(
+        f"{source}: snapshot {result.taken_at.isoformat()}, {result.num_tasks} tasks, "
+        f"{result.new_versions} new versions, {result.bytes_written} bytes",
+        err=True,
+    )
+
+
+@history.command(name="list")
+@history_argument
+def history_list(history_directory: str) -> None:
+    """List the snapshots in the history."""
+    for taken_at in History(Path(history_directory)).snapshots():
+        click.echo(taken_at.isoformat())
+
+
+@history.command(name="show")
+@history_argument
+@click.argument("when", type=WhenType())
+@click.argument("output", type=click.File("w"), default="-")
+def history_show(history_directory: str, when: datetime, output: IO[str]) -> None:
+    """Write the snapshot as it was at WHEN as newline-delimited JSON."""
+    snapshots = History(Path(history_directory))
+    try:
+        snapshots.write_snapshot(snapshots.snapshot_at(when), output)
+    except LookupError as e:
+        raise click.ClickException(str(e))
+
+
+@history.command(name="diff")
+@history_argument
+@click.argument("before", type=WhenType())
+@click.argument("after", type=WhenType())
+def history_diff(history_directory: str, before: datetime, after: datetime) -> None:
+    """Show which tasks were added, removed, or changed between two dates."""
+    snapshots = History(Path(history_directory))
+    try:
+        diff = snapshots.diff(snapshots.snapshot_at(before), snapshots.snapshot_at(after))
+    except LookupError as e:
+        raise click.ClickException(str(e))
+    for task in diff.added:
+        click.echo(f"+ {task['id']} {task['name']}")
+    for task in diff.removed:
+        click.echo(f"- {task['id']} {task['name']}")
+    for old, new in diff.changed:
+        fields = ", ".join(name for name in new if old.get(name) != new[name])
+        click.echo(f"~ {new['id']} {new['name']}: {fields}")
+
+
+@omnimetrics.command()
+@click.option(
+    "--weekly", is_flag=True, default=False, help="A row per week, starting on Mondays."
+)
+@click.option(
+    "--max-open",
+    type=int,
+    default=None,
+    help="Warn if more than this many tasks are open in the latest dump.",
+)
+@click.argument("directory", type=click.Path(file_okay=False, dir_okay=True, exists=True))
+def report(weekly: bool, max_open: Optional[int], directory: str) -> None:
+    """Show how much was added, completed and dropped each day, from the dumps in DIRECTORY.
+
+    Uses the latest JSON dump of each day. A day is winning if more was
+    completed than added. Open is how many tasks were neither completed nor
+    dropped at the end of the day, and how many minutes they were estimated
+    to take. Needs NumPy, from omnimetrics[analysis].
+    """
+    from omnimetrics._report import (
+        THROUGHPUT_COLUMNS,
+        daily_throughput,
+        load_history,
+        weekly_throughput,
+    )
+
+    try:
+        dumps = find_dumps(Path(directory))
+        if not dumps:
+            raise ValueError(f"No dumps in {directory}")
+        with _stage("load"):
+            snapshots = load_history(dumps)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    with _stage("report"):
+        throughput = daily_throughput(snapshots)
+        if weekly:
+            throughput = weekly_throughput(throughput)
+    _echo_rows(THROUGHPUT_COLUMNS, throughput.rows())
+    open_tasks = int(snapshots.open_tasks()[-1])
+    if max_open is not None and open_tasks > max_open:
+        click.echo(
+            f"{open_tasks} tasks are open, more than {max_open}. Have you taken too much on?",
+            err=True,
+        )
+
+
+@omnimetrics.command(name="backfill")
+@click.option("--gcs-bucket-prefix", type=str, default="")
+@click.option(
+    "--manifest",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=None,
+    help="Where to record which days are loaded. Defaults to DIRECTORY/backfill-manifest.json.",
+)
+@click.option(
+    "--dry-run", is_flag=True, default=False, help="Only show which days would be loaded."
+)
+@click.argument("directory", type=click.Path(file_okay=False, dir_okay=True, exists=True))
+@click.argument("gcs-bucket", type=str)
+@click.argument("destination-table", type=str)
+def backfill_command(
+    gcs_bucket_prefix: str,
+    manifest: Optional[str],
+    dry_run: bool,
+    directory: str,
+    gcs_bucket: str,
+    destination_table: str,
+) -> None:
+    """Load the JSON dumps in DIRECTORY into BigQuery, a partition per day.
+
+    Stages the latest dump of each day in GCS, then loads them all with one
+    load job and one query job, rather than a load job per day. Days that
+    are already in the manifest are skipped.
+    """
+    manifest_path = (
+        Path(manifest) if manifest is not None else Path(directory) / "backfill-manifest.json"
+    )
+    loaded = Manifest.load(manifest_path)
+    try:
+        dumps = find_dumps(Path(directory))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    todo = pending(dumps, loaded, destination_table)
+    click.echo(f"{len(todo)} of {len(dumps)} days to load", err=True)
+    if dry_run:
+        for dump in todo:
+            click.echo(f"{dump.partition} {dump.path}")
+        return
+    from google.cloud import bigquery, storage
+
+    with _stage("backfill"):
+        backfill(
+            todo,
+            storage.Client(),
+            bigquery.Client(),
+            gcs_bucket,
+            gcs_bucket_prefix,
+            destination_table,
+            loaded,
+            manifest_path,
+            echo=partial(click.echo, err=True),
+        )
+
+
+@omnimetrics.command()
+@click.option(
+    "--socket",
+    "socket_",
+    type=click.Path(file_okay=True, dir_okay=False),
+    default=None,
+    help="Where to listen. Defaults to $OMNIMETRICS_SOCKET, or ~/.omnimetrics/omnimetrics.sock.",
+)
+@click.option(
+    "--refresh-interval",
+    type=float,
+    default=60.0,
+    show_default=True,
+    help="How often to look for changes, in seconds.",
+)
+@click.option(
+    "--snapshot",
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+    default=None,
+    help="Serve the tasks in this JSON dump, rather than from OmniFocus.",
+)
+def serve(socket_: Optional[str], refresh_interval: float, snapshot: Optional[str]) -> None:
+    """Keep a snapshot of OmniFocus in memory, and answer questions about it.
+
+    While this is running, viewit and procrastinatron ask it rather than
+    reading OmniFocus themselves. So do dump and dump-file, with --daemon.
+    """
+    backend = SnapshotFileBackend(Path(snapshot)) if snapshot else LiveBackend(_omnifocus())
+    path = Path(socket_) if socket_ is not None else socket_path()
+    with _stage("load"):
+        daemon = Daemon(backend)
+    try:
+        server = daemon.serve(path, refresh_interval)
+    except DaemonError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Serving {len(daemon.snapshot.tasks)} tasks on {path}", err=True)
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def _daemon_client() -> Client:
+    client = connect_client()
+    if client is None:
+        raise click.ClickException(
+            f"Nothing is listening on {socket_path()}. Start it with `omnimetrics serve`."
+        )
+    return client
+
+
+def _load_to_bigquery(
+    gcs_bucket: str,
+    gcs_path: str,
+    destination_table: str,
+    format_: str = "json",
+    append: bool = False,
+) -> None:
+    """Load a dump from GCS into a BigQuery table.
+
+    Columnar dumps are loaded with the schema derived from ``Task``, with
+    every field nullable to match a table whose schema was detected from
+    JSON dumps. JSON dumps still have their schema detected, since they might
+    be change logs.
+
+    Replaces what's in ``destination_table``, unless ``append`` is true, as
+    it should be for change logs.
+    """
+    from google.cloud import bigquery
+
     gcs_url = f"gs://{gcs_bucket}/{gcs_path}"
     bigquery_client = bigquery.Client()
+    if format_ in COLUMNAR_FORMATS:
+        _, source_format = COLUMNAR_FORMATS[format_]
+        schema_options = dict(
+            schema=bigquery_schema(TASK_SCHEMA, all_nullable=True),
+            source_format=source_format,
+            use_avro_logical_types=True,
+        )
+    else:
+        schema_options = dict(
+            autodetect=True, source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+        )
     job = bigquery_client.load_table_from_uri(
         [gcs_url],
         destination_table,
         job_config=bigquery.LoadJobConfig(
-            autodetect=True,
-            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            **schema_options,
             schema_update_options=[
                 bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
                 bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION,
             ],
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+            write_disposition=(
+                bigquery.WriteDisposition.WRITE_APPEND
+                if append
+                else bigquery.WriteDisposition.WRITE_TRUNCATE
+            ),
         )
     )
     job.result()
 
 
-def jsonify(o):
-    if isinstance(o, datetime):
-        return o.isoformat()
-    return o
-
-
 """
 Here's what we need to do.
 
 - [x] use default_document to get the whole database
-- [ ] use `flattened` versions to get at the actual contents
+- [x] use `flattened` versions to get at the actual contents
   - [x] `flattened_tasks`
-  - [ ] `flattened_folders`
-  - [ ] `flattened_tags`
-  - [ ] `flattened_projects`
+  - [x] `flattened_folders`
+  - [x] `flattened_tags`
+  - [x] `flattened_projects`
 
 - build types for each of those flattened versions
   - [x] https://omni-automation.com/omnifocus/OF-API.html#Task
-  - [ ] folder
-  - [ ] tag
-  - [ ] project
+  - [x] folder
+  - [x] tag
+  - [x] project
 
 - serialisers for each of these
   - [x] JSON
-  - [ ] Avro? https://avro.apache.org/docs/1.10.0/gettingstartedpython.html
+  - [x] Avro? https://avro.apache.org/docs/1.10.0/gettingstartedpython.html
+  - [x] Parquet
 
 - [x] Figure out how to use launchd to run a script daily
   - [x] https://www.launchd.info/
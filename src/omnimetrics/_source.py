@@ -0,0 +1,291 @@
+"""Where viewit and procrastinatron get their tasks from.
+
+A source answers the two questions they ask:
+
+- ``view()``: what's in view, as ``ViewItem``s, for viewit
+- ``availability(now)``: which tasks are available, and what they're called,
+  for procrastinatron's ``Scheduler``
+
+There are three sources:
+- ``AppscriptSource`` asks OmniFocus, in bulk;
+- ``ScriptingBridgeSource`` asks OmniFocus one item at a time, the way these
+  tools always used to;
+- ``ReplaySource`` reads a dump, so it doesn't need OmniFocus, or macOS.
+
+A daemon ``Client`` answers the same questions.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import click
+
+from omnimetrics._database import Task, load_tasks_bulk, omnifocus
+from omnimetrics._formats import DUMP_NAME, deserialize_task
+from omnimetrics._hierarchy import Hierarchy, is_available_at
+from omnimetrics._procrastinatron import Availability, pollAvailability
+from omnimetrics._profile import Profile, instrument
+
+if TYPE_CHECKING:
+    # viewit imports us, so we import it when we need it.
+    from omnimetrics._viewit import ViewItem
+
+# The names of the sources, for ``open_source``.
+SOURCES = ["appscript", "scripting-bridge", "replay"]
+
+# The formats we can replay, by suffix.
+_DUMP_SUFFIXES = [".json", ".parquet", ".avro"]
+
+
+class NameIndex:
+    """The qualified names of tasks, by id.
+
+    Has just enough of ``Hierarchy`` to show tasks with ``showTask``.
+    """
+
+    def __init__(self, names: Dict[str, Optional[str]]) -> None:
+        self._names = names
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._names
+
+    def qualified_name(self, task_id: str) -> Optional[str]:
+        return self._names[task_id]
+
+
+class AppscriptSource:
+    """Asks OmniFocus through appscript, fetching each property of every task at once.
+
+    Loads every task the first time it needs their names, and after that
+    only polls for what's available, unless that turns up a task we don't
+    have a name for, e.g. one that was just added. Showing what's in view
+    doesn't need every task, so doesn't load them unless we already have.
+    """
+
+    def __init__(self, omnifocus: Any) -> None:
+        self._omnifocus = omnifocus
+        self._hierarchy: Optional[Hierarchy] = None
+
+    def hierarchy(self) -> Hierarchy:
+        if self._hierarchy is None:
+            return self._load_hierarchy()
+        return self._hierarchy
+
+    def _load_hierarchy(self) -> Hierarchy:
+        self._hierarchy = Hierarchy(load_tasks_bulk(self._omnifocus.default_document))
+        return self._hierarchy
+
+    def view(self) -> List[ViewItem]:
+        from omnimetrics._viewit import tasksInView
+
+        return tasksInView(self._omnifocus, self._hierarchy)
+
+    def availability(self, now: datetime) -> Tuple[List[Availability], Hierarchy]:
+        availabilities = pollAvailability(self._omnifocus.default_document, now)
+        hierarchy = self.hierarchy()
+        if any(availability.taskId not in hierarchy for availability in availabilities):
+            hierarchy = self._load_hierarchy()
+        return availabilities, hierarchy
+
+
+class ScriptingBridgeSource:
+    """Asks OmniFocus through ScriptingBridge, about the tasks in view.
+
+    Sends at least one Apple Event per question about each task, so it's
+    slow when there's a lot in view.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self._app = app
+
+    def _tasks_in_view(self) -> List[Any]:
+        task_class = self._app.classForScriptingClass_("task")
+        content = self._app.defaultDocument().documentWindows()[0].content()
+        values = (leaf.value() for leaf in content.leaves())
+        return [value for value in values if value.isKindOfClass_(task_class)]
+
+    def view(self) -> List[ViewItem]:
+        from omnimetrics._viewit import ViewItem, qualifiedName
+
+        return [
+            ViewItem(
+                name=qualifiedName(task),
+                estimatedMinutes=task.estimatedMinutes().get(),
+                blocked=task.blocked(),
+            )
+            for task in self._tasks_in_view()
+        ]
+
+    def availability(self, now: datetime) -> Tuple[List[Availability], NameIndex]:
+        from omnimetrics._viewit import qualifiedName
+
+        availabilities = []
+        names = {}
+        for task in self._tasks_in_view():
+            task_id = task.id()
+            availabilities.append(
+                Availability(
+                    task_id, task.modificationDate(), not (task.blocked() or task.completed())
+                )
+            )
+            names[task_id] = qualifiedName(task)
+        return availabilities, NameIndex(names)
+
+
+class ReplaySource:
+    """Answers from a dump, as if it were OmniFocus at the time of the dump.
+
+    Reads the dump and indexes it once. We can't tell what was in view from a
+    dump, so the tasks that are available count as being in view.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._tasks = load_dump(path)
+        self._hierarchy = Hierarchy(self._tasks)
+
+    def hierarchy(self) -> Hierarchy:
+        return self._hierarchy
+
+    def view(self) -> List[ViewItem]:
+        from omnimetrics._viewit import viewItems
+
+        now = datetime.now()
+        visible = [task.id for task in self._tasks if is_available_at(task, now)]
+        return viewItems(visible, self._hierarchy)
+
+    def availability(self, now: datetime) -> Tuple[List[Availability], Hierarchy]:
+        availabilities = [
+            Availability(task.id, task.modification_date, is_available_at(task, now))
+            for task in self._tasks
+        ]
+        return availabilities, self._hierarchy
+
+
+def load_dump(path: Path) -> List[Task]:
+    """Load the tasks in a dump, which can be JSON, Parquet or Avro.
+
+    Raises ``ValueError`` if it's a change log, rather than a snapshot.
+    """
+    readers: Dict[str, Callable[[Path], List[Dict[str, Any]]]] = {
+        ".json": _read_json,
+        ".parquet": _read_parquet,
+        ".avro": _read_avro,
+    }
+    if path.suffix not in readers:
+        raise ValueError(f"Don't know how to read {path}")
+    rows = readers[path.suffix](path)
+    if any("deleted" in row for row in rows):
+        raise ValueError(f"{path} is a change log, not a snapshot")
+    return [deserialize_task(row) for row in rows]
+
+
+def _read_json(path: Path) -> List[Dict[str, Any]]:
+    with path.open("rb") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _read_parquet(path: Path) -> List[Dict[str, Any]]:
+    import pyarrow.parquet
+
+    return pyarrow.parquet.read_table(str(path)).to_pylist()
+
+
+def _read_avro(path: Path) -> List[Dict[str, Any]]:
+    import fastavro
+
+    with path.open("rb") as f:
+        return list(fastavro.reader(f))
+
+
+def latest_dump(directory: Path) -> Path:
+    """The most recent dump in ``directory``, going by the names of the dumps.
+
+    Raises ``FileNotFoundError`` if there aren't any.
+    """
+    dumps = {}
+    for suffix in _DUMP_SUFFIXES:
+        name_format = DUMP_NAME.replace(".json", suffix)
+        for path in directory.glob(f"omnifocus-*{suffix}"):
+            try:
+                dumps[path] = datetime.strptime(path.name, name_format)
+            except ValueError:
+                continue
+    if not dumps:
+        raise FileNotFoundError(f"No dumps in {directory}")
+    return max(dumps, key=lambda path: (dumps[path], path.name))
+
+
+def open_source(kind: str, dump: Optional[Path] = None, profile: Optional[Profile] = None) -> Any:
+    """Open the source called ``kind``, one of ``SOURCES``.
+
+    ``replay`` reads ``dump``, or the latest dump in it if it's a directory.
+    If given a ``profile``, record the Apple Events that ``appscript`` sends.
+    """
+    if kind == "appscript":
+        app = omnifocus()
+        return AppscriptSource(app if profile is None else instrument(app, profile))
+    if kind == "scripting-bridge":
+        from omnimetrics._viewit import omniFocus
+
+        return ScriptingBridgeSource(omniFocus())
+    if kind == "replay":
+        if dump is None:
+            raise ValueError("Need a dump to replay")
+        return ReplaySource(latest_dump(dump) if dump.is_dir() else dump)
+    raise ValueError(f"Unknown source: {kind}")
+
+
+def source_options(command: Callable[..., Any]) -> Callable[..., Any]:
+    """Add options for choosing a source to a command.
+
+    The command gets ``daemon``, ``source`` and ``dump`` arguments, which it
+    should pass to ``connect_source``.
+    """
+    options = [
+        click.option(
+            "--daemon/--no-daemon",
+            default=True,
+            help="Ask `omnimetrics serve`, if it's running.",
+        ),
+        click.option(
+            "--source",
+            type=click.Choice(SOURCES),
+            default=None,
+            help=(
+                "Where to get tasks from, otherwise. "
+                "Defaults to replay with --dump, and appscript without."
+            ),
+        ),
+        click.option(
+            "--dump",
+            type=click.Path(exists=True, file_okay=True, dir_okay=True),
+            default=None,
+            envvar="OMNIMETRICS_DUMP",
+            help="A dump to replay, or a directory whose latest dump to replay.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def connect_source(
+    daemon: bool, source: Optional[str], dump: Optional[str], profile: Optional[Profile] = None
+) -> Any:
+    """The daemon, if we should ask it and it's running, or else the chosen source."""
+    # Imported here, because the daemon imports us.
+    from omnimetrics._daemon import connect_client
+
+    client = connect_client() if daemon else None
+    if client is not None:
+        return client
+    if source is None:
+        source = "replay" if dump is not None else "appscript"
+    try:
+        return open_source(source, None if dump is None else Path(dump), profile)
+    except (ValueError, FileNotFoundError) as e:
+        raise click.UsageError(str(e))
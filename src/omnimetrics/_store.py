@@ -0,0 +1,200 @@
+"""A local SQLite store of snapshots of tasks, for asking questions offline.
+
+Each dump (or each load straight from OmniFocus) is one snapshot. Every task
+in a snapshot is a row in ``tasks``, with fields of references flattened into
+their own columns, e.g. ``containing_project_name``. The ``current_tasks``
+view has just the tasks in the most recent snapshot.
+"""
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from operator import attrgetter
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from omnimetrics._database import Task
+from omnimetrics._formats import TASK_SCHEMA, Field, flatten
+from omnimetrics._reader import DumpColumns
+
+# How many rows to insert in each statement.
+_BATCH_SIZE = 10_000
+
+_SQL_TYPES = {"STRING": "TEXT", "TIMESTAMP": "TEXT", "INTEGER": "INTEGER", "BOOLEAN": "INTEGER"}
+
+# (path in a task, column name, field)
+_COLUMNS = [(path, path.replace(".", "_"), field) for path, field in flatten(TASK_SCHEMA)]
+
+_INDEXED = ["modification_date", "completion_date", "containing_project_name"]
+
+
+def _create_statements() -> List[str]:
+    columns = ",\n".join(
+        f"    {name} {_SQL_TYPES[field.type]}{'' if field.nullable else ' NOT NULL'}"
+        for _, name, field in _COLUMNS
+    )
+    statements = [
+        """CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot INTEGER PRIMARY KEY,
+    taken_at TEXT NOT NULL,
+    source TEXT NOT NULL UNIQUE
+)""",
+        f"""CREATE TABLE IF NOT EXISTS tasks (
+    snapshot INTEGER NOT NULL REFERENCES snapshots (snapshot),
+{columns}
+)""",
+        "CREATE INDEX IF NOT EXISTS tasks_id ON tasks (id, snapshot)",
+    ]
+    for name in _INDEXED:
+        statements.append(f"CREATE INDEX IF NOT EXISTS tasks_{name} ON tasks (snapshot, {name})")
+    statements.append(
+        """CREATE VIEW IF NOT EXISTS current_tasks AS
+SELECT * FROM tasks
+WHERE snapshot = (SELECT snapshot FROM snapshots ORDER BY taken_at DESC LIMIT 1)"""
+    )
+    return statements
+
+
+_INSERT = "INSERT INTO tasks (snapshot, {}) VALUES (?, {})".format(
+    ", ".join(name for _, name, _ in _COLUMNS), ", ".join("?" for _ in _COLUMNS)
+)
+
+# Canned reports on the most recent snapshot, by name.
+REPORTS = {
+    "snapshots": """
+        SELECT snapshot, taken_at, source, COUNT(tasks.id) AS tasks
+        FROM snapshots LEFT JOIN tasks USING (snapshot)
+        GROUP BY snapshot
+        ORDER BY taken_at
+    """,
+    "projects": """
+        SELECT
+            containing_project_name AS project,
+            COUNT(*) AS tasks,
+            SUM(NOT (is_effectively_completed OR is_effectively_dropped OR is_blocked))
+                AS available,
+            SUM(is_effectively_completed) AS completed,
+            SUM(COALESCE(estimated_minutes, 0)) AS estimated_minutes
+        FROM current_tasks
+        GROUP BY containing_project_name
+        ORDER BY tasks DESC, project
+    """,
+    "completed-by-day": """
+        SELECT substr(completion_date, 1, 10) AS day, COUNT(*) AS completed
+        FROM current_tasks
+        WHERE completion_date IS NOT NULL
+        GROUP BY day
+        ORDER BY day
+    """,
+    "created-by-day": """
+        SELECT substr(creation_date, 1, 10) AS day, COUNT(*) AS created
+        FROM current_tasks
+        GROUP BY day
+        ORDER BY day
+    """,
+}
+
+
+class Store:
+    """A SQLite database of snapshots of tasks."""
+
+    def __init__(self, path: Path) -> None:
+        self.connection = sqlite3.connect(str(path))
+        with self.connection:
+            for statement in _create_statements():
+                self.connection.execute(statement)
+            self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        # Stores made before a field was added to ``Task`` don't have a column
+        # for it. Such fields are nullable, so older snapshots get nulls.
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(tasks)")}
+        for _, name, field in _COLUMNS:
+            if name not in existing:
+                self.connection.execute(
+                    f"ALTER TABLE tasks ADD COLUMN {name} {_SQL_TYPES[field.type]}"
+                )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> Store:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def has_source(self, source: str) -> bool:
+        """Have we already ingested a snapshot from ``source``?"""
+        cursor = self.connection.execute("SELECT 1 FROM snapshots WHERE source = ?", (source,))
+        return cursor.fetchone() is not None
+
+    def ingest_tasks(self, tasks: Iterable[Task], taken_at: datetime, source: str) -> int:
+        """Store ``tasks`` as a snapshot, e.g. as returned by ``load_tasks``.
+
+        Returns the number of tasks stored.
+        """
+        return self._ingest(map(_task_row, tasks), taken_at, source)
+
+    def ingest_columns(self, dump: DumpColumns) -> Optional[int]:
+        """Store a dump read by ``read_dumps`` as a snapshot.
+
+        The dump must have every column, as it does by default. Returns the
+        number of tasks stored, or ``None`` if this dump is already in the
+        store.
+        """
+        if dump.names != tuple(path for path, _, _ in _COLUMNS):
+            raise ValueError("Can only store dumps read with every column")
+        source = str(dump.path.resolve())
+        if self.has_source(source):
+            return None
+        return self._ingest(dump.rows(), dump.taken_at, source)
+
+    def _ingest(self, rows: Iterable[Tuple[Any, ...]], taken_at: datetime, source: str) -> int:
+        rows = iter(rows)
+        count = 0
+        # All in one transaction, so we never have half a snapshot.
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO snapshots (taken_at, source) VALUES (?, ?)",
+                (taken_at.isoformat(), source),
+            )
+            snapshot = cursor.lastrowid
+            while True:
+                batch = [(snapshot, *row) for row in islice(rows, _BATCH_SIZE)]
+                if not batch:
+                    break
+                self.connection.executemany(_INSERT, batch)
+                count += len(batch)
+        return count
+
+    def query(
+        self, sql: str, parameters: Sequence[Any] = ()
+    ) -> Tuple[List[str], Iterator[Tuple[Any, ...]]]:
+        """Run ``sql``, and return the names of its columns and its rows."""
+        cursor = self.connection.execute(sql, parameters)
+        names = [description[0] for description in cursor.description or ()]
+        return names, iter(cursor)
+
+    def report(self, name: str) -> Tuple[List[str], Iterator[Tuple[Any, ...]]]:
+        """Run the canned report called ``name``."""
+        return self.query(REPORTS[name])
+
+
+def _task_getter(path: str, field: Field) -> Callable[[Task], Any]:
+    if "." in path:
+        record, name = path.split(".")
+        get_record = attrgetter(record)
+        return lambda task: None if get_record(task) is None else getattr(get_record(task), name)
+    get = attrgetter(path)
+    if field.type == "TIMESTAMP":
+        return lambda task: None if get(task) is None else get(task).isoformat()
+    return get
+
+
+_TASK_GETTERS = [_task_getter(path, field) for path, _, field in _COLUMNS]
+
+
+def _task_row(task: Task) -> Tuple[Any, ...]:
+    return tuple([get(task) for get in _TASK_GETTERS])
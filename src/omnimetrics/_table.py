@@ -0,0 +1,252 @@
+"""A compact, columnar snapshot of tasks, for analysis.
+
+Holding a whole database of ``Task`` objects in memory is expensive. A
+``TaskTable`` stores each field as a column instead: booleans as bit arrays
+(with a second bit array saying which rows are null, if they can be),
+datetimes as 64-bit microseconds since the epoch, and strings interned so that
+shared names (e.g. of projects and tags) are only stored once.
+
+Needs NumPy. Install ``omnimetrics[analysis]`` to get it.
+"""
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, get_type_hints
+
+import numpy as np
+
+from omnimetrics._database import Task
+from omnimetrics._formats import TASK_SCHEMA, Field, flatten, unwrap_optional
+
+# How we store an integer that isn't there.
+NO_INTEGER = np.iinfo(np.int64).min
+
+# How many rows to convert to arrays at a time, when building a table.
+_CHUNK_SIZE = 10_000
+
+
+class Mask:
+    """A set of rows in a ``TaskTable``, stored as one bit per row.
+
+    Combine masks with ``&``, ``|`` and ``~``. All of these operate on the
+    packed bits, eight rows at a time.
+    """
+
+    def __init__(self, bits: np.ndarray, size: int) -> None:
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def from_bools(cls, bools: np.ndarray) -> Mask:
+        return cls(np.packbits(bools), len(bools))
+
+    def __and__(self, other: Mask) -> Mask:
+        return Mask(self.bits & other.bits, self.size)
+
+    def __or__(self, other: Mask) -> Mask:
+        return Mask(self.bits | other.bits, self.size)
+
+    def __invert__(self) -> Mask:
+        # Also flips the padding at the end of the last byte, but we never
+        # unpack that far.
+        return Mask(~self.bits, self.size)
+
+    def __getitem__(self, index: int) -> bool:
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def to_bools(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=self.size).astype(bool)
+
+    def indices(self) -> np.ndarray:
+        """The indices of the rows in this mask."""
+        return np.flatnonzero(self.to_bools())
+
+    def count(self) -> int:
+        return int(np.count_nonzero(self.to_bools()))
+
+
+class TaskTable:
+    """A columnar snapshot of tasks.
+
+    Columns are named after ``Task`` fields. Fields of references are flattened
+    into their own columns, e.g. ``containing_project.name``.
+    """
+
+    def __init__(
+        self, columns: Dict[str, Any], size: int, nulls: Optional[Dict[str, Mask]] = None
+    ) -> None:
+        self._columns = columns
+        self._size = size
+        # The rows of each nullable boolean column that don't have a value,
+        # e.g. because they come from a dump made before the field existed.
+        self._nulls = {} if nulls is None else nulls
+
+    @classmethod
+    def from_tasks(cls, tasks: Iterable[Task]) -> TaskTable:
+        """Build a table from ``Task`` objects, e.g. as returned by ``load_tasks``."""
+        return cls._from_rows(tasks, _get_attribute)
+
+    @classmethod
+    def from_dump(cls, path: Path) -> TaskTable:
+        """Build a table from a newline-delimited JSON dump.
+
+        Skips any tombstones, if the dump is a change log.
+        """
+        with path.open() as dump:
+            rows = (json.loads(line) for line in dump)
+            return cls._from_rows((row for row in rows if not row.get("deleted")), _get_item)
+
+    @classmethod
+    def _from_rows(cls, rows: Iterable[Any], get: Callable[[Any, str], Any]) -> TaskTable:
+        rows = iter(rows)
+        chunks: Dict[str, List[np.ndarray]] = {name: [] for name, _ in _COLUMNS}
+        size = 0
+        while True:
+            chunk = list(islice(rows, _CHUNK_SIZE))
+            if not chunk:
+                break
+            size += len(chunk)
+            for name, field in _COLUMNS:
+                values = [_get_path(row, name, get) for row in chunk]
+                chunks[name].append(_to_array(field, values))
+        columns: Dict[str, Any] = {}
+        nulls: Dict[str, Mask] = {}
+        for name, field in _COLUMNS:
+            column = np.concatenate(chunks[name]) if chunks[name] else _to_array(field, [])
+            if field.type != "BOOLEAN":
+                columns[name] = column
+                continue
+            if field.nullable:
+                nulls[name] = Mask.from_bools(np.equal(column, None))
+                column = np.equal(column, True)
+            columns[name] = Mask.from_bools(column)
+        return cls(columns, size, nulls)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Roughly how much memory the table uses, including strings."""
+        total = 0
+        strings = {}
+        for column in self._columns.values():
+            if isinstance(column, Mask):
+                total += column.bits.nbytes
+                continue
+            total += column.nbytes
+            if column.dtype == object:
+                strings.update((id(value), value) for value in column if value is not None)
+        total += sum(nulls.bits.nbytes for nulls in self._nulls.values())
+        return total + sum(sys.getsizeof(value) for value in strings.values())
+
+    def column(self, name: str) -> np.ndarray:
+        """Get the column called ``name`` as an array.
+
+        Nullable boolean columns are arrays of objects, with ``None`` for
+        missing values.
+        """
+        column = self._columns[name]
+        if not isinstance(column, Mask):
+            return column
+        if name not in self._nulls:
+            return column.to_bools()
+        values = column.to_bools().astype(object)
+        values[self._nulls[name].to_bools()] = None
+        return values
+
+    def mask(self, name: str) -> Mask:
+        """The rows where the boolean column ``name`` is true, and not null."""
+        column = self._columns[name]
+        if not isinstance(column, Mask):
+            raise TypeError(f"{name} is not a boolean column")
+        return column
+
+    def is_null(self, name: str) -> Mask:
+        """The rows that don't have a value for ``name``."""
+        column = self._columns[name]
+        if isinstance(column, Mask):
+            return self._nulls.get(name) or Mask.from_bools(np.zeros(self._size, dtype=bool))
+        if column.dtype.kind == "M":
+            return Mask.from_bools(np.isnat(column))
+        if column.dtype == object:
+            return Mask.from_bools(np.equal(column, None))
+        return Mask.from_bools(column == NO_INTEGER)
+
+    def before(self, name: str, when: datetime) -> Mask:
+        """The rows where the datetime column ``name`` is before ``when``."""
+        return Mask.from_bools(self._columns[name] < np.datetime64(when, "us"))
+
+    def after(self, name: str, when: datetime) -> Mask:
+        """The rows where the datetime column ``name`` is after ``when``."""
+        return Mask.from_bools(self._columns[name] > np.datetime64(when, "us"))
+
+    def task(self, index: int) -> Task:
+        """Rebuild the ``Task`` in row ``index``."""
+        values: Dict[str, Any] = {}
+        for name, field in _COLUMNS:
+            value = self._columns[name][index]
+            if field.type == "BOOLEAN" and name in self._nulls and self._nulls[name][index]:
+                value = None
+            elif field.type == "TIMESTAMP":
+                value = value.item()
+            elif field.type == "INTEGER":
+                value = None if value == NO_INTEGER else int(value)
+            values[name] = value
+        for name, record_class in _RECORDS.items():
+            parts = {
+                key.split(".", 1)[1]: values.pop(key)
+                for key in list(values)
+                if key.startswith(name + ".")
+            }
+            values[name] = None if all(v is None for v in parts.values()) else record_class(**parts)
+        return Task(**values)
+
+    def tasks(self, mask: Optional[Mask] = None) -> Iterator[Task]:
+        """Rebuild the ``Task`` in every row in ``mask``, or every row."""
+        indices = range(self._size) if mask is None else mask.indices()
+        for index in indices:
+            yield self.task(index)
+
+
+_COLUMNS = flatten(TASK_SCHEMA)
+
+# The classes of the references, by field.
+_RECORDS = {
+    field.name: unwrap_optional(get_type_hints(Task)[field.name])[0]
+    for field in TASK_SCHEMA
+    if field.type == "RECORD"
+}
+
+
+def _get_attribute(row: Any, name: str) -> Any:
+    return getattr(row, name)
+
+
+def _get_item(row: Any, name: str) -> Any:
+    return row.get(name)
+
+
+def _get_path(row: Any, path: str, get: Callable[[Any, str], Any]) -> Any:
+    value = row
+    for name in path.split("."):
+        if value is None:
+            return None
+        value = get(value, name)
+    return value
+
+
+def _to_array(field: Field, values: List[Any]) -> np.ndarray:
+    if field.type == "BOOLEAN":
+        # Keep the nulls, so we can tell "no value" from false.
+        return np.array(values, dtype=object if field.nullable else bool)
+    if field.type == "TIMESTAMP":
+        # Copes with both datetimes and ISO 8601 strings, and with ``None``.
+        return np.array(values, dtype="datetime64[us]")
+    if field.type == "INTEGER":
+        return np.array([NO_INTEGER if v is None else v for v in values], dtype=np.int64)
+    return np.array([None if v is None else sys.intern(v) for v in values], dtype=object)
@@ -0,0 +1,112 @@
+"""Stream compressed dumps straight to Google Cloud Storage."""
+from __future__ import annotations
+
+import gzip
+import time
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Tuple, TypeVar, cast
+
+T = TypeVar("T")
+
+# Resumable uploads are sent in chunks, which must be a multiple of 256 KiB.
+DEFAULT_CHUNK_SIZE = 32 * 256 * 1024
+
+
+@dataclass(frozen=True)
+class UploadStats:
+    """What it took to upload a dump."""
+
+    # Bytes written before compression.
+    bytes_in: int
+    # Bytes actually uploaded.
+    bytes_out: int
+    seconds: float
+    # How much of ``seconds`` was spent sending, rather than writing and
+    # compressing.
+    upload_seconds: float = 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_in / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Uploaded {self.bytes_out} bytes ({self.bytes_in} uncompressed, "
+            f"{self.compression_ratio:.1f}x) in {self.seconds:.2f}s "
+            f"({self.bytes_per_second:.0f} bytes/s)"
+        )
+
+
+class _CountingWriter:
+    """Passes bytes through to ``raw``, counting them, and timing how long it takes."""
+
+    def __init__(self, raw: IO[bytes]) -> None:
+        self._raw = raw
+        self.count = 0
+        self.seconds = 0.0
+
+    def write(self, data: bytes) -> int:
+        self.count += len(data)
+        start = time.perf_counter()
+        try:
+            return self._raw.write(data)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+class _CompressingWriter:
+    """A text stream that gzips everything written to it into ``raw``."""
+
+    def __init__(self, raw: IO[bytes]) -> None:
+        self._compressed = _CountingWriter(raw)
+        self._gzip = gzip.GzipFile(fileobj=self._compressed, mode="wb")
+        self.bytes_in = 0
+
+    @property
+    def bytes_out(self) -> int:
+        return self._compressed.count
+
+    @property
+    def upload_seconds(self) -> float:
+        return self._compressed.seconds
+
+    def write(self, text: str) -> int:
+        data = text.encode("utf-8")
+        self.bytes_in += len(data)
+        self._gzip.write(data)
+        return len(text)
+
+    def close(self) -> None:
+        self._gzip.close()
+
+
+def upload_compressed(
+    blob: Any, write: Callable[[IO[str]], T], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Tuple[T, UploadStats]:
+    """Upload whatever ``write`` writes to ``blob``, gzipping it on the way.
+
+    ``write`` is given a text stream. Every ``chunk_size`` bytes of compressed
+    output is sent as part of a resumable upload as soon as it's ready, so
+    nothing is buffered on disk and the upload happens alongside the writing.
+
+    Returns whatever ``write`` returns, along with how the upload went.
+    """
+    start = time.perf_counter()
+    with blob.open("wb", chunk_size=chunk_size, content_type="application/gzip") as raw:
+        output = _CompressingWriter(raw)
+        result = write(cast(IO[str], output))
+        output.close()
+        # Closing sends the last chunk.
+        closing = time.perf_counter()
+    end = time.perf_counter()
+    stats = UploadStats(
+        bytes_in=output.bytes_in,
+        bytes_out=output.bytes_out,
+        seconds=end - start,
+        upload_seconds=output.upload_seconds + end - closing,
+    )
+    return result, stats
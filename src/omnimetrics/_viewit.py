@@ -1,11 +1,30 @@
 # From https://gist.github.com/glyph/24913ce5c9dac71b7a9c331f2a9d67fc
-from Foundation import NSURL
-from ScriptingBridge import SBApplication
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
 
-omniFocus = SBApplication.applicationWithURL_(
-    NSURL.URLWithString_("file:///Applications/OmniFocus.app")
-)
-taskClass = omniFocus.classForScriptingClass_("task")
+import click
+
+from omnimetrics._database import k, resolve_missing_value
+from omnimetrics._profile import Profile
+from omnimetrics._source import connect_source, source_options
+
+
+@lru_cache(maxsize=None)
+def omniFocus():
+    """Connect to OmniFocus through ScriptingBridge, the first time we need it."""
+    from Foundation import NSURL
+    from ScriptingBridge import SBApplication
+
+    return SBApplication.applicationWithURL_(
+        NSURL.URLWithString_("file:///Applications/OmniFocus.app")
+    )
+
+
+@lru_cache(maxsize=None)
+def taskClass():
+    """The ScriptingBridge class of OmniFocus tasks."""
+    return omniFocus().classForScriptingClass_("task")
 
 
 def itemsInView():
@@ -15,7 +34,7 @@ def itemsInView():
     XXX: What are 'items'? Can be tasks, but can also be other things.
     XXX: What does it mean to have multiple documents?
     """
-    content = omniFocus.documents()[0].documentWindows()[0].content()
+    content = omniFocus().documents()[0].documentWindows()[0].content()
     for element in content.leaves():
         # XXX: Still unsure of the distinction between `.value()` and `.get()`
         yield element.value()
@@ -51,7 +70,96 @@ def qualifiedName(item):
 
 def isTask(item):
     """Is the given item an OmniFocus task?"""
-    return item.isKindOfClass_(taskClass)
+    return item.isKindOfClass_(taskClass())
+
+
+@dataclass(frozen=True)
+class ViewItem:
+    """A task in view, with everything we need to know to report on it."""
+
+    name: Optional[str]
+    estimatedMinutes: Optional[int]
+    blocked: bool
+
+
+def tasksInView(omnifocus, hierarchy=None):
+    """Get all of the tasks in view on the front window, in bulk.
+
+    Asking for each item, and then for each of its properties and parents, is
+    at least one Apple Event per question. Instead, ask for one property of
+    every item at once, so this sends the same eight events no matter how much
+    is in view.
+
+    Uses appscript rather than ScriptingBridge, because it can ask for a
+    property of a property of every element (e.g. the id of the value of
+    every leaf) in one event.
+
+    If we already have a ``Hierarchy`` of all the tasks, use that rather than
+    asking about them again, so this sends just two events.
+    """
+    document = omnifocus.default_document
+    visible = visibleTaskIds(document)
+    if hierarchy is not None:
+        return viewItems(visible, hierarchy)
+    # Parents aren't necessarily in view, so get names and parents for
+    # everything. That's all we need, so don't load every task.
+    tasks = document.flattened_tasks
+    ids = tasks.id()
+    names = dict(zip(ids, tasks.name()))
+    parents = dict(zip(ids, tasks.parent_task.id()))
+    parentNames = dict(zip(ids, tasks.parent_task.name()))
+    blocked = dict(zip(ids, tasks.blocked()))
+    estimates = dict(zip(ids, tasks.estimated_minutes()))
+
+    qualifiedNames = {}
+
+    def qualify(taskId):
+        if taskId not in qualifiedNames:
+            name = names[taskId]
+            parent = resolve_missing_value(parents[taskId])
+            if parent is None:
+                prefix = ""
+            elif parent in names:
+                prefix = qualify(parent)
+            else:
+                # e.g. the root task of a project.
+                prefix = resolve_missing_value(parentNames[taskId])
+            if name is None or prefix is None:
+                qualifiedNames[taskId] = None
+            else:
+                qualifiedNames[taskId] = prefix + " / " + name if prefix else name
+        return qualifiedNames[taskId]
+
+    return [
+        ViewItem(
+            name=qualify(taskId),
+            estimatedMinutes=resolve_missing_value(estimates[taskId]),
+            blocked=blocked[taskId],
+        )
+        for taskId in visible
+        if taskId in names
+    ]
+
+
+def visibleTaskIds(document):
+    """Get the ids of the tasks in view on the front window, in two Apple Events."""
+    values = document.document_windows[1].content.leaves.value
+    return [
+        itemId for itemId, itemClass in zip(values.id(), values.class_()) if itemClass == k.task
+    ]
+
+
+def viewItems(visible, hierarchy):
+    """Describe the tasks with the ids in ``visible``, using ``hierarchy``."""
+    return [
+        ViewItem(
+            name=hierarchy.qualified_name(taskId),
+            estimatedMinutes=hierarchy[taskId].estimated_minutes,
+            blocked=hierarchy[taskId].is_blocked,
+        )
+        for taskId in visible
+        if taskId in hierarchy
+    ]
 
 
 def reportEstimates(items):
@@ -63,8 +171,8 @@ def reportEstimates(items):
     total = 0
     unestimatedItems = []
     for item in items:
-        name = qualifiedName(item)
-        estimated = item.estimatedMinutes().get()
+        name = item.name
+        estimated = item.estimatedMinutes
         if estimated is None:
             unestimatedItems.append(name)
         else:
@@ -90,9 +198,18 @@ def formatMinutes(m):
     return "%sm" % (m,)
 
 
-def main():
-    activeTasks = (i for i in itemsInView() if isTask(i) and not i.blocked())
+@click.command()
+@click.option("--stats/--no-stats", default=False, help="Show how many calls we made to OmniFocus.")
+@source_options
+def main(stats, daemon, source, dump):
+    """Show how long the tasks in view in OmniFocus are expected to take."""
+    profile = Profile()
+    items = connect_source(daemon, source, dump, profile if stats else None).view()
+    activeTasks = (i for i in items if not i.blocked)
     reportEstimates(activeTasks)
+    if stats:
+        print()
+        print(profile.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""Fixtures shared by the tests."""
+
+import io
+from datetime import datetime
+
+import pytest
+from google.cloud import bigquery
+
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import FakeObject, fake_omnifocus, fake_task, synthetic_database
+from omnimetrics._formats import (
+    TASK_SCHEMA,
+    bigquery_schema,
+    write_avro,
+    write_json,
+    write_parquet,
+)
+
+CREATED = datetime(2020, 9, 1, 12, 30)
+
+# How to write a dump, by its suffix.
+WRITERS = {
+    ".json": ("w", write_json),
+    ".parquet": ("wb", write_parquet),
+    ".avro": ("wb", write_avro),
+}
+
+
+class FakeStorageClient:
+    """Stands in for a ``google.cloud.storage.Client``."""
+
+    def __init__(self):
+        self.blobs = {}
+        # What was in each blob that's been deleted.
+        self.deleted = {}
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def blob(self, path):
+        return FakeBlob(self._client, f"gs://{self._name}/{path}")
+
+
+class FakeBlob:
+    def __init__(self, client, uri):
+        self._client = client
+        self._blobs = client.blobs
+        self._uri = uri
+        self.chunk_size = None
+
+    @property
+    def data(self):
+        return self._blobs.get(self._uri)
+
+    def open(self, mode, chunk_size=None, content_type=None):
+        assert mode == "wb"
+        self.chunk_size = chunk_size
+        return FakeBlobWriter(self._blobs, self._uri)
+
+    def upload_from_filename(self, filename):
+        with open(filename, "rb") as f:
+            self._blobs[self._uri] = f.read()
+
+    def delete(self):
+        self._client.deleted[self._uri] = self._blobs.pop(self._uri)
+
+
+class FakeBlobWriter(io.BytesIO):
+    def __init__(self, blobs, uri):
+        super().__init__()
+        self._blobs = blobs
+        self._uri = uri
+
+    def close(self):
+        self._blobs[self._uri] = self.getvalue()
+        super().close()
+
+
+class FakeJob:
+    def result(self):
+        return None
+
+
+class FakeBigQueryClient:
+    """Stands in for a ``google.cloud.bigquery.Client``, recording jobs.
+
+    Its tables have the schema ``schema``, which defaults to that of ``Task``.
+    """
+
+    def __init__(self, schema=None):
+        self.jobs = []
+        self.deleted_tables = []
+        self.schema = bigquery_schema(TASK_SCHEMA) if schema is None else schema
+
+    def get_table(self, name):
+        return bigquery.Table(f"project.{name}", schema=self.schema)
+
+    def update_table(self, table, fields):
+        assert fields == ["schema"]
+        self.schema = table.schema
+        return table
+
+    def load_table_from_uri(self, uris, destination, job_config):
+        self.jobs.append(("load", list(uris), destination, job_config))
+        return FakeJob()
+
+    def query(self, sql, job_config):
+        self.jobs.append(("query", sql, job_config))
+        return FakeJob()
+
+    def delete_table(self, name, not_found_ok=False):
+        self.deleted_tables.append(name)
+
+
+@pytest.fixture
+def storage_client():
+    """A fake GCS client, whose ``blobs`` are what's been uploaded, by URI."""
+    return FakeStorageClient()
+
+
+@pytest.fixture
+def bigquery_client():
+    """A fake BigQuery client, whose ``jobs`` are the jobs it's been given."""
+    return FakeBigQueryClient()
+
+
+@pytest.fixture
+def tasks():
+    """The tasks of a synthetic database."""
+    return list(load_tasks(synthetic_database(200).appscript().default_document))
+
+
+@pytest.fixture
+def sample_tasks():
+    """A few tasks, between them using most of the columns a task has."""
+    project = FakeObject({"name": "House"})
+    parent = fake_task("a", "Tidy", CREATED, containing_project=project, flagged=True)
+    omnifocus = fake_omnifocus(
+        [
+            parent,
+            fake_task(
+                "b",
+                'Kitchen "café" ☕',
+                CREATED,
+                parent_task=parent,
+                containing_project=project,
+                primary_tag=FakeObject({"name": "Errands"}),
+                estimated_minutes=20,
+                due_date=datetime(2020, 9, 3, 17),
+                flagged=True,
+                completed=True,
+                completion_date=datetime(2020, 9, 2),
+            ),
+            fake_task("c", "Inbox item", CREATED, in_inbox=True),
+        ]
+    )
+    return list(load_tasks(omnifocus.default_document))
+
+
+@pytest.fixture
+def write_dump():
+    """Write tasks to a dump at a path, in the format that its suffix says."""
+
+    def write(path, tasks):
+        mode, write_tasks = WRITERS[path.suffix]
+        with path.open(mode) as f:
+            write_tasks(tasks, f)
+
+    return write
@@ -0,0 +1,181 @@
+"""Tests for backfilling BigQuery from local dumps."""
+
+import gzip
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from click.testing import CliRunner
+from omnimetrics import _script
+from omnimetrics._backfill import Manifest, backfill, find_dumps, replace_partitions_sql
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._formats import TASK_SCHEMA, bigquery_schema, deserialize_task, write_json
+
+
+def write_dumps(directory, num_days, start=datetime(2020, 9, 1, 6)):
+    tasks = list(load_tasks(synthetic_database(20).appscript().default_document))
+    for day in range(num_days):
+        taken_at = start + timedelta(days=day)
+        with (directory / taken_at.strftime("omnifocus-%Y%m%d-%H%M%S.json")).open("w") as f:
+            write_json(tasks, f)
+    return tasks
+
+
+def test_find_dumps(tmp_path):
+    write_dumps(tmp_path, 3)
+    # A later dump on the same day wins.
+    write_dumps(tmp_path, 1, start=datetime(2020, 9, 2, 18))
+    (tmp_path / "omnifocus-tags-20200901-060000.json").write_text("")
+    dumps = find_dumps(tmp_path)
+    assert [dump.day for dump in dumps] == [date(2020, 9, d) for d in (1, 2, 3)]
+    assert dumps[1].path.name == "omnifocus-20200902-180000.json"
+
+
+def test_find_dumps_rejects_change_logs(tmp_path):
+    (tmp_path / "omnifocus-20200901-060000.json").write_text('{"id": "a", "deleted": true}\n')
+    with pytest.raises(ValueError):
+        find_dumps(tmp_path)
+
+
+def test_backfill_batches_jobs(tmp_path, storage_client, bigquery_client):
+    tasks = write_dumps(tmp_path, 5)
+    manifest_path = tmp_path / "manifest.json"
+    batches = backfill(
+        find_dumps(tmp_path),
+        storage_client,
+        bigquery_client,
+        "bucket",
+        "backfill",
+        "dataset.tasks",
+        Manifest.load(manifest_path),
+        manifest_path,
+        max_files_per_job=3,
+        echo=lambda message: None,
+    )
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert [job[0] for job in bigquery_client.jobs] == ["load", "query", "load", "query"]
+    _, uris, staging, _ = bigquery_client.jobs[0]
+    assert staging == "dataset.tasks_backfill_staging"
+    assert len(uris) == 3 and all(uri.startswith("gs://bucket/backfill/") for uri in uris)
+    # Nothing staged is left behind.
+    assert storage_client.blobs == {}
+    assert len(storage_client.deleted) == 5
+    assert bigquery_client.deleted_tables == ["dataset.tasks_backfill_staging"]
+    rows = [
+        json.loads(line)
+        for line in gzip.decompress(storage_client.deleted[uris[0]]).splitlines()
+    ]
+    assert [row["id"] for row in rows] == [task.id for task in tasks]
+    assert {row["snapshot_date"] for row in rows} == {"2020-09-01"}
+    assert [deserialize_task(row) for row in rows] == tasks
+    _, sql, config = bigquery_client.jobs[1]
+    assert "DELETE FROM `dataset.tasks`" in sql
+    (parameter,) = config.query_parameters
+    assert parameter.values == [datetime(2020, 9, d, tzinfo=timezone.utc) for d in (1, 2, 3)]
+
+    # Everything's loaded, so there's nothing left to do.
+    bigquery_client.jobs.clear()
+    write_dumps(tmp_path, 1, start=datetime(2020, 9, 6, 6))
+    batches = backfill(
+        find_dumps(tmp_path),
+        storage_client,
+        bigquery_client,
+        "bucket",
+        "backfill",
+        "dataset.tasks",
+        Manifest.load(manifest_path),
+        manifest_path,
+        echo=lambda message: None,
+    )
+    assert [[dump.day for dump in batch] for batch in batches] == [[date(2020, 9, 6)]]
+    assert len(bigquery_client.jobs) == 2
+
+
+def test_failed_backfill_cleans_up(tmp_path, storage_client, bigquery_client, monkeypatch):
+    write_dumps(tmp_path, 2)
+
+    def query(sql, job_config):
+        raise RuntimeError("BigQuery is down")
+
+    monkeypatch.setattr(bigquery_client, "query", query)
+    manifest_path = tmp_path / "manifest.json"
+    with pytest.raises(RuntimeError):
+        backfill(
+            find_dumps(tmp_path),
+            storage_client,
+            bigquery_client,
+            "bucket",
+            "backfill",
+            "dataset.tasks",
+            Manifest.load(manifest_path),
+            manifest_path,
+            echo=lambda message: None,
+        )
+    assert storage_client.blobs == {}
+    assert len(storage_client.deleted) == 2
+    assert bigquery_client.deleted_tables == ["dataset.tasks_backfill_staging"]
+    assert not manifest_path.exists()
+
+
+def test_partitions_are_replaced_in_one_transaction():
+    statements = [
+        statement.strip()
+        for statement in replace_partitions_sql("dataset.staging", "dataset.tasks").split(";")
+        if statement.strip()
+    ]
+    assert statements[0] == "BEGIN TRANSACTION"
+    assert statements[1].startswith("DELETE FROM `dataset.tasks`")
+    assert statements[2].startswith("INSERT INTO `dataset.tasks`")
+    assert statements[3] == "COMMIT TRANSACTION"
+    assert len(statements) == 4
+
+
+def test_backfill_into_table_without_new_columns(tmp_path, storage_client, bigquery_client):
+    write_dumps(tmp_path, 2)
+    added = ["note", "has_children", "is_effectively_flagged", "effective_completion_date"]
+    added.append("effective_dropped_date")
+    old_schema = [field for field in bigquery_schema(TASK_SCHEMA) if field.name not in added]
+    bigquery_client.schema = old_schema
+    manifest_path = tmp_path / "manifest.json"
+    backfill(
+        find_dumps(tmp_path),
+        storage_client,
+        bigquery_client,
+        "bucket",
+        "backfill",
+        "dataset.tasks",
+        Manifest.load(manifest_path),
+        manifest_path,
+        echo=lambda message: None,
+    )
+    columns = [field.name for field in bigquery_client.schema]
+    first = len(old_schema)
+    assert columns[first:] == added
+    assert all(field.is_nullable for field in bigquery_client.schema[first:])
+    # Every column the query inserts into is in the table, by the time it runs.
+    _, sql, _ = bigquery_client.jobs[1]
+    inserted = sql.split("INSERT INTO `dataset.tasks` (", 1)[1].split(")", 1)[0]
+    assert {name.strip(" `") for name in inserted.split(",")} - set(columns) == {"_PARTITIONTIME"}
+
+
+def test_backfill_dry_run(tmp_path):
+    write_dumps(tmp_path, 2)
+    manifest_path = tmp_path / "manifest.json"
+    Manifest({"dataset.tasks": {"20200901": {}}}).save(manifest_path)
+    result = CliRunner().invoke(
+        _script.omnimetrics,
+        [
+            "backfill",
+            "--manifest",
+            str(manifest_path),
+            "--dry-run",
+            str(tmp_path),
+            "bucket",
+            "dataset.tasks",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == [
+        f"20200902 {tmp_path / 'omnifocus-20200902-060000.json'}"
+    ]
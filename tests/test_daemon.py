@@ -0,0 +1,294 @@
+"""Tests for the omnimetrics daemon."""
+
+import io
+import json
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics import _script, _source, _viewit
+from omnimetrics._daemon import (
+    Client,
+    Daemon,
+    DaemonError,
+    LiveBackend,
+    Server,
+    Snapshot,
+    SnapshotFileBackend,
+    connect_client,
+)
+from omnimetrics._database import EXTRA_TASK_COLUMNS
+from omnimetrics._fakeapp import FakeObject, fake_omnifocus, fake_task, synthetic_database
+from omnimetrics._hierarchy import Hierarchy, is_available
+from omnimetrics._procrastinatron import pollAvailability, showTask
+from omnimetrics._script import omnimetrics
+
+MONDAY = datetime(2020, 9, 7, 9)
+TUESDAY = datetime(2020, 9, 8, 9)
+LATER = datetime(2100, 1, 1)
+
+
+@pytest.fixture
+def dump(tmp_path, tasks, write_dump):
+    path = tmp_path / "omnifocus-20200907-090000.json"
+    write_dump(path, tasks)
+    return path
+
+
+@pytest.fixture
+def server(tmp_path, dump):
+    server = Daemon(SnapshotFileBackend(dump)).serve(tmp_path / "d.sock", refresh_interval=60)
+    yield server
+    server.shutdown()
+
+
+def test_snapshot_file_backend(dump, tasks):
+    daemon = Daemon(SnapshotFileBackend(dump))
+    assert daemon.status() == {"taken_at": "2020-09-07T09:00:00", "tasks": len(tasks)}
+    assert list(daemon.snapshot.tasks.values()) == tasks
+    first = next(task for task in tasks if is_available(task))
+    hierarchy = Hierarchy(tasks)
+    assert daemon.next_task(now=LATER.isoformat()) == {
+        "id": first.id,
+        "name": hierarchy.qualified_name(first.id),
+    }
+    second = daemon.next_task(exclude=[first.id], now=LATER.isoformat())
+    assert second["id"] != first.id
+
+
+def test_snapshot_file_backend_refreshes_when_dump_changes(dump, tasks, write_dump):
+    daemon = Daemon(SnapshotFileBackend(dump))
+    snapshot = daemon.snapshot
+    daemon.refresh()
+    assert daemon.snapshot is snapshot
+    write_dump(dump, tasks[:10])
+    assert daemon.refresh()["tasks"] == 10
+
+
+def test_availability_matches_poll():
+    omnifocus = synthetic_database(200).appscript()
+    daemon = Daemon(LiveBackend(omnifocus))
+    rows = daemon.availability(now=LATER.isoformat())
+    polled = pollAvailability(omnifocus.default_document, LATER)
+    assert [(row[0], row[1], row[2]) for row in rows] == [
+        (a.taskId, a.modified.isoformat(), a.available) for a in polled
+    ]
+
+
+def test_availability_respects_defer_dates():
+    deferred = fake_task("b", "B", MONDAY, effective_defer_date=TUESDAY)
+    omnifocus = fake_omnifocus([fake_task("a", "A", MONDAY), deferred])
+    daemon = Daemon(LiveBackend(omnifocus))
+    assert [row[2] for row in daemon.availability(now=MONDAY.isoformat())] == [True, False]
+    assert [row[2] for row in daemon.availability(now=TUESDAY.isoformat())] == [True, True]
+
+
+def test_view_matches_viewit():
+    omnifocus = synthetic_database(200).appscript()
+    daemon = Daemon(LiveBackend(omnifocus))
+    expected = _viewit.tasksInView(omnifocus)
+    assert [_viewit.ViewItem(*fields) for fields in daemon.view()] == expected
+
+
+def test_view_follows_the_window():
+    tasks = [fake_task(str(i), f"Task {i}", MONDAY) for i in range(10)]
+    omnifocus = fake_omnifocus(tasks, visible=tasks[:2])
+    daemon = Daemon(LiveBackend(omnifocus))
+    assert [fields[0] for fields in daemon.view()] == ["Task 0", "Task 1"]
+    # The user looks at something else, without changing any tasks.
+    [window] = omnifocus._document.elements["document_windows"]
+    window.properties["content"].elements["leaves"] = [
+        FakeObject({"id": task.properties["id"], "value": task}) for task in tasks[5:7]
+    ]
+    omnifocus.events.clear()
+    assert [fields[0] for fields in daemon.view()] == ["Task 5", "Task 6"]
+    # Just the ids and classes of what's in view.
+    assert omnifocus.event_count == 2
+
+
+class BlockingBackend:
+    """A backend whose refreshes wait until they're let go."""
+
+    def __init__(self):
+        self.refreshing = threading.Event()
+        self.release = threading.Event()
+        self.overlapped = False
+
+    def load(self):
+        return Snapshot([], MONDAY)
+
+    def refresh(self, snapshot):
+        self.refreshing.set()
+        self.release.wait()
+        self.refreshing.clear()
+        return snapshot
+
+    def visible(self):
+        self.overlapped = self.overlapped or self.refreshing.is_set()
+        return []
+
+
+def test_view_waits_for_refresh():
+    backend = BlockingBackend()
+    daemon = Daemon(backend)
+    refresh = threading.Thread(target=daemon.refresh)
+    refresh.start()
+    backend.refreshing.wait()
+    view = threading.Thread(target=daemon.view)
+    view.start()
+    view.join(0.1)
+    backend.release.set()
+    refresh.join()
+    view.join()
+    assert not backend.overlapped
+
+
+def test_live_backend_refreshes_incrementally():
+    tasks = [fake_task(str(i), f"Task {i}", MONDAY - timedelta(minutes=i)) for i in range(100)]
+    omnifocus = fake_omnifocus(tasks)
+    daemon = Daemon(LiveBackend(omnifocus))
+    tasks[3].properties.update(name="Renamed", modification_date=TUESDAY)
+    tasks.append(fake_task("new", "New", TUESDAY))
+    del tasks[0]
+    omnifocus.events.clear()
+    assert daemon.refresh()["tasks"] == 100
+    # Finding what changed, the properties ``properties()`` leaves out, and
+    # reading the two changed tasks.
+    assert omnifocus.event_count == 3 + len(EXTRA_TASK_COLUMNS) + 2
+    snapshot = daemon.snapshot
+    assert "0" not in snapshot.tasks
+    assert snapshot.tasks["3"].name == "Renamed"
+    assert snapshot.hierarchy.qualified_name("new") == "New"
+
+
+def test_serve(server, dump, tasks):
+    client = Client(server.path)
+    assert client.status()["tasks"] == len(tasks)
+    output = io.StringIO()
+    assert client.dump(output) == len(tasks)
+    assert output.getvalue() == dump.read_text()
+    with pytest.raises(DaemonError, match="Unknown command"):
+        client.request("launch-missiles")
+    with pytest.raises(DaemonError, match="Bad request"):
+        client.request("status", extra=1)
+
+
+def test_serve_bad_json(server):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(server.path))
+        sock.sendall(b"[1, 2\n")
+        response = json.loads(sock.makefile().readline())
+    assert not response["ok"]
+
+
+def test_client_availability(server, tasks):
+    client = connect_client(server.path)
+    availabilities, names = client.availability(LATER)
+    assert [a.taskId for a in availabilities] == [task.id for task in tasks]
+    assert [a.available for a in availabilities] == [is_available(task) for task in tasks]
+    hierarchy = Hierarchy(tasks)
+    assert showTask(tasks[-1].id, names) == hierarchy.qualified_name(tasks[-1].id)
+
+
+def test_connect_client_without_daemon(tmp_path):
+    assert connect_client(tmp_path / "missing.sock") is None
+    stale = tmp_path / "stale.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(stale))
+    assert connect_client(stale) is None
+
+
+def test_serve_refuses_to_share_a_socket(server, dump):
+    with pytest.raises(DaemonError):
+        Daemon(SnapshotFileBackend(dump)).serve(server.path)
+
+
+def test_serve_replaces_stale_socket(tmp_path, dump):
+    path = tmp_path / "d.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(path))
+    server = Daemon(SnapshotFileBackend(dump)).serve(path)
+    try:
+        assert connect_client(path).status()["tasks"] > 0
+    finally:
+        server.shutdown()
+    assert not path.exists()
+
+
+def test_serve_refreshes_on_a_timer(tmp_path, dump, tasks, write_dump):
+    server = Daemon(SnapshotFileBackend(dump)).serve(tmp_path / "d.sock", refresh_interval=0.01)
+    try:
+        write_dump(dump, tasks[:10])
+        deadline = datetime.now() + timedelta(seconds=5)
+        while Client(server.path).status()["tasks"] != 10:
+            assert datetime.now() < deadline
+    finally:
+        server.shutdown()
+
+
+def test_viewit_asks_daemon(server, monkeypatch):
+    monkeypatch.setenv("OMNIMETRICS_SOCKET", str(server.path))
+    monkeypatch.setattr(_source, "omnifocus", lambda: fake_omnifocus([]))
+    result = CliRunner().invoke(_viewit.main, ["--stats"])
+    assert result.exit_code == 0, result.output
+    assert "Items without estimates: 0" not in result.output
+    assert "Apple Events: 0" in result.output
+
+
+def test_dump_file_from_daemon(server, dump, monkeypatch, tmp_path):
+    monkeypatch.setenv("OMNIMETRICS_SOCKET", str(server.path))
+    output = tmp_path / "out.json"
+    result = CliRunner().invoke(omnimetrics, ["dump-file", "--daemon", str(output)])
+    assert result.exit_code == 0, result.output
+    assert output.read_text() == dump.read_text()
+
+
+def test_dump_file_without_daemon(monkeypatch, tmp_path):
+    monkeypatch.setenv("OMNIMETRICS_SOCKET", str(tmp_path / "missing.sock"))
+    result = CliRunner().invoke(omnimetrics, ["dump-file", "--daemon", str(tmp_path / "out")])
+    assert result.exit_code != 0
+    assert "omnimetrics serve" in result.output
+
+
+def test_serve_command(tmp_path, dump, monkeypatch):
+    path = tmp_path / "d.sock"
+    # Left behind by a daemon that didn't shut down cleanly.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(path))
+    serving = threading.Event()
+    interrupted = threading.Event()
+
+    def wait(server):
+        # Wait for Ctrl-C.
+        serving.set()
+        interrupted.wait(5)
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(Server, "wait", wait)
+    statuses = []
+
+    def client():
+        serving.wait(5)
+        statuses.append(Client(path).status())
+        interrupted.set()
+
+    thread = threading.Thread(target=client)
+    thread.start()
+    result = CliRunner().invoke(
+        omnimetrics, ["serve", "--socket", str(path), "--snapshot", str(dump)]
+    )
+    thread.join()
+    assert result.exit_code == 0, result.output
+    assert f"Serving 200 tasks on {path}" in result.output
+    assert statuses[0]["tasks"] == 200
+    assert not path.exists()
+
+
+def test_serve_command_refuses_to_share_a_socket(server, monkeypatch):
+    monkeypatch.setattr(_script, "omnifocus", lambda: fake_omnifocus([]))
+    result = CliRunner().invoke(omnimetrics, ["serve", "--socket", str(server.path)])
+    assert result.exit_code == 1
+    assert f"Already serving on {server.path}" in result.output
@@ -0,0 +1,142 @@
+"""Tests for extracting tasks from OmniFocus."""
+
+from datetime import datetime
+
+from omnimetrics._database import (
+    EXTRA_TASK_COLUMNS,
+    TASK_COLUMNS,
+    ProjectReference,
+    ReferenceCache,
+    TagReference,
+    TaskReference,
+    TaskTag,
+    load_task_tags,
+    load_tasks,
+    load_tasks_bulk,
+)
+from omnimetrics._fakeapp import FakeObject, Reference, fake_omnifocus, fake_task
+
+
+def make_omnifocus():
+    created = datetime(2020, 9, 1, 12, 30)
+    tag = FakeObject({"name": "Errands"})
+    project = FakeObject({"name": "House"})
+    parent = fake_task("a", "Tidy", created, containing_project=project, number_of_tasks=2)
+    tasks = [
+        parent,
+        fake_task(
+            "b",
+            "Kitchen",
+            created,
+            parent_task=parent,
+            containing_project=project,
+            primary_tag=tag,
+            flagged=True,
+            estimated_minutes=20,
+            due_date=datetime(2020, 9, 3),
+        ),
+        fake_task("c", "Inbox item", created, in_inbox=True),
+    ]
+    return fake_omnifocus(tasks)
+
+
+def test_bulk_matches_per_task():
+    omnifocus = make_omnifocus()
+    expected = list(load_tasks(omnifocus.default_document))
+    assert list(load_tasks_bulk(omnifocus.default_document)) == expected
+
+
+def test_bulk_resolves_references():
+    omnifocus = make_omnifocus()
+    [parent, child, inbox] = load_tasks_bulk(omnifocus.default_document)
+    assert child.primary_tag == TagReference(name="Errands")
+    assert child.parent_task == TaskReference(id="a", name="Tidy")
+    assert child.containing_project == ProjectReference(name="House")
+    assert child.due_date == datetime(2020, 9, 3)
+    assert inbox.parent_task is None
+    assert inbox.containing_project is None
+    assert inbox.estimated_minutes is None
+
+
+def test_properties_that_properties_leaves_out():
+    created = datetime(2020, 9, 1, 12, 30)
+    parent = fake_task("a", "Tidy", created, number_of_tasks=1, flagged=True)
+    child = fake_task(
+        "b",
+        "Kitchen",
+        created,
+        parent_task=parent,
+        note="Behind the fridge too",
+        effectively_flagged=True,
+        effective_completion_date=datetime(2020, 9, 2),
+    )
+    omnifocus = fake_omnifocus([parent, child])
+    for load in [load_tasks, load_tasks_bulk]:
+        [parent_task, child_task] = load(omnifocus.default_document)
+        assert parent_task.has_children
+        assert parent_task.note == ""
+        assert not child_task.has_children
+        assert child_task.note == "Behind the fridge too"
+        assert child_task.is_effectively_flagged
+        assert not child_task.is_flagged
+        assert child_task.effective_completion_date == datetime(2020, 9, 2)
+        assert child_task.effective_dropped_date is None
+
+
+def test_task_tags():
+    created = datetime(2020, 9, 1, 12, 30)
+    errands = FakeObject({"id": "t1", "name": "Errands"})
+    home = FakeObject({"id": "t2", "name": "Home"})
+    omnifocus = fake_omnifocus(
+        [
+            fake_task("a", "Shop", created, tags=[errands, home]),
+            fake_task("b", "Think", created),
+            fake_task("c", "Tidy", created, tags=[home]),
+        ]
+    )
+    assert list(load_task_tags(omnifocus.default_document)) == [
+        TaskTag(task_id="a", tag_id="t1", tag_name="Errands"),
+        TaskTag(task_id="a", tag_id="t2", tag_name="Home"),
+        TaskTag(task_id="c", tag_id="t2", tag_name="Home"),
+    ]
+    # However many tasks and tags there are.
+    assert omnifocus.event_count == 3
+
+
+def test_bulk_events_independent_of_task_count():
+    omnifocus = make_omnifocus()
+    list(load_tasks_bulk(omnifocus.default_document))
+    assert omnifocus.event_count == len(TASK_COLUMNS) + 4
+
+
+def test_per_task_events_grow_with_task_count():
+    omnifocus = make_omnifocus()
+    list(load_tasks(omnifocus.default_document))
+    # One to list the tasks, one for each task's properties, one for each
+    # property of each distinct reference, and one for each property that
+    # ``properties()`` leaves out, for all tasks at once.
+    assert omnifocus.event_count == 1 + 3 + 1 + 3 + len(EXTRA_TASK_COLUMNS)
+
+
+def test_references_are_shared():
+    omnifocus = make_omnifocus()
+    references = ReferenceCache()
+    [parent, child, _] = load_tasks(omnifocus.default_document, references)
+    assert child.containing_project is parent.containing_project
+    assert (references.hits, references.misses) == (1, 3)
+
+
+def test_reference_cache_evicts_least_recently_used():
+    omnifocus = fake_omnifocus([])
+    a, b, c = [Reference(omnifocus, FakeObject({"name": name}), ()) for name in "abc"]
+    references = ReferenceCache(maxsize=2)
+    tag_a = references.resolve(TagReference, a)
+    references.resolve(TagReference, b)
+    assert references.resolve(TagReference, a) is tag_a
+    # b is now the least recently used, so it makes way for c.
+    references.resolve(TagReference, c)
+    assert len(references) == 2
+    assert references.resolve(TagReference, a) is tag_a
+    assert references.misses == 3
+    references.resolve(TagReference, b)
+    assert references.misses == 4
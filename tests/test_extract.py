@@ -0,0 +1,85 @@
+"""Tests for extracting everything at once."""
+
+import io
+import json
+import threading
+
+from click.testing import CliRunner
+
+from omnimetrics import _script
+from omnimetrics._database import (
+    load_folders,
+    load_projects,
+    load_tags,
+    load_task_tags,
+    load_tasks_bulk,
+)
+from omnimetrics._extract import COLLECTIONS, extract
+from omnimetrics._fakeapp import synthetic_database
+
+
+def test_extract_everything():
+    database = synthetic_database(500)
+    outputs = {name: io.StringIO() for name in COLLECTIONS}
+    counts = extract(database.appscript, outputs)
+    assert counts == {"tasks": 500, "projects": 10, "tags": 50, "folders": 1, "task-tags": 524}
+    document = database.appscript().default_document
+    for name, load in [
+        ("tasks", load_tasks_bulk),
+        ("projects", load_projects),
+        ("tags", load_tags),
+        ("folders", load_folders),
+        ("task-tags", load_task_tags),
+    ]:
+        expected = [COLLECTIONS[name].serialize(item) for item in load(document)]
+        assert outputs[name].getvalue().splitlines() == expected
+
+
+def test_projects_tags_and_folders():
+    database = synthetic_database(1000)
+    document = database.appscript().default_document
+    projects = list(load_projects(document))
+    # Every fifth project is at the top level.
+    assert [project.folder is None for project in projects[:6]] == [True] + [False] * 4 + [True]
+    assert {project.status for project in projects} <= {"active", "done", "dropped"}
+    tags = list(load_tags(document))
+    assert tags[0].parent is None
+    assert tags[12].parent.name == "Tag 2"
+    folders = list(load_folders(document))
+    assert folders[0].parent is None
+    assert folders[1].parent.id == "folder-0"
+
+
+def test_extract_concurrently():
+    """Every collection is extracted at the same time, each over its own connection."""
+    database = synthetic_database(100)
+    # Nobody gets a connection until everyone's asked for one, which only
+    # happens if they're all being extracted at once. If they're not, waiting
+    # times out, and extracting fails.
+    barrier = threading.Barrier(len(COLLECTIONS), timeout=10)
+    connections = []
+
+    def connect():
+        barrier.wait()
+        connections.append(database.appscript())
+        return connections[-1]
+
+    counts = extract(
+        connect, {name: io.StringIO() for name in COLLECTIONS}, max_workers=len(COLLECTIONS)
+    )
+    assert set(counts) == set(COLLECTIONS)
+    assert len(connections) == len(COLLECTIONS)
+
+
+def test_dump_all(tmp_path, monkeypatch):
+    database = synthetic_database(100)
+    monkeypatch.setattr(_script, "connect", database.appscript)
+    result = CliRunner().invoke(
+        _script.omnimetrics,
+        ["dump-all", "--collection", "tags", "--collection", "folders", str(tmp_path)],
+    )
+    assert result.exit_code == 0, result.output
+    paths = sorted(path.name.split("-")[1] for path in tmp_path.iterdir())
+    assert paths == ["folders", "tags"]
+    (tags,) = tmp_path.glob("omnifocus-tags-*.json")
+    assert [json.loads(line)["id"] for line in tags.open()] == [f"tag-{i}" for i in range(50)]
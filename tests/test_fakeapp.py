@@ -0,0 +1,35 @@
+"""Tests for the fake OmniFocus backends."""
+
+from omnimetrics import _viewit
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import synthetic_database
+
+
+def test_synthetic_database_is_repeatable():
+    first = list(load_tasks(synthetic_database(200, seed=3).appscript().default_document))
+    second = list(load_tasks(synthetic_database(200, seed=3).appscript().default_document))
+    assert first == second
+    assert len(first) == 200
+
+
+def test_synthetic_database_depth():
+    tasks = list(load_tasks(synthetic_database(500, max_depth=2).appscript().default_document))
+    by_id = {task.id: task for task in tasks}
+
+    def depth(task):
+        return 0 if task.parent_task is None else 1 + depth(by_id[task.parent_task.id])
+
+    assert max(depth(task) for task in tasks) == 2
+
+
+def test_scripting_bridge_counts_events():
+    app = synthetic_database(100, max_depth=1).scripting_bridge()
+    content = app.documents()[0].documentWindows()[0].content()
+    items = [leaf.value() for leaf in content.leaves()]
+    assert app.event_count == 1 + len(items)
+    child = next(item for item in items if item.parentTask().get() is not None)
+    app.events.clear()
+    name = _viewit.qualifiedName(child)
+    assert name.count(" / ") == 1
+    # A name and a parent for the task and its project's root task.
+    assert app.event_count == 4
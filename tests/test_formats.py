@@ -0,0 +1,122 @@
+"""Tests for columnar dump formats."""
+
+import io
+import json
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+import fastavro
+import pyarrow.parquet
+
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._formats import (
+    TASK_SCHEMA,
+    Field,
+    bigquery_schema,
+    compile_json_serializer,
+    deserialize_task,
+    serialize_task,
+    write_avro,
+    write_json,
+    write_parquet,
+)
+
+
+def fields_by_name(fields):
+    return {field.name: field for field in fields}
+
+
+def test_schema_from_task():
+    fields = fields_by_name(TASK_SCHEMA)
+    assert fields["id"] == Field("id", "STRING", nullable=False)
+    assert fields["creation_date"] == Field("creation_date", "TIMESTAMP", nullable=False)
+    assert fields["due_date"] == Field("due_date", "TIMESTAMP", nullable=True)
+    assert fields["estimated_minutes"] == Field("estimated_minutes", "INTEGER", nullable=True)
+    assert fields["is_flagged"] == Field("is_flagged", "BOOLEAN", nullable=False)
+    assert fields["parent_task"] == Field(
+        "parent_task",
+        "RECORD",
+        nullable=True,
+        fields=(Field("id", "STRING", False), Field("name", "STRING", False)),
+    )
+
+
+def test_bigquery_schema():
+    fields = {field.name: field for field in bigquery_schema(TASK_SCHEMA)}
+    assert fields["due_date"].mode == "NULLABLE"
+    assert fields["name"].mode == "REQUIRED"
+    assert [f.name for f in fields["parent_task"].fields] == ["id", "name"]
+
+
+def test_bigquery_schema_all_nullable():
+    fields = {field.name: field for field in bigquery_schema(TASK_SCHEMA, all_nullable=True)}
+    assert fields["name"].mode == "NULLABLE"
+    assert {f.mode for f in fields["parent_task"].fields} == {"NULLABLE"}
+
+
+def test_avro_round_trip(sample_tasks):
+    output = io.BytesIO()
+    write_avro(sample_tasks, output)
+    output.seek(0)
+    [parent, child, _] = list(fastavro.reader(output))
+    assert child["id"] == "b"
+    assert child["parent_task"] == {"id": "a", "name": "Tidy"}
+    assert child["estimated_minutes"] == 20
+    assert parent["parent_task"] is None
+    assert parent["creation_date"] == sample_tasks[0].creation_date.replace(tzinfo=timezone.utc)
+
+
+def test_parquet_round_trip(sample_tasks):
+    output = io.BytesIO()
+    write_parquet(sample_tasks, output, batch_size=1)
+    output.seek(0)
+    parquet_file = pyarrow.parquet.ParquetFile(output)
+    assert parquet_file.num_row_groups == 3
+    rows = parquet_file.read().to_pylist()
+    assert [row["id"] for row in rows] == ["a", "b", "c"]
+    assert rows[1]["parent_task"] == {"id": "a", "name": "Tidy"}
+    assert rows[0]["containing_project"] == {"name": "House"}
+    assert rows[0]["creation_date"] == sample_tasks[0].creation_date.replace(tzinfo=timezone.utc)
+
+
+def test_json_serializer_matches_json_dumps(sample_tasks):
+    def jsonify(o):
+        return o.isoformat() if isinstance(o, datetime) else o
+
+    for task in sample_tasks:
+        assert serialize_task(task) == json.dumps(asdict(task), default=jsonify)
+
+
+def test_json_serializer_extra_fields(sample_tasks):
+    serialize = compile_json_serializer(TASK_SCHEMA, {"deleted": False, "day": "2020-09-01"})
+    for task in sample_tasks:
+        row = json.loads(serialize(task))
+        assert list(row)[-2:] == ["deleted", "day"]
+        assert row["deleted"] is False and row["day"] == "2020-09-01"
+        del row["deleted"], row["day"]
+        assert deserialize_task(row) == task
+    assert compile_json_serializer((), {"deleted": True})(None) == '{"deleted": true}'
+
+
+def test_json_deserializer_round_trip():
+    database = synthetic_database(100)
+    tasks = list(load_tasks(database.appscript().default_document))
+    assert [deserialize_task(json.loads(serialize_task(task))) for task in tasks] == tasks
+
+
+def test_json_deserializer_reads_older_dumps(sample_tasks):
+    [_, task, _] = sample_tasks
+    row = json.loads(serialize_task(task))
+    for name in ["note", "has_children", "is_effectively_flagged", "effective_completion_date"]:
+        del row[name]
+    older = deserialize_task(row)
+    assert older.note is None
+    assert older.effective_completion_date is None
+    assert older.name == task.name
+
+
+def test_write_json_in_batches(sample_tasks):
+    output = io.StringIO()
+    write_json(sample_tasks, output, batch_size=1)
+    assert output.getvalue() == "".join(serialize_task(task) + "\n" for task in sample_tasks)
@@ -0,0 +1,76 @@
+"""Tests for the hierarchy index."""
+
+from datetime import datetime
+
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import FakeObject, fake_omnifocus, fake_task, synthetic_database
+from omnimetrics._hierarchy import Hierarchy, Rollup
+
+
+def make_hierarchy():
+    created = datetime(2020, 9, 1, 12, 30)
+    house = FakeObject({"name": "House"})
+    root = fake_task("r", "House", created, containing_project=house)
+    tidy = fake_task("a", "Tidy", created, parent_task=root, containing_project=house)
+    tasks = [
+        root,
+        tidy,
+        fake_task(
+            "b",
+            "Kitchen",
+            created,
+            parent_task=tidy,
+            containing_project=house,
+            estimated_minutes=30,
+            completed=True,
+            effectively_completed=True,
+        ),
+        fake_task(
+            "c",
+            "Bathroom",
+            created,
+            parent_task=tidy,
+            containing_project=house,
+            estimated_minutes=15,
+        ),
+        fake_task("d", "Call mum", created, estimated_minutes=5, blocked=True),
+    ]
+    return Hierarchy(load_tasks(fake_omnifocus(tasks).default_document))
+
+
+def test_qualified_names_and_depths():
+    hierarchy = make_hierarchy()
+    assert hierarchy.qualified_name("c") == "House / Tidy / Bathroom"
+    assert hierarchy.qualified_name("d") == "Call mum"
+    assert [hierarchy.depth(task_id) for task_id in "rabcd"] == [0, 1, 2, 2, 0]
+    assert list(hierarchy.ancestors("b")) == ["a", "r"]
+    assert hierarchy.children("a") == ["b", "c"]
+
+
+def test_subtree_rollups():
+    hierarchy = make_hierarchy()
+    assert hierarchy.subtree("a") == Rollup(
+        num_tasks=3, num_available=2, num_completed=1, estimated_minutes=45
+    )
+    assert hierarchy.subtree("c") == Rollup(
+        num_tasks=1, num_available=1, num_completed=0, estimated_minutes=15
+    )
+
+
+def test_project_rollups():
+    hierarchy = make_hierarchy()
+    assert hierarchy.project("House") == hierarchy.subtree("r")
+    assert hierarchy.project(None) == Rollup(num_tasks=1, estimated_minutes=5)
+    assert hierarchy.project("Garden") == Rollup()
+    assert set(hierarchy.projects) == {"House", None}
+
+
+def test_missing_parents():
+    tasks = list(load_tasks(synthetic_database(200).appscript().default_document))
+    # e.g. if we didn't load the root tasks of projects.
+    hierarchy = Hierarchy(task for task in tasks if task.parent_task is not None)
+    top = next(task for task in hierarchy if hierarchy.depth(task.id) == 1)
+    assert hierarchy.parent(top.id) is None
+    assert hierarchy.qualified_name(top.id) == f"{top.parent_task.name} / {top.name}"
+    assert len(hierarchy) < len(tasks)
+    assert top.id in hierarchy and hierarchy[top.id] == top
@@ -0,0 +1,147 @@
+"""Tests for the snapshot history."""
+
+import io
+import json
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._formats import write_json
+from omnimetrics._history import History, parse_when
+from omnimetrics._script import omnimetrics
+
+DAY = timedelta(days=1)
+START = datetime(2020, 9, 1, 12, 30)
+
+
+def day_by_day(num_days, num_tasks=200):
+    """Snapshots of a database where a few tasks change every day."""
+    tasks = list(load_tasks(synthetic_database(num_tasks).appscript().default_document))
+    for day in range(num_days):
+        yield START + day * DAY, list(tasks)
+        tasks[day] = replace(tasks[day], name=f"Renamed on day {day}")
+        tasks.append(replace(tasks[-1], id=f"new-{day}"))
+
+
+def dump(tasks):
+    output = io.StringIO()
+    write_json(tasks, output)
+    return output.getvalue()
+
+
+def test_reconstruct(tmp_path):
+    history = History(tmp_path)
+    snapshots = list(day_by_day(5))
+    for taken_at, tasks in snapshots:
+        history.add_tasks(tasks, taken_at)
+    assert history.snapshots() == [taken_at for taken_at, _ in snapshots]
+    for taken_at, tasks in snapshots:
+        output = io.StringIO()
+        history.write_snapshot(taken_at, output)
+        assert output.getvalue() == dump(tasks)
+
+
+def test_only_stores_changes(tmp_path):
+    history = History(tmp_path)
+    results = [history.add_tasks(tasks, taken_at) for taken_at, tasks in day_by_day(5)]
+    assert [result.new_versions for result in results] == [200, 2, 2, 2, 2]
+    assert results[1].bytes_written < results[0].bytes_written / 5
+
+
+def test_add_dump(tmp_path):
+    [(taken_at, tasks)] = day_by_day(1)
+    path = tmp_path / "dump.json"
+    path.write_text(dump(tasks))
+    history = History(tmp_path / "history")
+    history.add_dump(path, taken_at)
+    assert "".join(line + "\n" for line in history.reconstruct(taken_at)) == dump(tasks)
+    with pytest.raises(FileExistsError):
+        history.add_dump(path, taken_at)
+
+
+def test_failed_add_leaves_no_pack(tmp_path):
+    history = History(tmp_path)
+    [(taken_at, tasks)] = day_by_day(1)
+    path = tmp_path / "changes.json"
+    path.write_text(dump(tasks) + json.dumps({"id": "a", "deleted": True}) + "\n")
+    with pytest.raises(ValueError):
+        history.add_dump(path, taken_at)
+    assert list((tmp_path / "packs").iterdir()) == []
+    assert history.snapshots() == []
+    history.add_tasks(tasks, taken_at)
+    assert list(history.reconstruct(taken_at)) == dump(tasks).splitlines()
+
+
+def test_refuses_to_overwrite_recorded_pack(tmp_path):
+    history = History(tmp_path)
+    [(taken_at, tasks)] = day_by_day(1)
+    history.add_tasks(tasks, taken_at)
+    # As if writing the manifest had failed.
+    (tmp_path / "snapshots" / f"{taken_at:%Y%m%d-%H%M%S}.tsv.gz").unlink()
+    pack = (tmp_path / "packs" / f"{taken_at:%Y%m%d-%H%M%S}.pack").read_bytes()
+    with pytest.raises(FileExistsError):
+        history.add_tasks(tasks[1:], taken_at)
+    assert (tmp_path / "packs" / f"{taken_at:%Y%m%d-%H%M%S}.pack").read_bytes() == pack
+
+
+def test_rejects_change_logs(tmp_path):
+    path = tmp_path / "changes.json"
+    path.write_text(json.dumps({"id": "a", "deleted": True}) + "\n")
+    with pytest.raises(ValueError):
+        History(tmp_path / "history").add_dump(path, START)
+
+
+def test_diff(tmp_path):
+    history = History(tmp_path)
+    snapshots = list(day_by_day(3))
+    for taken_at, tasks in snapshots:
+        history.add_tasks(tasks, taken_at)
+    diff = history.diff(snapshots[0][0], snapshots[2][0])
+    assert [task["id"] for task in diff.added] == ["new-0", "new-1"]
+    assert diff.removed == []
+    assert [(old["name"], new["name"]) for old, new in diff.changed] == [
+        (snapshots[0][1][0].name, "Renamed on day 0"),
+        (snapshots[0][1][1].name, "Renamed on day 1"),
+    ]
+    assert history.diff(snapshots[2][0], snapshots[0][0]).removed == diff.added
+
+
+def test_snapshot_at(tmp_path):
+    history = History(tmp_path)
+    for taken_at, tasks in day_by_day(3):
+        history.add_tasks(tasks, taken_at)
+    assert history.snapshot_at(parse_when("2020-09-02")) == START + DAY
+    assert history.snapshot_at(parse_when("2020-09-02T12:00:00")) == START
+    with pytest.raises(LookupError):
+        history.snapshot_at(parse_when("2020-08-31"))
+
+
+def test_history_commands(tmp_path):
+    runner = CliRunner()
+    history = str(tmp_path / "history")
+    paths = []
+    snapshots = list(day_by_day(2))
+    for taken_at, tasks in snapshots:
+        path = tmp_path / taken_at.strftime("omnifocus-%Y%m%d-%H%M%S.json")
+        path.write_text(dump(tasks))
+        paths.append(str(path))
+    result = runner.invoke(omnimetrics, ["history", "add", history, *paths])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(omnimetrics, ["history", "list", history])
+    assert result.stdout.splitlines() == ["2020-09-01T12:30:00", "2020-09-02T12:30:00"]
+    result = runner.invoke(omnimetrics, ["history", "show", history, "2020-09-01"])
+    assert result.stdout == dump(snapshots[0][1])
+    result = runner.invoke(omnimetrics, ["history", "diff", history, "2020-09-01", "2020-09-02"])
+    first = snapshots[0][1][0]
+    assert result.stdout.splitlines() == [
+        f"+ new-0 {snapshots[0][1][-1].name}",
+        f"~ {first.id} Renamed on day 0: name",
+    ]
+    result = runner.invoke(omnimetrics, ["history", "show", history, "yesterday"])
+    assert result.exit_code == 2
+    result = runner.invoke(omnimetrics, ["history", "show", history, "2020-01-01"])
+    assert result.exit_code == 1
@@ -0,0 +1,72 @@
+"""Tests for incremental export."""
+
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics import _script
+from omnimetrics._database import EXTRA_TASK_COLUMNS
+from omnimetrics._fakeapp import fake_omnifocus, fake_task
+from omnimetrics._incremental import Watermark, load_changes
+
+MONDAY = datetime(2020, 9, 7, 9)
+TUESDAY = datetime(2020, 9, 8, 9)
+
+
+def test_first_export_includes_everything():
+    omnifocus = fake_omnifocus([fake_task("a", "A", MONDAY), fake_task("b", "B", TUESDAY)])
+    changes = load_changes(omnifocus.default_document, Watermark(None, frozenset()))
+    assert [task.id for task in changes.upserts] == ["a", "b"]
+    assert changes.deleted == frozenset()
+    assert changes.watermark == Watermark(TUESDAY, frozenset(["a", "b"]))
+
+
+def test_only_changed_tasks_are_extracted():
+    tasks = [fake_task(str(i), f"Task {i}", MONDAY) for i in range(10)]
+    tasks.append(fake_task("new", "New", TUESDAY))
+    omnifocus = fake_omnifocus(tasks)
+    since = Watermark(datetime(2020, 9, 7, 18), frozenset(str(i) for i in range(10)))
+    changes = load_changes(omnifocus.default_document, since)
+    assert [task.id for task in changes.upserts] == ["new"]
+    # Three to find out what changed, one for each property ``properties()``
+    # leaves out, then one for the changed task.
+    assert omnifocus.event_count == 3 + len(EXTRA_TASK_COLUMNS) + 1
+
+
+def test_new_tasks_are_extracted_even_if_older_than_watermark():
+    omnifocus = fake_omnifocus([fake_task("a", "A", MONDAY), fake_task("b", "B", MONDAY)])
+    changes = load_changes(omnifocus.default_document, Watermark(TUESDAY, frozenset(["a"])))
+    assert [task.id for task in changes.upserts] == ["b"]
+    assert changes.watermark == Watermark(TUESDAY, frozenset(["a", "b"]))
+
+
+def test_deleted_tasks_are_reported():
+    omnifocus = fake_omnifocus([fake_task("a", "A", MONDAY)])
+    changes = load_changes(omnifocus.default_document, Watermark(TUESDAY, frozenset(["a", "b"])))
+    assert list(changes.upserts) == []
+    assert changes.deleted == frozenset(["b"])
+    assert changes.watermark == Watermark(TUESDAY, frozenset(["a"]))
+
+
+def test_watermark_round_trip(tmp_path):
+    path = tmp_path / "watermark.json"
+    assert Watermark.load(path) == Watermark(None, frozenset())
+    watermark = Watermark(TUESDAY, frozenset(["a", "b"]))
+    watermark.save(path)
+    assert Watermark.load(path) == watermark
+
+
+@pytest.mark.parametrize("command", ["dump-file", "dump", "run-pipeline"])
+def test_bulk_is_rejected_with_watermark(tmp_path, monkeypatch, command):
+    monkeypatch.setattr(_script, "omnifocus", lambda: pytest.fail("Asked OmniFocus"))
+    args = [command, "--bulk", "--watermark", str(tmp_path / "watermark.json")]
+    outputs = {
+        "dump-file": [str(tmp_path / "out.json")],
+        "dump": [str(tmp_path)],
+        "run-pipeline": ["bucket", "dataset.tasks"],
+    }
+    args += outputs[command]
+    result = CliRunner().invoke(_script.omnimetrics, args)
+    assert result.exit_code == 2
+    assert "--bulk can't be used with --watermark" in result.output
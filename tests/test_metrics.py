@@ -0,0 +1,219 @@
+"""Tests for metrics about each run."""
+
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+from google.cloud import bigquery
+
+from omnimetrics import _script
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._formats import TASK_SCHEMA
+from omnimetrics._metrics import RunMetrics, append_run_log, prometheus_text, write_textfile
+
+
+def read_log(path):
+    return [json.loads(line) for line in path.open()]
+
+
+def metric_values(text):
+    """The values in a Prometheus textfile, by metric and labels."""
+    values = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+def test_prometheus_text():
+    run = RunMetrics(
+        "dump",
+        datetime(2020, 9, 1, 3),
+        seconds=12.5,
+        succeeded=True,
+        tasks=100,
+        stages={"extract": 10.0, "upload": 2.5},
+    )
+    text = prometheus_text(run)
+    assert "# TYPE omnimetrics_run_success gauge" in text
+    values = metric_values(text)
+    assert values['omnimetrics_run_success{command="dump"}'] == 1
+    assert values['omnimetrics_run_duration_seconds{command="dump"}'] == 12.5
+    assert values['omnimetrics_tasks_extracted{command="dump"}'] == 100
+    assert values['omnimetrics_stage_duration_seconds{command="dump",stage="extract"}'] == 10.0
+    assert values['omnimetrics_stage_duration_seconds{command="dump",stage="upload"}'] == 2.5
+    assert values['omnimetrics_run_timestamp_seconds{command="dump"}'] == run.started_at.timestamp()
+    # We don't know these, so we leave them out rather than saying zero.
+    assert "omnimetrics_bytes_written" not in text
+    assert "omnimetrics_apple_events" not in text
+
+
+def test_write_textfile_replaces_it(tmp_path):
+    path = tmp_path / "omnimetrics-dump.prom"
+    write_textfile(path, RunMetrics("dump", datetime(2020, 9, 1), tasks=1))
+    write_textfile(path, RunMetrics("dump", datetime(2020, 9, 2), tasks=2))
+    assert metric_values(path.read_text())['omnimetrics_tasks_extracted{command="dump"}'] == 2
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+
+def test_run_log_keeps_recent_runs(tmp_path):
+    path = tmp_path / "runs.jsonl"
+    for day in range(1, 6):
+        append_run_log(path, RunMetrics("dump", datetime(2020, 9, day), tasks=day), size=3)
+    runs = read_log(path)
+    assert [run["tasks"] for run in runs] == [3, 4, 5]
+    assert runs[-1]["started_at"] == "2020-09-05T00:00:00"
+
+
+def test_dump_records_metrics(tmp_path, monkeypatch):
+    omnifocus = synthetic_database(100).appscript()
+    monkeypatch.setattr(_script, "omnifocus", lambda: omnifocus)
+    dumps = tmp_path / "dumps"
+    dumps.mkdir()
+    textfile = tmp_path / "omnimetrics-dump.prom"
+    run_log = tmp_path / "runs.jsonl"
+    args = ["dump", "--bulk", "--metrics-textfile", str(textfile), "--run-log", str(run_log)]
+    for _ in range(2):
+        result = CliRunner().invoke(_script.omnimetrics, [*args, str(dumps)])
+        assert result.exit_code == 0, result.output
+    [dump, *_] = dumps.iterdir()
+    [first, run] = read_log(run_log)
+    assert run["command"] == "dump"
+    assert run["succeeded"]
+    assert run["tasks"] == 100
+    assert run["bytes_written"] == dump.stat().st_size
+    assert run["events"] == omnifocus.event_count // 2
+    assert set(run["stages"]) == {"dump", "extract", "serialize"}
+    values = metric_values(textfile.read_text())
+    assert values['omnimetrics_run_success{command="dump"}'] == 1
+    assert values['omnimetrics_apple_events{command="dump"}'] == run["events"]
+
+
+def test_failed_dump_records_metrics(tmp_path, monkeypatch):
+    omnifocus = synthetic_database(100).appscript()
+    omnifocus.busy = 1
+    monkeypatch.setattr(_script, "omnifocus", lambda: omnifocus)
+    textfile = tmp_path / "omnimetrics-dump.prom"
+    run_log = tmp_path / "runs.jsonl"
+    result = CliRunner().invoke(
+        _script.omnimetrics,
+        ["dump", "--metrics-textfile", str(textfile), "--run-log", str(run_log), str(tmp_path)],
+    )
+    assert result.exit_code != 0
+    [run] = read_log(run_log)
+    assert not run["succeeded"]
+    assert metric_values(textfile.read_text())['omnimetrics_run_success{command="dump"}'] == 0
+
+
+def test_dump_without_metrics_does_not_profile(tmp_path, monkeypatch):
+    omnifocus = synthetic_database(10).appscript()
+    monkeypatch.setattr(_script, "omnifocus", lambda: omnifocus)
+    monkeypatch.setattr(_script, "instrument", None)
+    result = CliRunner().invoke(_script.omnimetrics, ["dump", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+
+
+@pytest.fixture
+def run_pipeline(tmp_path, monkeypatch, storage_client, bigquery_client):
+    """Run ``run-pipeline`` against fake OmniFocus, GCS and BigQuery.
+
+    Returns the result, the blobs uploaded, and the recorded run and metrics.
+    """
+    omnifocus = synthetic_database(100).appscript()
+    monkeypatch.setattr(_script, "omnifocus", lambda: omnifocus)
+    monkeypatch.setattr("google.cloud.storage.Client", lambda: storage_client)
+    monkeypatch.setattr("google.cloud.bigquery.Client", lambda: bigquery_client)
+    textfile = tmp_path / "omnimetrics-run-pipeline.prom"
+    run_log = tmp_path / "runs.jsonl"
+
+    def run(*args, bulk=True):
+        result = CliRunner().invoke(
+            _script.omnimetrics,
+            [
+                "run-pipeline",
+                *(["--bulk"] if bulk else []),
+                "--metrics-textfile",
+                str(textfile),
+                "--run-log",
+                str(run_log),
+                *args,
+                "bucket",
+                "dataset.tasks",
+            ],
+        )
+        run = read_log(run_log)[-1]
+        return result, storage_client.blobs, run, metric_values(textfile.read_text())
+
+    return run
+
+
+def test_run_pipeline_records_metrics(run_pipeline):
+    result, blobs, run, values = run_pipeline()
+    assert result.exit_code == 0, result.output
+    [data] = blobs.values()
+    assert run["command"] == "run_pipeline"
+    assert run["succeeded"]
+    assert run["tasks"] == 100
+    assert run["bytes_written"] == len(data)
+    assert set(run["stages"]) == {"dump", "extract", "serialize", "upload", "load"}
+    assert values['omnimetrics_run_success{command="run_pipeline"}'] == 1
+    stage = 'omnimetrics_stage_duration_seconds{command="run_pipeline",stage="upload"}'
+    assert values[stage] == run["stages"]["upload"]
+
+
+def test_streamed_run_pipeline_times_upload(run_pipeline):
+    result, blobs, run, values = run_pipeline("--stream")
+    assert result.exit_code == 0, result.output
+    [data] = blobs.values()
+    assert run["bytes_written"] == len(gzip.decompress(data))
+    stages = run["stages"]
+    assert set(stages) == {"dump and upload", "extract", "serialize", "upload", "load"}
+    assert stages["serialize"] == pytest.approx(
+        stages["dump and upload"] - stages["upload"] - stages["extract"]
+    )
+
+
+def test_failed_run_pipeline_records_metrics(run_pipeline, bigquery_client, monkeypatch):
+    def load_table_from_uri(uris, destination, job_config):
+        raise RuntimeError("BigQuery is down")
+
+    monkeypatch.setattr(bigquery_client, "load_table_from_uri", load_table_from_uri)
+    result, _, run, values = run_pipeline()
+    assert result.exit_code != 0
+    assert not run["succeeded"]
+    assert "load" in run["stages"]
+    assert values['omnimetrics_run_success{command="run_pipeline"}'] == 0
+
+
+@pytest.mark.parametrize(
+    "args, disposition",
+    [
+        ([], bigquery.WriteDisposition.WRITE_TRUNCATE),
+        (["--watermark", "watermark.json"], bigquery.WriteDisposition.WRITE_APPEND),
+    ],
+)
+def test_run_pipeline_appends_change_logs(
+    run_pipeline, bigquery_client, tmp_path, monkeypatch, args, disposition
+):
+    monkeypatch.chdir(tmp_path)
+    for _ in range(2):
+        result, _, _, _ = run_pipeline(*args, bulk=False)
+        assert result.exit_code == 0, result.output
+    assert [job_config.write_disposition for _, _, _, job_config in bigquery_client.jobs] == [
+        disposition,
+        disposition,
+    ]
+
+
+@pytest.mark.parametrize("format_", ["avro", "parquet"])
+def test_run_pipeline_loads_columnar_dumps_as_nullable(run_pipeline, bigquery_client, format_):
+    # The table might have been created by detecting the schema of JSON
+    # dumps, which makes every column nullable.
+    result, _, _, _ = run_pipeline("--format", format_)
+    assert result.exit_code == 0, result.output
+    [(_, _, _, job_config)] = bigquery_client.jobs
+    assert [field.name for field in job_config.schema] == [field.name for field in TASK_SCHEMA]
+    assert {field.mode for field in job_config.schema} == {"NULLABLE"}
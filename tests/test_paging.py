@@ -0,0 +1,279 @@
+"""Tests for extracting tasks a page at a time."""
+
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics import _script
+from omnimetrics._database import load_tasks_bulk
+from omnimetrics._fakeapp import FakeCommandError, synthetic_database
+from omnimetrics._formats import write_json
+from omnimetrics._paging import Checkpoint, DatabaseChanged, PageSizer, extract_pages
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedCheckpoint(Checkpoint):
+    """A checkpoint that calls ``after_page`` after saving each page."""
+
+    def __init__(self, directory, after_page):
+        super().__init__(directory)
+        self.after_page = after_page
+
+    def add_page(self, start, end, tasks):
+        super().add_page(start, end, tasks)
+        self.after_page(start, end)
+
+
+def interrupt_after(pages):
+    added = []
+
+    def after_page(start, end):
+        added.append((start, end))
+        if len(added) == pages:
+            raise Interrupted()
+
+    return after_page
+
+
+@pytest.fixture
+def database():
+    return synthetic_database(300)
+
+
+def expected(database):
+    return list(load_tasks_bulk(database.appscript().default_document))
+
+
+def page_ranges(omnifocus):
+    """The ranges of tasks asked about."""
+    ranges = {
+        (part.start, part.stop)
+        for event in omnifocus.events
+        for part in event
+        if isinstance(part, slice)
+    }
+    return sorted(ranges)
+
+
+def test_page_sizer():
+    sizer = PageSizer(size=100, minimum=10, maximum=300, target_seconds=1.0)
+    sizer.succeeded(0.1)
+    assert sizer.size == 200
+    sizer.succeeded(0.1)
+    assert sizer.size == 300
+    sizer.succeeded(0.7)
+    assert sizer.size == 300
+    sizer.succeeded(2.0)
+    assert sizer.size == 150
+    for _ in range(10):
+        sizer.shrink()
+    assert sizer.size == 10
+
+
+def test_extract_pages(database, tmp_path):
+    omnifocus = database.appscript()
+    sizer = PageSizer(size=10, maximum=80)
+    checkpoint = extract_pages(omnifocus.default_document, Checkpoint(tmp_path / "c"), sizer)
+    assert list(checkpoint.tasks()) == expected(database)
+    assert len(checkpoint) == 300
+    assert page_ranges(omnifocus) == [
+        (1, 10),
+        (11, 30),
+        (31, 70),
+        (71, 150),
+        (151, 230),
+        (231, 300),
+    ]
+    output = io.StringIO()
+    checkpoint.copy_to(output)
+    written = io.StringIO()
+    write_json(expected(database), written)
+    assert output.getvalue() == written.getvalue()
+    checkpoint.clear()
+    assert not (tmp_path / "c").exists()
+
+
+def test_extract_pages_shrinks_pages_that_time_out(database, tmp_path):
+    omnifocus = database.appscript()
+    omnifocus.max_range = 30
+    waits = []
+    sizer = PageSizer(size=100, minimum=10, maximum=100)
+    checkpoint = extract_pages(
+        omnifocus.default_document, Checkpoint(tmp_path), sizer, sleep=waits.append
+    )
+    assert list(checkpoint.tasks()) == expected(database)
+    # 100 and 50 time out, and 25 doesn't. Then it grows back to 50, which
+    # times out again.
+    assert waits[:3] == [1.0, 2.0, 1.0]
+    assert {(1, 100), (1, 50), (1, 25), (26, 75), (26, 50)} <= set(page_ranges(omnifocus))
+
+
+def test_extract_pages_retries_when_busy(database, tmp_path):
+    omnifocus = database.appscript()
+    omnifocus.busy = 2
+    waits = []
+    checkpoint = extract_pages(
+        omnifocus.default_document, Checkpoint(tmp_path), sleep=waits.append, backoff_seconds=3
+    )
+    assert waits == [3, 6]
+    assert list(checkpoint.tasks()) == expected(database)
+
+
+def test_extract_pages_gives_up(database, tmp_path):
+    omnifocus = database.appscript()
+    omnifocus.busy = 3
+    with pytest.raises(FakeCommandError):
+        extract_pages(
+            omnifocus.default_document, Checkpoint(tmp_path), max_retries=2, sleep=lambda s: None
+        )
+
+
+def test_extract_pages_does_not_retry_other_errors(tmp_path):
+    class Broken:
+        @property
+        def flattened_tasks(self):
+            raise RuntimeError("broken")
+
+    with pytest.raises(RuntimeError):
+        extract_pages(Broken(), Checkpoint(tmp_path), sleep=pytest.fail)
+
+
+def test_extract_pages_resumes(database, tmp_path):
+    sizer = PageSizer(size=50, maximum=50)
+    with pytest.raises(Interrupted):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(tmp_path, interrupt_after(2)),
+            sizer,
+        )
+    omnifocus = database.appscript()
+    messages = []
+    checkpoint = extract_pages(
+        omnifocus.default_document, Checkpoint(tmp_path), sizer, echo=messages.append
+    )
+    assert messages == ["Resuming from task 101 of 300"]
+    assert list(checkpoint.tasks()) == expected(database)
+    assert page_ranges(omnifocus) == [(101, 150), (151, 200), (201, 250), (251, 300)]
+
+
+def test_extract_pages_starts_again_if_tasks_change(database, tmp_path):
+    with pytest.raises(Interrupted):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(tmp_path, interrupt_after(1)),
+            PageSizer(size=50),
+        )
+    database.tasks.insert(0, database.tasks.pop())
+    messages = []
+    checkpoint = extract_pages(
+        database.appscript().default_document, Checkpoint(tmp_path), echo=messages.append
+    )
+    assert messages == []
+    assert list(checkpoint.tasks()) == expected(database)
+
+
+def test_extract_pages_starts_again_if_checkpoint_is_too_old(database, tmp_path):
+    with pytest.raises(Interrupted):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(tmp_path, interrupt_after(1)),
+            PageSizer(size=50),
+        )
+    state = json.loads((tmp_path / "state.json").read_text())
+    started_at = datetime.fromisoformat(state["started_at"])
+    # Tasks edited since then are only in pages we'd skip, so don't skip them.
+    database.tasks[0].properties["name"] = "Edited"
+    later = started_at + timedelta(hours=7)
+    omnifocus = database.appscript()
+    checkpoint = Checkpoint(tmp_path, max_age=timedelta(hours=6), now=lambda: later)
+    messages = []
+    extract_pages(omnifocus.default_document, checkpoint, echo=messages.append)
+    assert messages == []
+    assert list(checkpoint.tasks()) == expected(database)
+    assert json.loads((tmp_path / "state.json").read_text())["started_at"] == later.isoformat()
+
+
+def test_extract_pages_resumes_recent_checkpoint(database, tmp_path):
+    with pytest.raises(Interrupted):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(tmp_path, interrupt_after(1)),
+            PageSizer(size=50),
+        )
+    state = json.loads((tmp_path / "state.json").read_text())
+    later = datetime.fromisoformat(state["started_at"]) + timedelta(hours=5)
+    messages = []
+    extract_pages(
+        database.appscript().default_document,
+        Checkpoint(tmp_path, max_age=timedelta(hours=6), now=lambda: later),
+        echo=messages.append,
+    )
+    assert messages == ["Resuming from task 51 of 300"]
+
+
+def test_extract_pages_notices_tasks_changing(database, tmp_path):
+    def move_a_task(start, end):
+        database.tasks.insert(0, database.tasks.pop())
+
+    with pytest.raises(DatabaseChanged):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(tmp_path, move_a_task),
+            PageSizer(size=50),
+        )
+
+
+@pytest.mark.parametrize("format_", ["json", "parquet"])
+def test_dump_file_with_checkpoint(database, tmp_path, monkeypatch, format_):
+    omnifocus = database.appscript()
+    monkeypatch.setattr(_script, "omnifocus", lambda: omnifocus)
+    checkpoint = tmp_path / "checkpoint"
+    for name in ["paged", "bulk"]:
+        args = ["dump-file", "--format", format_, str(tmp_path / name)]
+        if name == "paged":
+            args[1:1] = ["--checkpoint", str(checkpoint)]
+        else:
+            args[1:1] = ["--bulk"]
+        result = CliRunner().invoke(_script.omnimetrics, args)
+        assert result.exit_code == 0, result.output
+    assert (tmp_path / "paged").read_bytes() == (tmp_path / "bulk").read_bytes()
+    assert not checkpoint.exists()
+
+
+def test_dump_file_with_checkpoint_max_age(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(_script, "omnifocus", database.appscript)
+    checkpoint = tmp_path / "checkpoint"
+    with pytest.raises(Interrupted):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(checkpoint, interrupt_after(1)),
+            PageSizer(size=50),
+        )
+    args = ["dump-file", "--checkpoint", str(checkpoint), str(tmp_path / "out")]
+    result = CliRunner().invoke(_script.omnimetrics, args)
+    assert "Resuming" in result.output
+    with pytest.raises(Interrupted):
+        extract_pages(
+            database.appscript().default_document,
+            InterruptedCheckpoint(checkpoint, interrupt_after(1)),
+            PageSizer(size=50),
+        )
+    args[1:1] = ["--checkpoint-max-age", "0"]
+    result = CliRunner().invoke(_script.omnimetrics, args)
+    assert result.exit_code == 0, result.output
+    assert "Resuming" not in result.output
+
+
+def test_checkpoint_needs_a_snapshot(tmp_path):
+    result = CliRunner().invoke(
+        _script.omnimetrics,
+        ["dump-file", "--checkpoint", str(tmp_path), "--daemon", str(tmp_path / "out")],
+    )
+    assert result.exit_code == 2
+    assert "--checkpoint" in result.output
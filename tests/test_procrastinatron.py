@@ -1,6 +1,31 @@
 """Tests for procrastinatron."""
 
-from omnimetrics._procrastinatron import parseYesNo
+from datetime import datetime, timedelta
+
+import pytest
+
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import fake_omnifocus, fake_task, synthetic_database
+from omnimetrics._hierarchy import Hierarchy, is_available
+from omnimetrics._procrastinatron import (
+    EXCUSE_LIMIT,
+    UI,
+    AttemptLog,
+    Availability,
+    CompletedTask,
+    DeferredTask,
+    Scheduler,
+    Task,
+    attempt,
+    parseDoneOrAbandoned,
+    parseYesNo,
+    pollAvailability,
+    qualifiedName,
+    showExcuses,
+    showTask,
+)
+
+T0 = datetime(2020, 9, 1, 12, 0)
 
 
 def test_parse_yes():
@@ -16,3 +41,307 @@ def test_parse_yes():
 def test_parse_empty():
     assert parseYesNo("") is None
     assert parseYesNo("   ") is None
+
+
+def test_show_task_with_hierarchy():
+    database = synthetic_database(100, max_depth=2)
+    hierarchy = Hierarchy(load_tasks(database.appscript().default_document))
+    app = database.scripting_bridge()
+    content = app.documents()[0].documentWindows()[0].content()
+    task = next(leaf.value() for leaf in content.leaves() if leaf.value().parentTask().get())
+    app.events.clear()
+    name = showTask(task, hierarchy)
+    # Only asks for the task's id.
+    assert app.event_count == 1
+    assert name == qualifiedName(task)
+    assert showTask(task, Hierarchy([])) == qualifiedName(task)
+
+
+def test_show_task_id_with_hierarchy():
+    database = synthetic_database(10)
+    hierarchy = Hierarchy(load_tasks(database.appscript().default_document))
+    task = next(iter(hierarchy))
+    assert showTask(task.id, hierarchy) == hierarchy.qualified_name(task.id)
+    assert showTask("unknown", hierarchy) == "unknown"
+
+
+def test_poll_availability():
+    database = synthetic_database(200)
+    omnifocus = database.appscript()
+    tasks = list(load_tasks(omnifocus.default_document))
+    omnifocus.events.clear()
+    availabilities = pollAvailability(omnifocus.default_document, datetime(2100, 1, 1))
+    # One event per property, however many tasks there are.
+    assert omnifocus.event_count == 6
+    assert [a.taskId for a in availabilities] == [task.id for task in tasks]
+    assert [a.available for a in availabilities] == [is_available(task) for task in tasks]
+
+
+def test_poll_availability_respects_defer_dates():
+    omnifocus = fake_omnifocus(
+        [
+            fake_task("now", "Now", T0),
+            fake_task("later", "Later", T0, effective_defer_date=T0 + timedelta(days=1)),
+        ]
+    )
+    before = pollAvailability(omnifocus.default_document, T0)
+    assert [a.available for a in before] == [True, False]
+    after = pollAvailability(omnifocus.default_document, T0 + timedelta(days=1))
+    assert [a.available for a in after] == [True, True]
+
+
+def available(taskId, modified=T0):
+    return Availability(taskId, modified, True)
+
+
+def unavailable(taskId, modified=T0):
+    return Availability(taskId, modified, False)
+
+
+def drain(scheduler):
+    offered = []
+    task = scheduler.nextTask()
+    while task is not None:
+        offered.append(task.task)
+        scheduler.record(task.start(T0).complete(T0))
+        task = scheduler.nextTask()
+    return offered
+
+
+def test_scheduler_offers_tasks_in_order():
+    scheduler = Scheduler()
+    scheduler.update([available("a"), unavailable("b"), available("c")])
+    assert len(scheduler) == 2
+    assert scheduler.nextTask() == Task("a")
+    # Asking again doesn't change anything.
+    assert scheduler.nextTask() == Task("a")
+    assert drain(scheduler) == ["a", "c"]
+    assert scheduler.nextTask() is None
+    assert not scheduler.hasDeferred()
+
+
+def test_scheduler_newly_available_first():
+    scheduler = Scheduler()
+    scheduler.update([available("a"), unavailable("b"), unavailable("c"), available("d")])
+    later = T0 + timedelta(minutes=1)
+    scheduler.update([available("a"), available("b", later), unavailable("c"), available("d")])
+    scheduler.update(
+        [available("a"), available("b", later), available("c", later), available("d")]
+    )
+    assert drain(scheduler) == ["c", "b", "a", "d"]
+
+
+def test_scheduler_drops_unavailable_and_removed():
+    scheduler = Scheduler()
+    scheduler.update([available("a"), available("b"), available("c")])
+    later = T0 + timedelta(minutes=1)
+    scheduler.update([available("a"), unavailable("b", later)])
+    assert len(scheduler) == 1
+    assert drain(scheduler) == ["a"]
+
+
+def test_scheduler_deferred_next_round():
+    scheduler = Scheduler()
+    scheduler.update([available("a"), available("b"), available("c")])
+    scheduler.record(scheduler.nextTask().defer("too hard"))
+    started = scheduler.nextTask().start(T0)
+    scheduler.record(started)
+    # Not offered while it's being worked on.
+    assert scheduler.nextTask() == Task("c")
+    scheduler.record(started.abandon())
+    assert drain(scheduler) == ["c"]
+    assert scheduler.hasDeferred()
+    scheduler.startNextRound()
+    assert drain(scheduler) == ["a", "b"]
+    assert not scheduler.hasDeferred()
+
+
+def test_scheduler_unchanged_poll_is_noop():
+    scheduler = Scheduler()
+    tasks = [available(str(i)) for i in range(100)]
+    scheduler.update(tasks)
+    scheduler.record(scheduler.nextTask().defer("later"))
+    scheduler.update(tasks)
+    # Deferral sticks, because nothing changed.
+    assert scheduler.nextTask() == Task("1")
+    assert len(scheduler) == 100
+
+
+def test_scheduler_requeues_removed_task():
+    scheduler = Scheduler()
+    scheduler.update([available("a"), available("b")])
+    scheduler.record(Task("a").defer("later"))
+    later = T0 + timedelta(minutes=1)
+    scheduler.update([unavailable("a", later), available("b")])
+    scheduler.update([available("a", later), available("b")])
+    assert scheduler.nextTask() == Task("a")
+    # Leaves a removed entry for "a" with the same round, priority and order.
+    scheduler.record(Task("a").defer("still later"))
+    assert drain(scheduler) == ["b"]
+    scheduler.startNextRound()
+    assert drain(scheduler) == ["a"]
+
+
+def test_scheduler_with_database():
+    database = synthetic_database(500)
+    document = database.appscript().default_document
+    scheduler = Scheduler()
+    scheduler.update(pollAvailability(document, datetime(2100, 1, 1)))
+    expected = [task.id for task in load_tasks(document) if is_available(task)]
+    assert drain(scheduler) == expected
+
+
+def test_attempt_log(tmp_path):
+    path = tmp_path / "attempts.jsonl"
+    with AttemptLog(path) as log:
+        log.record(Task("a").defer("too hard"), T0)
+        started = Task("b").start(T0)
+        log.record(started)
+        log.record(Task("a").defer("no time"), T0)
+        log.record(started.complete(T0 + timedelta(minutes=5)))
+        log.record(Task("b").start(T0).abandon(), T0)
+        assert log.excuses("a") == ["too hard", "no time"]
+        assert log.excuses("b") == []
+        assert log.excuses("c") == []
+        assert [record["event"] for record in log.attempts("b")] == [
+            "started",
+            "completed",
+            "abandoned",
+        ]
+    with AttemptLog(path) as log:
+        assert log.excuses("a") == ["too hard", "no time"]
+        log.record(Task("a").defer("later"), T0)
+        assert log.attempts("a")[-1] == {
+            "task": "a",
+            "event": "deferred",
+            "time": T0.isoformat(),
+            "reason": "later",
+        }
+    assert len(path.read_text().splitlines()) == 6
+
+
+def test_attempt_log_reads_only_the_index(tmp_path):
+    path = tmp_path / "attempts.jsonl"
+    with AttemptLog(path) as log:
+        for i in range(1000):
+            log.record(Task(str(i % 100)).defer(f"excuse {i}"), T0)
+    with path.open("r+") as f:
+        # Nothing reads the log when opening it, only records it asks for.
+        f.seek(0)
+        f.write("#" * 10)
+    with AttemptLog(path) as log:
+        assert log.excuses("99") == [f"excuse {i}" for i in range(99, 1000, 100)]
+
+
+def test_attempt_log_rebuilds_missing_index(tmp_path):
+    path = tmp_path / "attempts.jsonl"
+    with AttemptLog(path) as log:
+        log.record(Task("a").defer("too hard"), T0)
+        log.record(Task("a").defer("no time"), T0)
+        index = log.indexPath.read_text()
+    log.indexPath.unlink()
+    with AttemptLog(path) as log:
+        assert log.excuses("a") == ["too hard", "no time"]
+    assert log.indexPath.read_text() == index
+
+
+def test_attempt_log_recovers_from_torn_writes(tmp_path):
+    path = tmp_path / "attempts.jsonl"
+    with AttemptLog(path) as log:
+        log.record(Task("a").defer("too hard"), T0)
+        log.record(Task("a").defer("no time"), T0)
+    index = log.indexPath.read_text().splitlines(keepends=True)
+    # The second record made it to the log, but only half of it to the index.
+    log.indexPath.write_text(index[0] + index[1][:5])
+    with path.open("a") as f:
+        f.write('{"task": "a", "ev')
+    with AttemptLog(path) as log:
+        assert log.excuses("a") == ["too hard", "no time"]
+        log.record(Task("a").defer("tired"), T0)
+    with AttemptLog(path) as log:
+        assert log.excuses("a") == ["too hard", "no time", "tired"]
+    assert log.indexPath.read_text().splitlines(keepends=True)[:2] == index
+
+
+def test_show_excuses():
+    assert showExcuses([]) == ""
+    assert showExcuses(["too hard"]) == "Previous excuses:\n  - too hard"
+    excuses = [f"excuse {i}" for i in range(EXCUSE_LIMIT)]
+    assert showExcuses(excuses).endswith("Maybe drop this task?")
+
+
+class FakeUI:
+    """Answers the questions ``attempt`` asks with canned responses."""
+
+    def __init__(self, wantToAttempt, result=None):
+        self.wantToAttempt = wantToAttempt
+        self.result = result
+        self.asked = []
+
+    def offerTask(self, task):
+        self.asked.append("offer")
+        return self.wantToAttempt
+
+    def requestReasonForDeferral(self, task):
+        self.asked.append("reason")
+        return "too hard"
+
+    def waitUntilDone(self, task):
+        self.asked.append("wait")
+        return self.result
+
+
+class FakeClock:
+    def __init__(self, *times):
+        self.times = list(times)
+
+    def now(self):
+        return self.times.pop(0)
+
+
+def test_attempt_deferred(tmp_path):
+    ui = FakeUI(False)
+    with AttemptLog(tmp_path / "attempts.jsonl") as log:
+        assert attempt("a", log=log, ui=ui) == DeferredTask("a", "too hard")
+        assert log.excuses("a") == ["too hard"]
+    assert ui.asked == ["offer", "reason"]
+
+
+def test_attempt_done(tmp_path):
+    ui = FakeUI(True, "done")
+    clock = FakeClock(T0, T0 + timedelta(minutes=5))
+    with AttemptLog(tmp_path / "attempts.jsonl") as log:
+        outcome = attempt("a", log=log, ui=ui, clock=clock)
+        assert outcome == CompletedTask("a", T0, T0 + timedelta(minutes=5))
+        assert [record["event"] for record in log.attempts("a")] == ["started", "completed"]
+    assert ui.asked == ["offer", "wait"]
+
+
+def test_attempt_abandoned(tmp_path):
+    ui = FakeUI(True, "abandoned")
+    with AttemptLog(tmp_path / "attempts.jsonl") as log:
+        assert attempt("a", log=log, ui=ui, clock=FakeClock(T0)) == Task("a")
+        assert [record["event"] for record in log.attempts("a")] == ["started", "abandoned"]
+
+
+def test_attempt_without_log():
+    outcome = attempt("a", ui=FakeUI(True, "done"), clock=FakeClock(T0, T0))
+    assert outcome == CompletedTask("a", T0, T0)
+
+
+def test_attempt_unexpected_result():
+    with pytest.raises(ValueError):
+        attempt("a", ui=FakeUI(True, "maybe"), clock=FakeClock(T0))
+
+
+def test_parse_done_or_abandoned():
+    assert parseDoneOrAbandoned("d") == "done"
+    assert parseDoneOrAbandoned(" Abandoned ") == "abandoned"
+    assert parseDoneOrAbandoned("") is None
+    assert parseDoneOrAbandoned("maybe") is None
+
+
+def test_ui_waits_until_done(monkeypatch):
+    responses = iter(["", "later", "done"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(responses))
+    assert UI().waitUntilDone("a") == "done"
@@ -0,0 +1,55 @@
+"""Tests for Apple Event profiling."""
+
+from omnimetrics import _viewit
+from omnimetrics._database import load_tasks, load_tasks_bulk
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._profile import Profile, instrument
+
+
+def test_instrumented_appscript_is_transparent():
+    database = synthetic_database(100)
+    expected = list(load_tasks(database.appscript().default_document))
+    profile = Profile()
+    omnifocus = database.appscript()
+    tasks = list(load_tasks(instrument(omnifocus, profile).default_document))
+    assert tasks == expected
+    assert profile.event_count == omnifocus.event_count
+
+
+def test_events_named_by_property():
+    profile = Profile()
+    omnifocus = synthetic_database(100).appscript()
+    list(load_tasks_bulk(instrument(omnifocus, profile).default_document))
+    assert profile.events["flattened_tasks.name"].count == 1
+    assert profile.events["parent_task.id"].count == 1
+    profile = Profile()
+    list(load_tasks(instrument(omnifocus, profile).default_document))
+    assert profile.events["flattened_tasks[].properties"].count == 100
+
+
+def test_instrumented_scripting_bridge():
+    profile = Profile()
+    app = synthetic_database(100).scripting_bridge()
+    content = instrument(app, profile).documents()[0].documentWindows()[0].content()
+    items = [leaf.value() for leaf in content.leaves()]
+    assert _viewit.qualifiedName(items[0]) == items[0].name()
+    assert profile.events["leaves[].value"].count == len(items)
+
+
+def test_stages():
+    profile = Profile()
+    with profile.stage("dump"):
+        pass
+    with profile.stage("dump"):
+        pass
+    assert list(profile.stages) == ["dump"]
+    assert "dump" in profile.report()
+    assert profile.to_json()["stages"]["dump"] >= 0
+
+
+def test_counted():
+    profile = Profile()
+    assert list(profile.counted("tasks", iter("abc"), "extract")) == ["a", "b", "c"]
+    assert profile.counts == {"tasks": 3}
+    assert profile.stages["extract"] >= 0
+    assert profile.to_json()["counts"] == {"tasks": 3}
@@ -0,0 +1,97 @@
+"""Tests for reading many dumps at once."""
+
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics._formats import dump_taken_at
+from omnimetrics._reader import TASK_COLUMNS, read_dump, read_dumps
+from omnimetrics._script import omnimetrics
+from omnimetrics._source import load_dump
+from omnimetrics._store import Store
+
+
+@pytest.fixture
+def dumps(tmp_path, tasks, write_dump):
+    paths = []
+    # Written newest first, to check that they're read oldest first.
+    for day in [9, 8, 7]:
+        path = tmp_path / f"omnifocus-202009{day:02}-090000.json"
+        write_dump(path, tasks[: day * 20])
+        paths.append(path)
+    return paths
+
+
+def test_read_dump(dumps):
+    columns = read_dump(dumps[0])
+    assert columns.taken_at == datetime(2020, 9, 9, 9)
+    assert columns.names == TASK_COLUMNS
+    assert len(columns) == 180
+    rows = [json.loads(line) for line in dumps[0].open()]
+    assert list(columns.column("id")) == [row["id"] for row in rows]
+    assert list(columns.column("containing_project.name")) == [
+        row["containing_project"] and row["containing_project"]["name"] for row in rows
+    ]
+    assert next(columns.rows()) == tuple(columns.column(name)[0] for name in TASK_COLUMNS)
+
+
+def test_read_dump_shares_strings(dumps):
+    names = read_dump(dumps[0], names=["containing_project.name"]).column(
+        "containing_project.name"
+    )
+    first = {}
+    for name in names:
+        assert first.setdefault(name, name) is name
+
+
+def test_read_dump_skips_tombstones(tmp_path):
+    path = tmp_path / "changes.json"
+    path.write_text('{"id": "a", "name": "A"}\n{"id": "b", "deleted": true}\n')
+    assert read_dump(path, names=["id", "name"]).columns == (("a",), ("A",))
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_read_dumps_oldest_first(dumps, workers):
+    read = list(read_dumps(dumps, workers=workers, names=["id"], ahead=1))
+    assert [columns.path for columns in read] == dumps[::-1]
+    assert [len(columns) for columns in read] == [140, 160, 180]
+
+
+def test_read_dumps_stops_early(dumps):
+    read = read_dumps(dumps, workers=2, ahead=0)
+    assert next(read).path == dumps[-1]
+    read.close()
+
+
+def test_ingest_columns(dumps):
+    with Store(dumps[0].with_name("store.sqlite3")) as store:
+        assert store.ingest_columns(read_dump(dumps[0])) == 180
+        assert store.ingest_columns(read_dump(dumps[0])) is None
+        with pytest.raises(ValueError):
+            store.ingest_columns(read_dump(dumps[1], names=["id"]))
+
+
+def test_ingest_matches_ingest_tasks(dumps, tmp_path):
+    with Store(tmp_path / "expected.sqlite3") as store:
+        for path in dumps:
+            store.ingest_tasks(load_dump(path), dump_taken_at(path), str(path.resolve()))
+    result = CliRunner().invoke(
+        omnimetrics,
+        ["ingest", "--workers", "2", "--store", str(tmp_path / "store.sqlite3")]
+        + [str(path) for path in dumps + dumps[:1]],
+    )
+    assert result.exit_code == 0, result.output
+    assert "already ingested" in result.output
+
+    def contents(name):
+        with sqlite3.connect(str(tmp_path / name)) as connection:
+            rows = connection.execute(
+                "SELECT taken_at, * FROM tasks JOIN snapshots USING (snapshot)"
+            )
+            # Without the numbers of the snapshots, which depend on the order they were ingested.
+            return sorted(row[:1] + row[2:] for row in rows)
+
+    assert contents("store.sqlite3") == contents("expected.sqlite3")
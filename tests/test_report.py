@@ -0,0 +1,123 @@
+"""Tests for reporting on workload and throughput."""
+
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics._backfill import find_dumps
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import fake_omnifocus, fake_task, synthetic_database
+from omnimetrics._report import daily_throughput, load_history, weekly_throughput
+from omnimetrics._script import omnimetrics
+
+MONDAY = datetime(2020, 9, 7, 9)
+
+
+def dump_path(directory, taken_at):
+    return directory / taken_at.strftime("omnifocus-%Y%m%d-%H%M%S.json")
+
+
+@pytest.fixture
+def write_fake_dump(write_dump):
+    def write(directory, taken_at, fake_tasks):
+        tasks = load_tasks(fake_omnifocus(fake_tasks).default_document)
+        write_dump(dump_path(directory, taken_at), tasks)
+
+    return write
+
+
+def day(n):
+    return MONDAY + timedelta(days=n)
+
+
+@pytest.fixture
+def dumps(tmp_path, write_fake_dump):
+    a = fake_task("a", "A", MONDAY - timedelta(days=6))
+    b = fake_task("b", "B", day(0), estimated_minutes=30)
+    write_fake_dump(tmp_path, day(0), [a, b])
+    a = fake_task(
+        "a", "A", a.properties["creation_date"], completion_date=day(1), effectively_completed=True
+    )
+    c = fake_task("c", "C", day(1), estimated_minutes=60)
+    d = fake_task("d", "D", day(1))
+    write_fake_dump(tmp_path, day(1), [a, b, c, d])
+    # An earlier dump of the same day, which is ignored.
+    write_fake_dump(tmp_path, day(3) - timedelta(hours=1), [])
+    # ``a`` has been archived, and no longer shows up.
+    d = fake_task("d", "D", day(1), dropped_date=day(3), effectively_dropped=True)
+    e = fake_task("e", "E", day(3))
+    write_fake_dump(tmp_path, day(3), [b, c, d, e])
+    return tmp_path
+
+
+def test_daily_throughput(dumps):
+    throughput = daily_throughput(load_history(find_dumps(dumps)))
+    assert list(throughput.rows()) == [
+        ("2020-09-07", 1, 0, 0, -1, False, 2, 30),
+        ("2020-09-08", 2, 1, 0, -1, False, 3, 90),
+        ("2020-09-09", 0, 0, 0, 0, False, None, None),
+        ("2020-09-10", 1, 0, 1, -1, False, 3, 90),
+    ]
+
+
+def test_weekly_throughput(dumps, write_fake_dump):
+    b = fake_task("b", "B", day(0), completion_date=day(7), effectively_completed=True)
+    write_fake_dump(dumps, day(7), [b])
+    throughput = weekly_throughput(daily_throughput(load_history(find_dumps(dumps))))
+    assert list(throughput.rows()) == [
+        ("2020-09-07", 4, 1, 1, -3, False, 3, 90),
+        ("2020-09-14", 0, 1, 0, 1, True, 0, 0),
+    ]
+
+
+def test_matches_counting_tasks_one_by_one(tmp_path, write_dump):
+    tasks = list(load_tasks(synthetic_database(1000).appscript().default_document))
+    start = datetime(2020, 1, 2)
+    for n in range(5):
+        write_dump(dump_path(tmp_path, start + timedelta(days=n)), tasks[: 200 * (n + 1)])
+    history = load_history(find_dumps(tmp_path))
+    throughput = daily_throughput(history)
+    days = [date(2020, 1, 2) + timedelta(days=n) for n in range(5)]
+    for column, dates in [
+        ("added", Counter(task.creation_date.date() for task in tasks)),
+        ("completed", Counter(t.completion_date.date() for t in tasks if t.completion_date)),
+        ("dropped", Counter(t.dropped_date.date() for t in tasks if t.dropped_date)),
+    ]:
+        assert getattr(throughput, column).tolist() == [dates[d] for d in days]
+    assert history.open_tasks().tolist() == [
+        sum(not (t.is_effectively_completed or t.is_effectively_dropped) for t in tasks[:count])
+        for count in range(200, 1200, 200)
+    ]
+    # Each version is only stored once.
+    assert len(history.versions.task) == len(tasks)
+
+
+def test_load_history_empty_dump(tmp_path, write_dump):
+    write_dump(dump_path(tmp_path, MONDAY), [])
+    history = load_history(find_dumps(tmp_path))
+    assert history.open_tasks().tolist() == [0]
+    assert list(daily_throughput(history).rows()) == [("2020-09-07", 0, 0, 0, 0, False, 0, 0)]
+
+
+def test_load_history_rejects_change_logs(tmp_path):
+    path = tmp_path / "omnifocus-20200907-090000.json"
+    path.write_text('{"id": "a", "name": "A", "deleted": true}\n')
+    with pytest.raises(ValueError):
+        load_history(find_dumps(tmp_path))
+
+
+def test_report_command(dumps):
+    result = CliRunner().invoke(omnimetrics, ["report", "--weekly", "--max-open", "2", str(dumps)])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0] == "period\tadded\tcompleted\tdropped\tnet\twinning\topen\topen_minutes"
+    assert lines[1] == "2020-09-07\t4\t1\t1\t-3\tFalse\t3\t90"
+    assert "3 tasks are open, more than 2" in result.output
+
+
+def test_report_command_without_dumps(tmp_path):
+    result = CliRunner().invoke(omnimetrics, ["report", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "No dumps" in result.output
@@ -0,0 +1,155 @@
+"""Tests for the sources viewit and procrastinatron get their tasks from."""
+
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+
+from omnimetrics import _source, _viewit
+from omnimetrics.__main__ import procrastinatron
+from omnimetrics._fakeapp import fake_omnifocus, fake_task, synthetic_database
+from omnimetrics._hierarchy import Hierarchy, is_available_at
+from omnimetrics._procrastinatron import pollAvailability, showTask
+from omnimetrics._source import (
+    AppscriptSource,
+    ReplaySource,
+    ScriptingBridgeSource,
+    latest_dump,
+    load_dump,
+    open_source,
+)
+
+# The parameters that ``source_options`` adds.
+SOURCE_PARAMS = {"daemon", "source", "dump"}
+
+MONDAY = datetime(2020, 9, 7, 9)
+LATER = datetime(2100, 1, 1)
+
+
+@pytest.mark.parametrize("suffix", [".avro", ".json", ".parquet"])
+def test_load_dump_round_trip(tmp_path, tasks, suffix, write_dump):
+    path = tmp_path / f"omnifocus-20200907-090000{suffix}"
+    write_dump(path, tasks)
+    assert load_dump(path) == tasks
+
+
+def test_load_dump_empty(tmp_path):
+    path = tmp_path / "empty.json"
+    path.touch()
+    assert load_dump(path) == []
+
+
+def test_load_dump_rejects_change_logs(tmp_path):
+    path = tmp_path / "changes.json"
+    path.write_text('{"id": "abc", "deleted": true}\n')
+    with pytest.raises(ValueError, match="change log"):
+        load_dump(path)
+
+
+def test_load_dump_rejects_unknown_formats(tmp_path):
+    path = tmp_path / "tasks.csv"
+    path.touch()
+    with pytest.raises(ValueError):
+        load_dump(path)
+
+
+def test_latest_dump(tmp_path):
+    for name in [
+        "omnifocus-20200907-090000.json",
+        "omnifocus-20200908-090000.parquet",
+        "omnifocus-20200909-090000.avro",
+        "omnifocus-20200909-090000.json.gz",
+        "omnifocus-latest.json",
+    ]:
+        (tmp_path / name).touch()
+    assert latest_dump(tmp_path).name == "omnifocus-20200909-090000.avro"
+    with pytest.raises(FileNotFoundError):
+        latest_dump(tmp_path / "nothing")
+
+
+def test_replay_source(tmp_path, tasks, write_dump):
+    path = tmp_path / "omnifocus-20200907-090000.json"
+    write_dump(path, tasks)
+    source = ReplaySource(path)
+    availabilities, hierarchy = source.availability(LATER)
+    assert [a.taskId for a in availabilities] == [task.id for task in tasks]
+    assert [a.available for a in availabilities] == [
+        is_available_at(task, LATER) for task in tasks
+    ]
+    expected = Hierarchy(tasks)
+    assert showTask(tasks[-1].id, hierarchy) == expected.qualified_name(tasks[-1].id)
+    assert source.view() == _viewit.viewItems(
+        [task.id for task in tasks if is_available_at(task, datetime.now())], expected
+    )
+
+
+def test_open_replay_source_from_directory(tmp_path, tasks, write_dump):
+    write_dump(tmp_path / "omnifocus-20200907-090000.json", tasks[:10])
+    write_dump(tmp_path / "omnifocus-20200908-090000.parquet", tasks)
+    source = open_source("replay", tmp_path)
+    assert len(source.availability(LATER)[0]) == len(tasks)
+    with pytest.raises(ValueError):
+        open_source("replay")
+
+
+def test_appscript_source():
+    database = synthetic_database(200)
+    source = AppscriptSource(database.appscript())
+    assert source.view() == _viewit.tasksInView(database.appscript())
+    availabilities, _ = source.availability(LATER)
+    assert availabilities == pollAvailability(database.appscript().default_document, LATER)
+
+
+def test_appscript_source_names_new_tasks():
+    tasks = [fake_task(str(i), f"Task {i}", MONDAY) for i in range(10)]
+    omnifocus = fake_omnifocus(tasks)
+    source = AppscriptSource(omnifocus)
+    source.availability(LATER)
+    omnifocus.events.clear()
+    source.availability(LATER)
+    polled = omnifocus.event_count
+    # Someone adds a task while we're running.
+    tasks.append(fake_task("new", "Added since", MONDAY))
+    omnifocus.events.clear()
+    _, hierarchy = source.availability(LATER)
+    assert showTask("new", hierarchy) == "Added since"
+    assert omnifocus.event_count > polled
+    # Only once.
+    omnifocus.events.clear()
+    source.availability(LATER)
+    assert omnifocus.event_count == polled
+
+
+def test_scripting_bridge_source():
+    database = synthetic_database(200)
+    source = ScriptingBridgeSource(database.scripting_bridge())
+    assert source.view() == _viewit.tasksInView(database.appscript())
+    availabilities, names = source.availability(LATER)
+    items = source.view()
+    assert [a.available for a in availabilities] == [not item.blocked for item in items]
+    assert [showTask(a.taskId, names) for a in availabilities] == [item.name for item in items]
+
+
+def test_viewit_replays_dump(tmp_path, tasks, monkeypatch, write_dump):
+    monkeypatch.setattr(_source, "omnifocus", lambda: pytest.fail("Asked OmniFocus"))
+    path = tmp_path / "omnifocus-20200907-090000.avro"
+    write_dump(path, tasks)
+    result = CliRunner().invoke(_viewit.main, ["--no-daemon", "--dump", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Total estimated:" in result.output
+
+
+def test_tools_share_source_options():
+    def source_params(command):
+        return [param.to_info_dict() for param in command.params if param.name in SOURCE_PARAMS]
+
+    assert source_params(_viewit.main) == source_params(procrastinatron)
+    assert len(source_params(_viewit.main)) == len(SOURCE_PARAMS)
+
+
+def test_viewit_rejects_change_logs(tmp_path):
+    path = tmp_path / "changes.json"
+    path.write_text('{"id": "abc", "deleted": true}\n')
+    result = CliRunner().invoke(_viewit.main, ["--no-daemon", "--dump", str(path)])
+    assert result.exit_code == 2
+    assert "change log" in result.output
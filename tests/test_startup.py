@@ -0,0 +1,19 @@
+"""Tests that the command-line tools don't import more than they need."""
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["google.cloud.bigquery", "google.cloud.storage", "pyarrow", "fastavro"]
+
+
+@pytest.mark.parametrize(
+    "module", ["omnimetrics._script", "omnimetrics._viewit", "omnimetrics.__main__"]
+)
+def test_no_heavy_imports(module):
+    script = f"import sys, {module}; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    output = subprocess.run(
+        [sys.executable, "-c", script], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == "[]"
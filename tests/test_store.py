@@ -0,0 +1,96 @@
+"""Tests for the local SQLite store."""
+
+from datetime import datetime
+
+from click.testing import CliRunner
+
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._hierarchy import Hierarchy
+from omnimetrics._reader import read_dump
+from omnimetrics._script import omnimetrics
+from omnimetrics._store import Store
+
+
+def test_snapshots_report(tmp_path, write_dump):
+    tasks = list(load_tasks(synthetic_database(300).appscript().default_document))
+    dump = tmp_path / "omnifocus-20200901-123000.json"
+    write_dump(dump, tasks)
+    with Store(tmp_path / "store.sqlite3") as store:
+        assert store.ingest_columns(read_dump(dump)) == 300
+        names, rows = store.report("snapshots")
+        assert names == ["snapshot", "taken_at", "source", "tasks"]
+        assert list(rows) == [(1, "2020-09-01T12:30:00", str(dump.resolve()), 300)]
+
+
+def test_ingest_tasks_matches_dump(tmp_path, write_dump):
+    tasks = list(load_tasks(synthetic_database(100).appscript().default_document))
+    dump = tmp_path / "dump.json"
+    write_dump(dump, tasks)
+    with Store(tmp_path / "store.sqlite3") as store:
+        store.ingest_columns(read_dump(dump))
+        store.ingest_tasks(tasks, datetime(2020, 9, 2), "live")
+        _, rows = store.query(
+            "SELECT COUNT(*) FROM (SELECT {0} FROM tasks WHERE snapshot = 1 "
+            "EXCEPT SELECT {0} FROM tasks WHERE snapshot = 2)".format(
+                "id, name, creation_date, due_date, parent_task_id, containing_project_name, "
+                "estimated_minutes, is_completed"
+            )
+        )
+        assert list(rows) == [(0,)]
+
+
+def test_adds_new_columns_to_older_stores(tmp_path):
+    path = tmp_path / "store.sqlite3"
+    with Store(path) as store:
+        store.connection.execute("ALTER TABLE tasks DROP COLUMN note")
+    tasks = list(load_tasks(synthetic_database(10).appscript().default_document))
+    with Store(path) as store:
+        store.ingest_tasks(tasks, datetime(2020, 9, 1), "live")
+        _, rows = store.query("SELECT note FROM current_tasks ORDER BY rowid LIMIT 1")
+        assert list(rows) == [(tasks[0].note,)]
+
+
+def test_current_tasks_and_reports(tmp_path):
+    old = list(load_tasks(synthetic_database(50).appscript().default_document))
+    new = list(load_tasks(synthetic_database(200).appscript().default_document))
+    with Store(tmp_path / "store.sqlite3") as store:
+        store.ingest_tasks(new, datetime(2020, 9, 2), "new")
+        store.ingest_tasks(old, datetime(2020, 9, 1), "old")
+        _, rows = store.query("SELECT COUNT(*) FROM current_tasks")
+        assert list(rows) == [(200,)]
+        _, rows = store.report("projects")
+        projects = Hierarchy(new).projects
+        assert {
+            project: (tasks, available, completed, minutes)
+            for project, tasks, available, completed, minutes in rows
+        } == {
+            name: (r.num_tasks, r.num_available, r.num_completed, r.estimated_minutes)
+            for name, r in projects.items()
+        }
+        _, rows = store.report("completed-by-day")
+        assert sum(count for _, count in rows) == sum(t.is_effectively_completed for t in new)
+
+
+def test_query_command(tmp_path, write_dump):
+    tasks = list(load_tasks(synthetic_database(100).appscript().default_document))
+    dump = tmp_path / "dump.json"
+    write_dump(dump, tasks)
+    store = str(tmp_path / "store.sqlite3")
+    runner = CliRunner()
+    result = runner.invoke(omnimetrics, ["ingest", "--store", store, str(dump)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(
+        omnimetrics,
+        ["query", "--store", store, "SELECT id, name FROM tasks ORDER BY rowid LIMIT 2"],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        "id\tname",
+        f"{tasks[0].id}\t{tasks[0].name}",
+        f"{tasks[1].id}\t{tasks[1].name}",
+    ]
+    result = runner.invoke(omnimetrics, ["query", "--store", store, "SELECT nonsense"])
+    assert result.exit_code == 1
+    result = runner.invoke(omnimetrics, ["query", "--store", store])
+    assert result.exit_code == 2
@@ -0,0 +1,59 @@
+"""Tests for the columnar task table."""
+
+import json
+from datetime import datetime
+
+from omnimetrics._table import TaskTable
+
+
+def test_round_trip(sample_tasks):
+    table = TaskTable.from_tasks(sample_tasks)
+    assert len(table) == 3
+    assert list(table.tasks()) == sample_tasks
+
+
+def test_from_dump(tmp_path, sample_tasks, write_dump):
+    path = tmp_path / "dump.json"
+    write_dump(path, sample_tasks)
+    assert list(TaskTable.from_dump(path).tasks()) == sample_tasks
+
+
+def test_filters(sample_tasks):
+    table = TaskTable.from_tasks(sample_tasks)
+    flagged_and_not_completed = table.mask("is_flagged") & ~table.mask("is_completed")
+    assert [task.id for task in table.tasks(flagged_and_not_completed)] == ["a"]
+    assert list(table.is_null("estimated_minutes").indices()) == [0, 2]
+    assert list(table.is_null("containing_project.name").indices()) == [2]
+    assert list(table.before("due_date", datetime(2020, 9, 4)).indices()) == [1]
+    assert table.after("completion_date", datetime(2020, 9, 1)).count() == 1
+
+
+def test_names_are_interned(sample_tasks):
+    table = TaskTable.from_tasks(sample_tasks)
+    names = table.column("containing_project.name")
+    assert names[0] is names[1]
+
+
+def test_empty():
+    table = TaskTable.from_tasks([])
+    assert len(table) == 0
+    assert list(table.tasks()) == []
+    assert table.mask("is_flagged").count() == 0
+
+
+def test_missing_booleans_are_null(tmp_path, sample_tasks, write_dump):
+    # A dump made before tasks had ``is_effectively_flagged`` doesn't say
+    # whether they were, which isn't the same as saying they weren't.
+    path = tmp_path / "dump.json"
+    write_dump(path, sample_tasks)
+    lines = path.read_text().splitlines()
+    old = json.loads(lines[0])
+    del old["is_effectively_flagged"]
+    path.write_text("\n".join([json.dumps(old), *lines[1:]]) + "\n")
+    table = TaskTable.from_dump(path)
+    assert list(table.is_null("is_effectively_flagged").indices()) == [0]
+    assert table.column("is_effectively_flagged")[0] is None
+    assert table.mask("is_effectively_flagged").count() == 0
+    assert table.task(0).is_effectively_flagged is None
+    assert list(table.tasks())[1:] == sample_tasks[1:]
+    assert table.is_null("is_flagged").count() == 0
@@ -0,0 +1,27 @@
+"""Tests for streaming uploads."""
+
+import gzip
+import io
+
+from omnimetrics._upload import upload_compressed
+
+
+def write_lines(output):
+    for i in range(1000):
+        output.write(f'{{"id": "{i}", "name": "Task {i}"}}\n')
+    return "result"
+
+
+def test_upload_is_compressed(storage_client):
+    blob = storage_client.bucket("bucket").blob("dump.json.gz")
+    result, stats = upload_compressed(blob, write_lines, chunk_size=256 * 1024)
+    assert result == "result"
+    assert blob.chunk_size == 256 * 1024
+    expected = io.StringIO()
+    write_lines(expected)
+    assert gzip.decompress(blob.data).decode("utf-8") == expected.getvalue()
+    assert stats.bytes_in == len(expected.getvalue())
+    assert stats.bytes_out == len(blob.data)
+    assert stats.compression_ratio > 1
+    assert stats.bytes_per_second > 0
+    assert 0 < stats.upload_seconds <= stats.seconds
@@ -0,0 +1,63 @@
+"""Tests for viewit."""
+
+from click.testing import CliRunner
+
+from omnimetrics import _source, _viewit
+from omnimetrics._database import load_tasks
+from omnimetrics._fakeapp import synthetic_database
+from omnimetrics._hierarchy import Hierarchy
+
+
+def test_tasks_in_view_match_per_item():
+    database = synthetic_database(300, max_depth=3)
+    bridge = database.scripting_bridge()
+    content = bridge.documents()[0].documentWindows()[0].content()
+    expected = [
+        _viewit.ViewItem(
+            name=_viewit.qualifiedName(item),
+            estimatedMinutes=item.estimatedMinutes().get(),
+            blocked=item.blocked(),
+        )
+        for item in (leaf.value() for leaf in content.leaves())
+    ]
+    assert _viewit.tasksInView(database.appscript()) == expected
+
+
+def test_tasks_in_view_events_do_not_grow():
+    small = synthetic_database(100).appscript()
+    large = synthetic_database(1000).appscript()
+    _viewit.tasksInView(small)
+    _viewit.tasksInView(large)
+    assert small.event_count == large.event_count == 8
+
+
+def test_tasks_in_view_with_hierarchy():
+    database = synthetic_database(100)
+    hierarchy = Hierarchy(load_tasks(database.appscript().default_document))
+    omnifocus = database.appscript()
+    items = _viewit.tasksInView(omnifocus, hierarchy)
+    assert items == _viewit.tasksInView(database.appscript())
+    # Only the ids and classes of what's in view.
+    assert omnifocus.event_count == 2
+
+
+def test_report_estimates(capsys):
+    _viewit.reportEstimates(
+        [
+            _viewit.ViewItem(name="Work / Write report", estimatedMinutes=90, blocked=False),
+            _viewit.ViewItem(name="Work / Read email", estimatedMinutes=None, blocked=False),
+        ]
+    )
+    out = capsys.readouterr().out
+    assert "Work / Write report 1h30m" in out
+    assert "Total estimated: 1h30m" in out
+    assert "Items without estimates: 1" in out
+
+
+def test_stats(monkeypatch):
+    omnifocus = synthetic_database(100).appscript()
+    monkeypatch.setattr(_source, "omnifocus", lambda: omnifocus)
+    result = CliRunner().invoke(_viewit.main, ["--stats", "--no-daemon"])
+    assert result.exit_code == 0, result.output
+    assert "Total estimated:" in result.output
+    assert "Apple Events: 8 in" in result.output